@@ -1,5 +1,12 @@
+from datetime import timedelta
+
 from django.contrib import admin
-from .models import GeneratedPost, LinkedInAccount, Subscription, UsageRecord, CartoonAvatar, CartoonUsageRecord
+from django.template.response import TemplateResponse
+from django.urls import path
+from django.utils import timezone
+
+from .ledger import flush, summarize
+from .models import GeneratedPost, LinkedInAccount, Subscription, UsageRecord, CartoonAvatar, CartoonUsageRecord, ModelCallRecord
 
 
 @admin.register(GeneratedPost)
@@ -42,3 +49,40 @@ class CartoonUsageRecordAdmin(admin.ModelAdmin):
     list_display = ['user', 'year', 'month', 'cartoon_count']
     list_filter = ['year', 'month']
     search_fields = ['user__username']
+
+
+@admin.register(ModelCallRecord)
+class ModelCallRecordAdmin(admin.ModelAdmin):
+    list_display = ['created_at', 'endpoint', 'model', 'user', 'input_tokens', 'output_tokens', 'latency_ms', 'success']
+    list_filter = ['provider', 'model', 'success', 'endpoint']
+    search_fields = ['endpoint', 'user__username']
+    date_hierarchy = 'created_at'
+
+    # Append-only ledger
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def get_urls(self):
+        urls = [
+            path('summary/', self.admin_site.admin_view(self.summary_view), name='api_modelcallrecord_summary'),
+        ]
+        return urls + super().get_urls()
+
+    def summary_view(self, request):
+        """p50/p95 latency, tokens and cost per feature over the last ?days= days."""
+        try:
+            days = max(int(request.GET.get('days', 7)), 1)
+        except ValueError:
+            days = 7
+        flush()
+        context = {
+            **self.admin_site.each_context(request),
+            'opts': self.model._meta,
+            'title': f"Coût et latence IA par fonctionnalité ({days} derniers jours)",
+            'days': days,
+            'rows': summarize(timezone.now() - timedelta(days=days), 'endpoint'),
+        }
+        return TemplateResponse(request, 'admin/api/modelcallrecord/summary.html', context)
@@ -9,6 +9,9 @@ class ApiConfig(AppConfig):
         import os
         import sys
 
+        from api import provider_replay
+        provider_replay.install()
+
         # Only start scheduler for local dev (runserver).
         # In production (gunicorn), scheduler is started via post_fork hook.
         if 'runserver' not in sys.argv:
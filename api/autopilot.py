@@ -10,7 +10,6 @@ import logging
 from datetime import timedelta
 
 import pytz
-import anthropic
 from django.conf import settings
 from django.core.mail import send_mail
 from django.utils import timezone
@@ -24,12 +23,14 @@ from .models import (
     LinkedInAccount, CONTENT_MODE_CHOICES,
 )
 from .billing import check_generation_limit, increment_usage
-from .llm import get_user_plan, resolve_model, generate_text
+from .llm import get_user_plan, resolve_model, generate_text, agenerate_text, submit_async, claude_message, claude_model
+from .ledger import scope as ledger_scope
+from .tokens import trim_to_tokens
 from .websearch import enrich_context
 from .views import extract_hashtags
 from .prompts import build_system_prompt
-from .carousel import validate_slides, CAROUSEL_MODE_INSTRUCTIONS, TEMPLATE_INSTRUCTIONS
-from .infographic import validate_infographic
+from .carousel import validate_slides, build_carousel_system_prompt, TEMPLATE_INSTRUCTIONS
+from .infographic import validate_infographic, build_infographic_system_prompt
 from .images import generate_image_for_post
 from .pdf_export import render_to_images
 
@@ -94,7 +95,7 @@ def pick_content_type(config: AutopilotConfig):
 
 
 def _get_user_context(config: AutopilotConfig):
-    """Build full user context string from profile + custom instructions."""
+    """Build user context string from profile + custom instructions."""
     parts = []
 
     # User profile context
@@ -112,18 +113,22 @@ def _get_user_context(config: AutopilotConfig):
             f"INSTRUCTIONS SPÉCIFIQUES DE L'AUTEUR POUR LE CONTENU :\n{config.content_instructions.strip()}"
         )
 
-    # Recent posts for anti-repetition (last 5 posts, 200 chars each)
-    recent = GeneratedPost.objects.filter(user=config.user).order_by('-created_at')[:5]
-    if recent:
-        snippets = [p.generated_content[:200] for p in recent]
-        parts.append(
-            "POSTS RÉCEMMENT PUBLIÉS (ne pas répéter les mêmes idées, angles ou structures) :\n"
-            + "\n".join(f"- {s}..." for s in snippets)
-        )
-
     return "\n\n".join(parts)
 
 
+def _get_recent_posts_context(config: AutopilotConfig):
+    """Last 5 posts, cut at sentence boundaries, for anti-repetition. Lowest-priority context section."""
+    recent = GeneratedPost.objects.filter(user=config.user).order_by('-created_at')[:5]
+    if not recent:
+        return ""
+    per_post = settings.PROMPT_BUDGET_RECENT // len(recent)
+    snippets = [trim_to_tokens(p.generated_content, per_post) for p in recent]
+    return (
+        "POSTS RÉCEMMENT PUBLIÉS (ne pas répéter les mêmes idées, angles ou structures) :\n"
+        + "\n".join(f"- {s}..." for s in snippets if s)
+    )
+
+
 # ---------------------------------------------------------------------------
 # Post generation (text only)
 # ---------------------------------------------------------------------------
@@ -134,14 +139,10 @@ def _generate_post_content(config, topic, angle, web_context, kb_context=""):
     objective = config.content_mode or 'audience_growth'
     user_ctx = _get_user_context(config)
 
-    # Combine web + kb context
-    full_web_context = ""
-    if kb_context and web_context:
-        full_web_context = f"{kb_context}\n\n{web_context}"
-    elif kb_context:
-        full_web_context = kb_context
-    elif web_context:
-        full_web_context = web_context
+    # Combine kb + web + recent posts, in budget priority order
+    full_web_context = "\n\n".join(
+        part for part in (kb_context, web_context, _get_recent_posts_context(config)) if part
+    )
 
     system_prompt = build_system_prompt(
         objective=objective,
@@ -162,6 +163,7 @@ def _generate_post_content(config, topic, angle, web_context, kb_context=""):
         system_prompt=system_prompt,
         user_message=user_message,
         max_tokens=1024,
+        plan=plan,
     )
 
     return {'type': 'post', 'content': content}
@@ -178,74 +180,17 @@ def _generate_carousel_content(config, topic, angle, web_context, kb_context="")
     template = random.choice(CAROUSEL_TEMPLATES)
 
     mode = config.content_mode or 'audience_growth'
-    mode_block = CAROUSEL_MODE_INSTRUCTIONS.get(mode, CAROUSEL_MODE_INSTRUCTIONS["audience_growth"])
-    template_block = TEMPLATE_INSTRUCTIONS.get(template, "")
-
     user_ctx = _get_user_context(config)
-
-    system_prompt = f"""Tu es un expert en creation de carousels LinkedIn viraux.
-Tu generes le contenu structure d'un carousel au format JSON strict.
-
-REGLES DE DESIGN LINKEDIN (TRES IMPORTANT):
-- Les carousels viraux ont 10-20 mots MAX par slide
-- Les titres sont COURTS et PERCUTANTS (5-8 mots max)
-- Les bullets sont ultra-concis (max 12 mots chacun)
-- La slide 1 (titre) doit STOPPER LE SCROLL avec un hook puissant
-- La derniere slide (CTA) doit donner une instruction CLAIRE et SPECIFIQUE
-
-REGLES TECHNIQUES:
-- Retourne UNIQUEMENT du JSON valide, sans markdown, sans backticks, sans commentaire
-- La premiere slide est TOUJOURS de type "title" avec un hook percutant
-- La derniere slide est TOUJOURS de type "cta" (call to action)
-- Les slides intermediaires peuvent etre: "content", "quote", "dialogue", "stats", "comparison", "list", "image_text", "highlight"
-- Chaque slide "content" a soit des "bullets" (2-4 points concis), soit un "body" (paragraphe court)
-- Maximum 1 slide "quote" par carousel
-- Le contenu doit etre en francais
-- Cree un fil narratif logique entre les slides
-- VARIE les types de slides pour un carousel visuellement dynamique (ne mets pas que des "content")
-- Adapte le ton: {tone}
-
-QUAND UTILISER CHAQUE TYPE DE SLIDE:
-- "content" : point cle avec bullets ou paragraphe (polyvalent)
-- "stats" : mettre en avant UN chiffre cle percutant (ex: "78%", "+200K", "3x")
-- "comparison" : opposer 2 idees, avant/apres, mythe/realite en 2 colonnes
-- "list" : liste d'elements avec emojis (conseils, outils, etapes)
-- "highlight" : une phrase impact forte, isolee, qui marque les esprits
-- "quote" : citation d'un auteur ou expert
-- "dialogue" : echange Q&A en bulles de chat
-- "image_text" : texte + espace image (utiliser pour slides visuelles)
-
-{template_block}
-{mode_block}
-
-SCHEMA JSON A RESPECTER (exemples de chaque type):
-{{
-  "slides": [
-    {{ "type": "title", "title": "Titre accrocheur", "subtitle": "Sous-titre explicatif" }},
-    {{ "type": "content", "title": "Point cle", "bullets": ["Point 1", "Point 2", "Point 3"] }},
-    {{ "type": "stats", "stat_number": "78%", "stat_label": "des managers", "stat_description": "ne savent pas deleguer" }},
-    {{ "type": "comparison", "left_title": "Avant", "left_items": ["Pas de process"], "right_title": "Apres", "right_items": ["Process clairs"] }},
-    {{ "type": "list", "title": "Les outils", "list_items": [{{ "emoji": "🎯", "text": "Notion pour organiser" }}] }},
-    {{ "type": "highlight", "highlight_text": "Le succes n'est pas un accident." }},
-    {{ "type": "quote", "quote": "Citation inspirante", "author": "Auteur" }},
-    {{ "type": "cta", "title": "Titre final", "cta_text": "Action a faire", "cta_subtitle": "Suivez-moi" }}
-  ]
-}}
-
-{user_ctx}"""
-
-    if kb_context:
-        system_prompt += f"\n\n{kb_context}"
-
-    if web_context:
-        system_prompt += f"\n\n{web_context}"
+    system_prompt = build_carousel_system_prompt(
+        tone, mode, template, user_ctx, kb_context, web_context, _get_recent_posts_context(config),
+    )
 
     user_message = f"Cree un carousel LinkedIn de {num_slides} slides sur : {topic}\nAngle : {angle}"
 
+    caption_future = None
     try:
-        client = anthropic.Anthropic(api_key=settings.ANTHROPIC_API_KEY)
-        response = client.messages.create(
-            model="claude-sonnet-4-20250514",
+        response = claude_message(
+            model=claude_model('long_form'),
             max_tokens=2000,
             system=system_prompt,
             messages=[{"role": "user", "content": user_message}],
@@ -264,8 +209,8 @@ SCHEMA JSON A RESPECTER (exemples de chaque type):
             logger.warning("Autopilot carousel: invalid slides structure, falling back to post")
             return _generate_post_content(config, topic, angle, web_context)
 
-        # Generate a caption to accompany the carousel
-        caption = _generate_carousel_caption(config, topic, slides)
+        # Write the caption on the LLM loop while Playwright renders the slides
+        caption_future = _start_carousel_caption(config, topic, slides)
 
         # Render slides to images via Playwright
         theme = random.choice(RENDER_THEMES)
@@ -273,8 +218,11 @@ SCHEMA JSON A RESPECTER (exemples de chaque type):
 
         if not rendered_images:
             logger.warning("Autopilot carousel: rendering failed, falling back to post + AI image")
+            caption_future.cancel()
             return _generate_post_content(config, topic, angle, web_context)
 
+        caption = caption_future.result(timeout=settings.AUTOPILOT_CAPTION_TIMEOUT)
+
         return {
             'type': 'carousel',
             'content': caption,
@@ -283,6 +231,8 @@ SCHEMA JSON A RESPECTER (exemples de chaque type):
 
     except Exception as e:
         logger.error(f"Autopilot carousel generation failed: {e}", exc_info=True)
+        if caption_future is not None:
+            caption_future.cancel()
         return _generate_post_content(config, topic, angle, web_context)
 
 
@@ -354,8 +304,8 @@ def _render_infographic_image(infographic, theme):
         return []
 
 
-def _generate_carousel_caption(config, topic, slides):
-    """Generate a short LinkedIn caption to accompany the carousel PDF."""
+def _start_carousel_caption(config, topic, slides):
+    """Start generating a short LinkedIn caption for the carousel. Returns a future."""
     tone = config.tone or 'professionnel'
     titles = [s.get('title', s.get('highlight_text', '')) for s in slides[:3]]
     preview = " | ".join(t for t in titles if t)
@@ -376,12 +326,13 @@ RÈGLES :
     plan = get_user_plan(config.user)
     model_id = resolve_model(None, plan)
 
-    return generate_text(
+    return submit_async(agenerate_text(
         model_id=model_id,
         system_prompt=system_prompt,
         user_message=user_message,
         max_tokens=512,
-    )
+        plan=plan,
+    ))
 
 
 # ---------------------------------------------------------------------------
@@ -394,52 +345,16 @@ def _generate_infographic_content(config, topic, angle, web_context, kb_context=
     num_items = random.randint(6, 9)
 
     user_ctx = _get_user_context(config)
-
-    system_prompt = f"""Tu es un expert en creation de contenu visuel LinkedIn.
-Tu generes le contenu structure d'une infographie au format JSON strict.
-
-REGLES DE CONTENU:
-- Le titre principal doit etre ACCROCHEUR et court (8-12 mots max)
-- Le sous-titre explique la valeur en 1 phrase courte
-- Chaque item a un titre COURT (3-6 mots) et une description CONCISE (15-25 mots)
-- Le contenu doit etre en francais
-- Le footer_cta est une invitation a suivre/partager
-- Adapte le ton: {tone}
-
-REGLES TECHNIQUES:
-- Retourne UNIQUEMENT du JSON valide, sans markdown, sans backticks, sans commentaire
-- Genere exactement {num_items} items
-- Chaque item a obligatoirement: number (int), title (str), description (str)
-- Champs optionnels par item: emoji (str, 1 emoji), stat_value (str, chiffre cle), category (str, "left" ou "right")
-
-SCHEMA JSON A RESPECTER:
-{{
-  "infographic": {{
-    "title": "Titre accrocheur de l'infographie",
-    "subtitle": "Sous-titre explicatif court",
-    "template": "grid-numbered",
-    "items": [
-      {{ "number": 1, "title": "Concept cle", "description": "Description courte et actionnable.", "emoji": "🎯" }},
-      {{ "number": 2, "title": "Autre concept", "description": "Explication concise.", "stat_value": "78%" }}
-    ],
-    "footer_cta": "Suivez-moi pour plus de conseils"
-  }}
-}}
-
-{user_ctx}"""
-
-    if kb_context:
-        system_prompt += f"\n\n{kb_context}"
-
-    if web_context:
-        system_prompt += f"\n\n{web_context}"
+    system_prompt = build_infographic_system_prompt(
+        tone, num_items, "", user_ctx, kb_context, web_context, _get_recent_posts_context(config),
+    )
 
     user_message = f"Cree une infographie LinkedIn de {num_items} elements sur : {topic}\nAngle : {angle}"
 
+    caption_future = None
     try:
-        client = anthropic.Anthropic(api_key=settings.ANTHROPIC_API_KEY)
-        response = client.messages.create(
-            model="claude-sonnet-4-20250514",
+        response = claude_message(
+            model=claude_model('long_form'),
             max_tokens=2000,
             system=system_prompt,
             messages=[{"role": "user", "content": user_message}],
@@ -458,7 +373,7 @@ SCHEMA JSON A RESPECTER:
             logger.warning("Autopilot infographic: invalid structure, falling back to post")
             return _generate_post_content(config, topic, angle, web_context)
 
-        caption = _generate_infographic_caption(config, topic, infographic)
+        caption_future = _start_infographic_caption(config, topic, infographic)
 
         # Render infographic to image via Playwright
         theme = random.choice(RENDER_THEMES)
@@ -466,8 +381,11 @@ SCHEMA JSON A RESPECTER:
 
         if not rendered_images:
             logger.warning("Autopilot infographic: rendering failed, falling back to post + AI image")
+            caption_future.cancel()
             return _generate_post_content(config, topic, angle, web_context)
 
+        caption = caption_future.result(timeout=settings.AUTOPILOT_CAPTION_TIMEOUT)
+
         return {
             'type': 'infographic',
             'content': caption,
@@ -476,11 +394,13 @@ SCHEMA JSON A RESPECTER:
 
     except Exception as e:
         logger.error(f"Autopilot infographic generation failed: {e}", exc_info=True)
+        if caption_future is not None:
+            caption_future.cancel()
         return _generate_post_content(config, topic, angle, web_context)
 
 
-def _generate_infographic_caption(config, topic, infographic):
-    """Generate a short LinkedIn caption to accompany the infographic."""
+def _start_infographic_caption(config, topic, infographic):
+    """Start generating a short LinkedIn caption for the infographic. Returns a future."""
     tone = config.tone or 'professionnel'
     title = infographic.get('title', topic)
 
@@ -500,12 +420,13 @@ RÈGLES :
     plan = get_user_plan(config.user)
     model_id = resolve_model(None, plan)
 
-    return generate_text(
+    return submit_async(agenerate_text(
         model_id=model_id,
         system_prompt=system_prompt,
         user_message=user_message,
         max_tokens=512,
-    )
+        plan=plan,
+    ))
 
 
 # ---------------------------------------------------------------------------
@@ -664,7 +585,8 @@ def run_autopilot():
 
     for config in configs:
         try:
-            _process_config(config, now)
+            with ledger_scope('autopilot', user=config.user):
+                _process_config(config, now)
         except Exception as e:
             logger.error(f"Autopilot error for {config.user.username}: {e}", exc_info=True)
 
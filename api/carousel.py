@@ -11,8 +11,11 @@ from django.conf import settings
 import anthropic
 
 from .views import get_user_context, get_objective, get_platform
+from .llm import claude_message, claude_model
 from .billing import check_generation_limit, increment_usage
 from .websearch import enrich_context
+from .prompts import SystemPrompt, _heading
+from .tokens import fit_context
 
 logger = logging.getLogger(__name__)
 
@@ -104,38 +107,8 @@ TEMPLATE_INSTRUCTIONS = {
 }
 
 
-@api_view(['POST'])
-@permission_classes([IsAuthenticated])
-@parser_classes([JSONParser])
-def generate_carousel(request):
-    # Vérifier la limite de générations
-    can_generate, error_response = check_generation_limit(request.user)
-    if not can_generate:
-        return error_response
-
-    topic = request.data.get('topic', '').strip()
-    tone = request.data.get('tone', 'professionnel')
-    num_slides = request.data.get('num_slides', 7)
-    template = request.data.get('template', '').strip()
-
-    if not topic:
-        return Response({'error': 'Le sujet est requis'}, status=status.HTTP_400_BAD_REQUEST)
-
-    num_slides = max(5, min(10, int(num_slides)))
-
-    user_context = get_user_context(request)
-    mode = get_objective(request)
-
-    # Enrichir avec recherche web si nécessaire
-    web_context = enrich_context(topic)
-
-    template_block = ""
-    if template and template in TEMPLATE_INSTRUCTIONS:
-        template_block = f"\n\n{TEMPLATE_INSTRUCTIONS[template]}\n"
-
-    mode_block = CAROUSEL_MODE_INSTRUCTIONS.get(mode, CAROUSEL_MODE_INSTRUCTIONS["audience_growth"])
-
-    system_prompt = f"""Tu es un expert en creation de carousels LinkedIn viraux.
+# Static rules and schema of the carousel system prompt
+_CAROUSEL_RULES = """Tu es un expert en creation de carousels LinkedIn viraux.
 Tu generes le contenu structure d'un carousel au format JSON strict.
 
 REGLES DE DESIGN LINKEDIN (TRES IMPORTANT):
@@ -155,7 +128,7 @@ REGLES TECHNIQUES:
 - Le contenu doit etre en francais
 - Cree un fil narratif logique entre les slides
 - VARIE les types de slides pour un carousel visuellement dynamique (ne mets pas que des "content")
-- Adapte le ton: {tone}
+- Adapte le ton indique plus bas
 
 QUAND UTILISER CHAQUE TYPE DE SLIDE:
 - "content" : point cle avec bullets ou paragraphe (polyvalent)
@@ -166,38 +139,82 @@ QUAND UTILISER CHAQUE TYPE DE SLIDE:
 - "quote" : citation d'un auteur ou expert
 - "dialogue" : echange Q&A en bulles de chat
 - "image_text" : texte + espace image (utiliser pour slides visuelles)
-{template_block}
-{mode_block}
 
 SCHEMA JSON A RESPECTER (exemples de chaque type):
-{{
+{
   "slides": [
-    {{ "type": "title", "title": "Titre accrocheur", "subtitle": "Sous-titre explicatif" }},
-    {{ "type": "content", "title": "Point cle", "bullets": ["Point 1", "Point 2", "Point 3"] }},
-    {{ "type": "content", "title": "Autre point", "body": "Paragraphe court et impactant." }},
-    {{ "type": "stats", "stat_number": "78%", "stat_label": "des managers", "stat_description": "ne savent pas deleguer efficacement" }},
-    {{ "type": "comparison", "left_title": "Avant", "left_items": ["Pas de process", "Travail reactif"], "right_title": "Apres", "right_items": ["Process clairs", "Travail proactif"] }},
-    {{ "type": "list", "title": "Les outils essentiels", "list_items": [{{ "emoji": "🎯", "text": "Notion pour organiser" }}, {{ "emoji": "⚡", "text": "Slack pour communiquer" }}] }},
-    {{ "type": "highlight", "highlight_text": "Le succes n'est pas un accident. C'est un choix quotidien." }},
-    {{ "type": "quote", "quote": "Citation inspirante", "author": "Auteur" }},
-    {{ "type": "dialogue", "title": "Sujet optionnel", "left_speaker": "Question", "left_text": "texte de la question", "right_speaker": "Reponse", "right_text": "texte de la reponse" }},
-    {{ "type": "cta", "title": "Titre final", "cta_text": "Action a faire", "cta_subtitle": "Suivez-moi pour plus" }}
+    { "type": "title", "title": "Titre accrocheur", "subtitle": "Sous-titre explicatif" },
+    { "type": "content", "title": "Point cle", "bullets": ["Point 1", "Point 2", "Point 3"] },
+    { "type": "content", "title": "Autre point", "body": "Paragraphe court et impactant." },
+    { "type": "stats", "stat_number": "78%", "stat_label": "des managers", "stat_description": "ne savent pas deleguer efficacement" },
+    { "type": "comparison", "left_title": "Avant", "left_items": ["Pas de process", "Travail reactif"], "right_title": "Apres", "right_items": ["Process clairs", "Travail proactif"] },
+    { "type": "list", "title": "Les outils essentiels", "list_items": [{ "emoji": "🎯", "text": "Notion pour organiser" }, { "emoji": "⚡", "text": "Slack pour communiquer" }] },
+    { "type": "highlight", "highlight_text": "Le succes n'est pas un accident. C'est un choix quotidien." },
+    { "type": "quote", "quote": "Citation inspirante", "author": "Auteur" },
+    { "type": "dialogue", "title": "Sujet optionnel", "left_speaker": "Question", "left_text": "texte de la question", "right_speaker": "Reponse", "right_text": "texte de la reponse" },
+    { "type": "cta", "title": "Titre final", "cta_text": "Action a faire", "cta_subtitle": "Suivez-moi pour plus" }
   ]
-}}
+}"""
 
-{user_context}"""
 
-    if web_context:
-        system_prompt += f"\n\n{web_context}"
+# Static part of the carousel system prompt, shared with autopilot. Every format and
+# objective is listed here and the tail names the ones to apply, so the prefix is the
+# same for all requests and long enough for Anthropic's prompt cache (1024+ tokens).
+CAROUSEL_SYSTEM_PREFIX = "\n\n".join([
+    _CAROUSEL_RULES,
+    "FORMATS DE CAROUSEL (applique uniquement le format indique plus bas, s'il y en a un):",
+    *TEMPLATE_INSTRUCTIONS.values(),
+    "OBJECTIFS (applique uniquement l'objectif indique plus bas):",
+    *(instructions.strip() for instructions in CAROUSEL_MODE_INSTRUCTIONS.values()),
+])
+
+
+def build_carousel_system_prompt(tone, mode, template="", user_context="", *extra_context):
+    """Carousel system prompt: static rules, schema, formats and objectives, then the choices and context."""
+    tail = [f"TON : {tone}"]
+    if template in TEMPLATE_INSTRUCTIONS:
+        tail.append(f"FORMAT A APPLIQUER : « {_heading(TEMPLATE_INSTRUCTIONS[template])} »")
+    objective = CAROUSEL_MODE_INSTRUCTIONS.get(mode, CAROUSEL_MODE_INSTRUCTIONS["audience_growth"])
+    tail.append(f"OBJECTIF A APPLIQUER : « {_heading(objective)} »")
+    user_context, *extra_context = fit_context(user_context, *extra_context)
+    tail.append(user_context)
+    return SystemPrompt(CAROUSEL_SYSTEM_PREFIX).with_context(*tail, *extra_context)
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+@parser_classes([JSONParser])
+def generate_carousel(request):
+    # Vérifier la limite de générations
+    can_generate, error_response = check_generation_limit(request.user)
+    if not can_generate:
+        return error_response
+
+    topic = request.data.get('topic', '').strip()
+    tone = request.data.get('tone', 'professionnel')
+    num_slides = request.data.get('num_slides', 7)
+    template = request.data.get('template', '').strip()
+
+    if not topic:
+        return Response({'error': 'Le sujet est requis'}, status=status.HTTP_400_BAD_REQUEST)
+
+    num_slides = max(5, min(10, int(num_slides)))
+
+    user_context = get_user_context(request)
+    mode = get_objective(request)
+
+    # Enrichir avec recherche web si nécessaire
+    web_context = enrich_context(topic)
+
+    system_prompt = build_carousel_system_prompt(tone, mode, template, user_context, web_context)
 
     user_message = f"Cree un carousel LinkedIn de {num_slides} slides sur le sujet suivant:\n\n{topic}"
     if web_context:
         user_message += f"\n\n---\n{web_context}"
 
     try:
-        client = anthropic.Anthropic(api_key=settings.ANTHROPIC_API_KEY)
-        response = client.messages.create(
-            model="claude-sonnet-4-20250514",
+        response = claude_message(
+            model=claude_model('long_form'),
             max_tokens=2000,
             system=system_prompt,
             messages=[{"role": "user", "content": user_message}],
@@ -326,9 +343,8 @@ Contenu du carousel:
 {carousel_summary}"""
 
     try:
-        client = anthropic.Anthropic(api_key=settings.ANTHROPIC_API_KEY)
-        response = client.messages.create(
-            model="claude-sonnet-4-20250514",
+        response = claude_message(
+            model=claude_model(),
             max_tokens=1000,
             system=system_prompt,
             messages=[{"role": "user", "content": user_message}],
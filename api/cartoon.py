@@ -1,7 +1,6 @@
 import base64
 import logging
 
-import anthropic
 import requests
 from django.conf import settings
 from django.db.models import F
@@ -13,6 +12,8 @@ from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 
 from .models import CartoonAvatar, CartoonUsageRecord, Subscription
+from .llm import get_client, claude_message, claude_model
+from .circuit_breaker import guard
 
 logger = logging.getLogger('api')
 
@@ -79,10 +80,8 @@ def describe_photo_with_vision(photo_url):
     if content_type not in ('image/jpeg', 'image/png', 'image/gif', 'image/webp'):
         content_type = 'image/jpeg'
 
-    client = anthropic.Anthropic(api_key=settings.ANTHROPIC_API_KEY)
-
-    message = client.messages.create(
-        model="claude-sonnet-4-20250514",
+    message = claude_message(
+        model=claude_model(),
         max_tokens=256,
         messages=[{
             "role": "user",
@@ -119,12 +118,15 @@ def generate_cartoon_image(prompt_details, width=512, height=512):
 
     full_prompt = f"{CARTOON_STYLE} {prompt_details}"
 
-    resp = requests.post(
-        FLUX_URL,
-        headers={"Authorization": f"Bearer {settings.HF_TOKEN}"},
-        json={"inputs": full_prompt, "parameters": {"width": width, "height": height}},
-        timeout=60,
-    )
+    with guard('huggingface-flux') as call:
+        resp = get_client('huggingface').post(
+            FLUX_URL,
+            headers={"Authorization": f"Bearer {settings.HF_TOKEN}"},
+            json={"inputs": full_prompt, "parameters": {"width": width, "height": height}},
+            timeout=60,
+        )
+        if resp.status_code == 429 or resp.status_code >= 500:
+            call.mark_failed()
 
     if resp.status_code == 429:
         raise Exception("Limite de requêtes HuggingFace atteinte, réessayez plus tard")
@@ -141,8 +143,6 @@ def generate_cartoon_image(prompt_details, width=512, height=512):
 
 def generate_dialogue_script(topic, tone, num_panels, main_name, other_name):
     """Génère le script de dialogue via Claude."""
-    client = anthropic.Anthropic(api_key=settings.ANTHROPIC_API_KEY)
-
     system_prompt = (
         "Tu es un scénariste expert en dialogues éducatifs pour LinkedIn. "
         "Tu crées des dialogues naturels entre deux personnages pour expliquer un sujet. "
@@ -169,8 +169,8 @@ RÈGLES :
 Réponds UNIQUEMENT avec du JSON valide, sans markdown :
 {{"panels": [{{"speaker": "main", "text": "...", "speaker_name": "{main_name}"}}, {{"speaker": "other", "text": "...", "speaker_name": "{other_name}"}}]}}"""
 
-    message = client.messages.create(
-        model="claude-sonnet-4-20250514",
+    message = claude_message(
+        model=claude_model(),
         max_tokens=1024,
         system=system_prompt,
         messages=[{"role": "user", "content": user_message}]
@@ -0,0 +1,304 @@
+"""
+Circuit breaker and adaptive concurrency limiter per AI provider.
+
+State lives in the SQLite file CIRCUIT_BREAKER_DB, which every gunicorn worker
+must share, so one worker's failures open the circuit for all of them:
+- closed:    calls go through; N consecutive failures open the circuit
+- open:      calls fail fast with a 503 + Retry-After until the cooldown ends
+- half_open: a single probe call decides between closed and open again
+
+Concurrency follows AIMD: each success raises the provider's limit by 1/limit
+(about +1 per round trip), each failure halves it. In-flight calls are leases
+with an expiry, so a killed worker cannot leak capacity.
+
+Only signs that the provider itself is struggling count as failures: transport
+errors, timeouts, HTTP 429 and 5xx. A 4xx or one of our own errors (validation,
+parsing) means the provider answered, so it does not trip the circuit.
+"""
+import asyncio
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+
+from django.conf import settings
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+logger = logging.getLogger(__name__)
+
+
+class ProviderUnavailable(APIException):
+    """Raised instead of calling a provider whose circuit is open or whose limiter is full."""
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = 'Service IA temporairement indisponible, réessayez dans un moment.'
+    default_code = 'provider_unavailable'
+
+    def __init__(self, provider, retry_after):
+        super().__init__()
+        self.provider = provider
+        # DRF's exception handler turns `wait` into a Retry-After header
+        self.wait = max(int(retry_after + 0.999), 1)
+
+    def __str__(self):
+        return f"{self.provider} indisponible (réessayer dans {self.wait}s)"
+
+
+class ProviderError(Exception):
+    """A provider answered with an error status that our code turns into an exception."""
+
+    def __init__(self, message, status_code):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS provider_state (
+    provider TEXT PRIMARY KEY,
+    state TEXT NOT NULL,
+    failures INTEGER NOT NULL,
+    open_until REAL NOT NULL,
+    concurrency_limit REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS provider_lease (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    provider TEXT NOT NULL,
+    expires_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS provider_lease_provider ON provider_lease (provider);
+"""
+
+_local = threading.local()
+
+
+def _connection():
+    conn = getattr(_local, 'conn', None)
+    if conn is not None and _local.pid == os.getpid():
+        return conn
+    conn = sqlite3.connect(settings.CIRCUIT_BREAKER_DB, timeout=5, isolation_level=None)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.executescript(_SCHEMA)
+    _local.conn, _local.pid = conn, os.getpid()
+    return conn
+
+
+@contextmanager
+def _transaction():
+    conn = _connection()
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        yield conn
+    except BaseException:
+        conn.execute('ROLLBACK')
+        raise
+    else:
+        conn.execute('COMMIT')
+
+
+def _load_state(conn, provider):
+    row = conn.execute(
+        'SELECT state, failures, open_until, concurrency_limit FROM provider_state WHERE provider = ?',
+        (provider,),
+    ).fetchone()
+    if row:
+        return list(row)
+    state = ['closed', 0, 0.0, float(settings.PROVIDER_CONCURRENCY_MAX)]
+    conn.execute('INSERT INTO provider_state VALUES (?, ?, ?, ?, ?)', (provider, *state))
+    return state
+
+
+def _save_state(conn, provider, state):
+    conn.execute(
+        'UPDATE provider_state SET state = ?, failures = ?, open_until = ?, concurrency_limit = ? WHERE provider = ?',
+        (*state, provider),
+    )
+
+
+def _acquire(provider):
+    """Take a lease for one call, or raise ProviderUnavailable."""
+    now = time.time()
+    with _transaction() as conn:
+        conn.execute('DELETE FROM provider_lease WHERE expires_at < ?', (now,))
+        state = _load_state(conn, provider)
+        circuit, _failures, open_until, limit = state
+
+        if circuit == 'open':
+            if now < open_until:
+                raise ProviderUnavailable(provider, open_until - now)
+            state[0] = circuit = 'half_open'
+            _save_state(conn, provider, state)
+            logger.info(f"Circuit {provider}: half-open, sending a probe")
+
+        active = conn.execute(
+            'SELECT COUNT(*) FROM provider_lease WHERE provider = ?', (provider,)
+        ).fetchone()[0]
+        allowed = 1 if circuit == 'half_open' else max(int(limit), settings.PROVIDER_CONCURRENCY_MIN)
+        if active >= allowed:
+            raise ProviderUnavailable(provider, 1)
+
+        cursor = conn.execute(
+            'INSERT INTO provider_lease (provider, expires_at) VALUES (?, ?)',
+            (provider, now + settings.PROVIDER_LEASE_TTL),
+        )
+        return cursor.lastrowid
+
+
+def _release(provider, lease_id, failed):
+    """
+    Return a lease and feed the outcome to the breaker and the AIMD limit.
+    failed=None returns the lease without an outcome (call abandoned by the caller).
+    """
+    now = time.time()
+    with _transaction() as conn:
+        conn.execute('DELETE FROM provider_lease WHERE id = ?', (lease_id,))
+        if failed is None:
+            return
+        state = _load_state(conn, provider)
+        circuit, failures, open_until, limit = state
+
+        if failed:
+            failures += 1
+            limit = max(limit * 0.5, float(settings.PROVIDER_CONCURRENCY_MIN))
+            if circuit == 'half_open' or failures >= settings.CIRCUIT_BREAKER_FAILURE_THRESHOLD:
+                if circuit != 'open':
+                    logger.warning(f"Circuit {provider}: opened after {failures} failure(s)")
+                circuit, open_until = 'open', now + settings.CIRCUIT_BREAKER_COOLDOWN
+        else:
+            if circuit == 'half_open':
+                logger.info(f"Circuit {provider}: probe succeeded, closing")
+            circuit, failures = 'closed', 0
+            limit = min(limit + 1 / limit, float(settings.PROVIDER_CONCURRENCY_MAX))
+
+        _save_state(conn, provider, [circuit, failures, open_until, limit])
+
+
+# ---------------------------------------------------------------------------
+# Failure classification
+# ---------------------------------------------------------------------------
+
+# Transport-level exception classes of the HTTP stacks behind the SDKs (requests,
+# httpx, anthropic/openai, tavily), matched by name so none of them is imported here
+_TRANSPORT_ERRORS = frozenset({
+    'ConnectionError', 'Timeout', 'TimeoutError', 'TimeoutException', 'TransportError',
+    'APIConnectionError', 'APITimeoutError',
+})
+
+
+def _status_code(exc):
+    for source in (exc, getattr(exc, 'response', None)):
+        for attr in ('status_code', 'code'):
+            value = getattr(source, attr, None)
+            if isinstance(value, int) and 100 <= value < 600:
+                return value
+    return None
+
+
+def is_provider_failure(exc) -> bool:
+    """Whether an exception raised by a provider call should count against its circuit."""
+    if isinstance(exc, APIException):
+        return False  # ours, e.g. another provider's ProviderUnavailable
+    if isinstance(exc, (TimeoutError, ConnectionError)):
+        return True
+    status_code = _status_code(exc)
+    if status_code is not None:
+        return status_code == 429 or status_code >= 500
+    return any(cls.__name__ in _TRANSPORT_ERRORS for cls in type(exc).__mro__)
+
+
+class _Call:
+    def __init__(self):
+        self.failed = False
+
+    def mark_failed(self):
+        """Count the call as a failure even though it did not raise (e.g. an HTTP 5xx handled inline)."""
+        self.failed = True
+
+
+@contextmanager
+def guard(provider):
+    """
+    Run one provider call under its circuit breaker and concurrency limit.
+    Raises ProviderUnavailable without calling the provider when the circuit is open.
+    If the local store itself is unusable the call goes through unguarded.
+    """
+    try:
+        lease_id = _acquire(provider)
+    except sqlite3.Error as e:
+        logger.warning(f"Circuit breaker store unavailable, calling {provider} unguarded: {e}")
+        yield _Call()
+        return
+
+    call = _Call()
+    outcome = None
+    try:
+        yield call
+        outcome = call.failed
+    except GeneratorExit:
+        raise  # a stream closed by its consumer (client gone): no outcome either way
+    except Exception as e:
+        outcome = call.failed or is_provider_failure(e)
+        raise
+    finally:
+        try:
+            _release(provider, lease_id, outcome)
+        except sqlite3.Error as e:
+            logger.warning(f"Circuit breaker release failed for {provider}: {e}")
+
+
+@asynccontextmanager
+async def aguard(provider):
+    """
+    guard() for coroutines on the LLM loop: the SQLite lease is taken and
+    returned in a thread so a busy store never blocks the event loop.
+    """
+    try:
+        lease_id = await asyncio.to_thread(_acquire, provider)
+    except sqlite3.Error as e:
+        logger.warning(f"Circuit breaker store unavailable, calling {provider} unguarded: {e}")
+        yield _Call()
+        return
+
+    call = _Call()
+    outcome = None
+    try:
+        yield call
+        outcome = call.failed
+    except asyncio.CancelledError:
+        raise  # e.g. the losing call of a hedge: no outcome either way
+    except Exception as e:
+        outcome = call.failed or is_provider_failure(e)
+        raise
+    finally:
+        try:
+            # The release runs to completion in its thread even if this task is cancelled again
+            await asyncio.to_thread(_release, provider, lease_id, outcome)
+        except sqlite3.Error as e:
+            logger.warning(f"Circuit breaker release failed for {provider}: {e}")
+
+
+def circuit_status():
+    """Current breaker state, AIMD limit and in-flight calls for every known provider."""
+    try:
+        conn = _connection()
+        now = time.time()
+        rows = conn.execute(
+            'SELECT provider, state, failures, open_until, concurrency_limit FROM provider_state'
+        ).fetchall()
+        return {
+            provider: {
+                'state': circuit,
+                'failures': failures,
+                'retry_after': max(round(open_until - now), 0) if circuit == 'open' else 0,
+                'concurrency_limit': round(limit, 2),
+                'in_flight': conn.execute(
+                    'SELECT COUNT(*) FROM provider_lease WHERE provider = ? AND expires_at >= ?',
+                    (provider, now),
+                ).fetchone()[0],
+            }
+            for provider, circuit, failures, open_until, limit in rows
+        }
+    except sqlite3.Error as e:
+        logger.warning(f"Circuit breaker status unavailable: {e}")
+        return {}
@@ -13,6 +13,7 @@ from rest_framework.response import Response
 
 from .models import LinkedInAccount, PublishedPost
 from .views import get_user_context
+from .llm import claude_message, claude_model
 
 logger = logging.getLogger(__name__)
 
@@ -208,9 +209,8 @@ COMMENTAIRES :
 {comments_block}"""
 
     try:
-        client = anthropic.Anthropic(api_key=settings.ANTHROPIC_API_KEY)
-        message = client.messages.create(
-            model="claude-sonnet-4-20250514",
+        message = claude_message(
+            model=claude_model(),
             max_tokens=4096,
             system=system_prompt,
             messages=[{"role": "user", "content": user_prompt}],
@@ -1,18 +1,23 @@
 """
 AI Consultants — Specialized chatbots with streaming responses.
-Each consultant has a unique system prompt and personality.
+Each consultant has a unique system prompt and personality, followed by context
+shared by the whole team (who covers what, the platform formats the generators
+apply, common answer rules). Personas are fully static, so the whole prompt is
+the cached prefix, and the shared context makes it long enough to be cached.
 """
+import functools
 import json
 import logging
 
-from django.conf import settings
 from django.http import StreamingHttpResponse
 from rest_framework import status
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.decorators import api_view, permission_classes, renderer_classes
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 
-from .llm import generate_chat_stream
+from .llm import generate_chat_stream, get_client
+from .prompts import _PLATFORMS, SystemPrompt
+from .renderers import STREAMING_RENDERERS
 
 logger = logging.getLogger(__name__)
 
@@ -162,9 +167,39 @@ Regles :
 
 MAX_HISTORY = 20  # Max messages in history (10 turns)
 
+_SHARED_RULES = """REGLES COMMUNES A TOUTE L'EQUIPE :
+- Si la question releve du domaine d'un autre consultant, dis-le en une phrase et cite son prenom (voir l'equipe ci-dessus)
+- Quand tu proposes un post, un hook ou un thread, respecte les formats de plateforme ci-dessus : ce sont ceux qu'applique le generateur de l'application
+- N'invente ni statistiques, ni etudes, ni chiffres d'algorithme. Si tu n'es pas sur, dis que c'est une tendance observee, pas une regle
+- Pose une question de clarification quand la demande est trop vague pour donner un conseil utile (cible, objectif, plateforme)
+- Termine par une action concrete que la personne peut faire aujourd'hui
+- Pas de markdown lourd : des tirets et des sauts de ligne suffisent"""
+
+
+def _expertise(system_prompt):
+    """Domain bullets of a persona, on one line."""
+    lines = system_prompt.split("Ton domaine d'expertise :", 1)[1].split("Regles :", 1)[0]
+    return "; ".join(line.strip("- ").strip() for line in lines.splitlines() if line.strip())
+
+
+@functools.lru_cache(maxsize=None)
+def consultant_system_prompt(consultant_id):
+    """Persona followed by the context shared by every consultant."""
+    team = "\n".join(
+        f"- {c['name']} : {_expertise(c['system_prompt'])}" for c in CONSULTANTS.values()
+    )
+    formats = "\n\n".join(platform["format"] for platform in _PLATFORMS.values())
+    return SystemPrompt("\n\n".join([
+        CONSULTANTS[consultant_id]["system_prompt"],
+        f"L'EQUIPE DE CONSULTANTS (pour rediriger vers la bonne personne) :\n{team}",
+        f"FORMATS DE PLATEFORME DE L'APPLICATION :\n\n{formats}",
+        _SHARED_RULES,
+    ]))
+
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
+@renderer_classes(STREAMING_RENDERERS)
 def chat_with_consultant(request):
     """Stream a chat response from an AI consultant via SSE."""
     consultant_id = request.data.get('consultant_id', '').strip()
@@ -180,8 +215,6 @@ def chat_with_consultant(request):
     if len(message) > 5000:
         return Response({'error': 'Message trop long (5000 caracteres max)'}, status=status.HTTP_400_BAD_REQUEST)
 
-    consultant = CONSULTANTS[consultant_id]
-
     # Build messages array (truncate old history)
     messages = []
     if isinstance(history, list):
@@ -194,7 +227,8 @@ def chat_with_consultant(request):
     def stream_response():
         try:
             for chunk in generate_chat_stream(
-                system_prompt=consultant['system_prompt'],
+                # Personas are fully static: the whole prompt is the cacheable prefix
+                system_prompt=consultant_system_prompt(consultant_id),
                 messages=messages,
                 max_tokens=1024,
             ):
@@ -219,7 +253,6 @@ def chat_with_consultant(request):
 def text_to_speech(request):
     """Convert text to speech using OpenAI TTS. Returns audio/mpeg."""
     from django.http import HttpResponse
-    from openai import OpenAI
 
     text = request.data.get('text', '').strip()
     consultant_id = request.data.get('consultant_id', 'marie')
@@ -233,7 +266,7 @@ def text_to_speech(request):
     voice = CONSULTANT_VOICES.get(consultant_id, 'nova')
 
     try:
-        client = OpenAI(api_key=settings.OPENAI_API_KEY)
+        client = get_client('openai')
         tts_response = client.audio.speech.create(
             model="tts-1",
             voice=voice,
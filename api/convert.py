@@ -10,6 +10,7 @@ from django.conf import settings
 import anthropic
 
 from .views import get_user_context, extract_hashtags
+from .llm import claude_message, claude_model
 from .billing import check_generation_limit, increment_usage
 
 logger = logging.getLogger(__name__)
@@ -68,9 +69,8 @@ SCHEMA JSON (exemples de chaque type):
 {user_context}"""
 
     try:
-        client = anthropic.Anthropic(api_key=settings.ANTHROPIC_API_KEY)
-        response = client.messages.create(
-            model="claude-sonnet-4-20250514",
+        response = claude_message(
+            model=claude_model('long_form'),
             max_tokens=2000,
             system=system_prompt,
             messages=[{"role": "user", "content": f"Transforme ce post LinkedIn en carousel de {num_slides} slides:\n\n{content}"}],
@@ -150,9 +150,8 @@ SCHEMA JSON:
 {user_context}"""
 
     try:
-        client = anthropic.Anthropic(api_key=settings.ANTHROPIC_API_KEY)
-        response = client.messages.create(
-            model="claude-sonnet-4-20250514",
+        response = claude_message(
+            model=claude_model('long_form'),
             max_tokens=2000,
             system=system_prompt,
             messages=[{"role": "user", "content": f"Transforme ce post LinkedIn en infographie de {num_items} éléments:\n\n{content}"}],
@@ -262,9 +261,8 @@ RÈGLES:
 {user_context}"""
 
     try:
-        client = anthropic.Anthropic(api_key=settings.ANTHROPIC_API_KEY)
-        response = client.messages.create(
-            model="claude-sonnet-4-20250514",
+        response = claude_message(
+            model=claude_model(),
             max_tokens=1024,
             system=system_prompt,
             messages=[{"role": "user", "content": f"Transforme ce contenu en post LinkedIn:\n\n{source}"}],
@@ -0,0 +1,111 @@
+"""
+Content-addressed embedding cache shared by every embed_texts caller.
+
+A vector is keyed by sha256(model, text): autopilot's recurring topics and
+re-uploaded documents are embedded once. Lookups go through a per-process LRU
+(EMBEDDING_CACHE_LRU_SIZE vectors), then the EmbeddingCacheEntry table, which
+is trimmed back to EMBEDDING_CACHE_MAX_ENTRIES by least recent use.
+Hit/miss counters are per worker and exposed in GET /api/llm/stats/.
+"""
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.utils import timezone
+
+from . import vectors
+from .models import EmbeddingCacheEntry
+
+logger = logging.getLogger(__name__)
+
+# Table size is checked every N writes rather than on each call
+EVICT_CHECK_EVERY = 200
+
+_lock = threading.Lock()
+_lru = OrderedDict()
+_counters = {'memory_hits': 0, 'db_hits': 0, 'misses': 0, 'evicted': 0}
+_writes_since_check = 0
+
+
+def cache_key(model: str, text: str) -> str:
+    return hashlib.sha256(f"{model}\0{text}".encode()).hexdigest()
+
+
+def _remember(key, vector):
+    with _lock:
+        _lru[key] = vector
+        _lru.move_to_end(key)
+        while len(_lru) > settings.EMBEDDING_CACHE_LRU_SIZE:
+            _lru.popitem(last=False)
+
+
+def get_many(model: str, texts: list[str]) -> dict:
+    """Cached vectors for the texts found, as {text: float32 array}."""
+    keys = {cache_key(model, text): text for text in texts}
+    found = {}
+    with _lock:
+        for key, text in keys.items():
+            if key in _lru:
+                _lru.move_to_end(key)
+                found[text] = _lru[key]
+        _counters['memory_hits'] += len(found)
+
+    missing = [key for key, text in keys.items() if text not in found]
+    if missing:
+        rows = list(EmbeddingCacheEntry.objects.filter(key__in=missing).values_list('key', 'embedding'))
+        for key, blob in rows:
+            vector = vectors.as_float32(bytes(blob))
+            found[keys[key]] = vector
+            _remember(key, vector)
+        if rows:
+            EmbeddingCacheEntry.objects.filter(key__in=[key for key, _blob in rows]).update(last_used_at=timezone.now())
+        with _lock:
+            _counters['db_hits'] += len(rows)
+            _counters['misses'] += len(missing) - len(rows)
+    return found
+
+
+def put_many(model: str, embedded: dict):
+    """Store freshly computed vectors ({text: vector}) in both tiers."""
+    global _writes_since_check
+    if not embedded:
+        return
+    now = timezone.now()
+    entries = []
+    for text, vector in embedded.items():
+        key = cache_key(model, text)
+        blob = vectors.pack(vector, 'float32')
+        _remember(key, vectors.as_float32(blob))
+        entries.append(EmbeddingCacheEntry(key=key, model=model, embedding=blob, last_used_at=now))
+    EmbeddingCacheEntry.objects.bulk_create(entries, ignore_conflicts=True)
+
+    with _lock:
+        _writes_since_check += len(entries)
+        if _writes_since_check < EVICT_CHECK_EVERY:
+            return
+        _writes_since_check = 0
+    _evict()
+
+
+def _evict():
+    """Delete the least recently used rows beyond EMBEDDING_CACHE_MAX_ENTRIES."""
+    excess = EmbeddingCacheEntry.objects.count() - settings.EMBEDDING_CACHE_MAX_ENTRIES
+    if excess <= 0:
+        return
+    oldest = list(EmbeddingCacheEntry.objects.order_by('last_used_at').values_list('key', flat=True)[:excess])
+    deleted, _ = EmbeddingCacheEntry.objects.filter(key__in=oldest).delete()
+    with _lock:
+        _counters['evicted'] += deleted
+    logger.info(f"Embedding cache: evicted {deleted} entries")
+
+
+def stats() -> dict:
+    """Hit/miss counters for this worker, plus the hit ratio and LRU fill."""
+    with _lock:
+        counters = dict(_counters)
+        counters['memory_entries'] = len(_lru)
+    lookups = counters['memory_hits'] + counters['db_hits'] + counters['misses']
+    counters['hit_ratio'] = round((counters['memory_hits'] + counters['db_hits']) / lookups, 3) if lookups else None
+    return counters
@@ -0,0 +1,95 @@
+"""
+Cache for enrich_context, shared by every worker through the 'enrichment'
+cache (a DatabaseCache table, see CACHES).
+
+Two levels: entity extraction results keyed by a hash of the normalized text
+(ENRICH_ENTITY_CACHE_TTL), and Tavily results keyed by the normalized query
+(ENRICH_SEARCH_CACHE_TTL, shorter since web facts move). The table is culled
+by the cache backend beyond ENRICH_CACHE_MAX_ENTRIES. Each entry keeps the
+time its computation took, so a hit also counts the latency it saved. Counters
+are per worker, by endpoint, and exposed in GET /api/llm/stats/.
+"""
+import hashlib
+import logging
+import re
+import threading
+import time
+import unicodedata
+
+from django.conf import settings
+from django.core.cache import caches
+
+from .ledger import current_endpoint
+
+logger = logging.getLogger(__name__)
+
+LEVELS = ('entities', 'search')
+# Bumped when the shape of a level's values changes, so old entries are ignored
+VERSIONS = {'entities': 1, 'search': 2}
+
+_lock = threading.Lock()
+_counters = {}  # endpoint -> level -> {'hits', 'misses', 'saved_ms'}
+
+
+def normalize(text: str) -> str:
+    return re.sub(r'\s+', ' ', unicodedata.normalize('NFKC', text)).strip().lower()
+
+
+def cache_key(level: str, text: str) -> str:
+    return f"{level}:{hashlib.sha256(normalize(text).encode()).hexdigest()}"
+
+
+def _ttl(level):
+    return settings.ENRICH_ENTITY_CACHE_TTL if level == 'entities' else settings.ENRICH_SEARCH_CACHE_TTL
+
+
+def _count(level, hit, saved_ms=0.0):
+    endpoint = current_endpoint() or 'unscoped'
+    with _lock:
+        counters = _counters.setdefault(endpoint, {}).setdefault(
+            level, {'hits': 0, 'misses': 0, 'saved_ms': 0.0},
+        )
+        counters['hits' if hit else 'misses'] += 1
+        counters['saved_ms'] += saved_ms
+
+
+def cached(level: str, text: str, compute):
+    """
+    compute() through the cache. Exceptions from compute are not cached; they
+    propagate so callers keep their own error handling.
+    """
+    cache = caches['enrichment']
+    key = cache_key(level, text)
+    try:
+        entry = cache.get(key, version=VERSIONS[level])
+    except Exception as e:
+        logger.warning(f"Enrichment cache read failed: {e}")
+        entry = None
+    if entry is not None:
+        _count(level, True, entry['ms'])
+        return entry['value']
+
+    start = time.perf_counter()
+    value = compute()
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    _count(level, False)
+    try:
+        cache.set(key, {'value': value, 'ms': elapsed_ms}, _ttl(level), version=VERSIONS[level])
+    except Exception as e:
+        logger.warning(f"Enrichment cache write failed: {e}")
+    return value
+
+
+def stats() -> dict:
+    """Hits, misses, hit ratio and latency saved, per endpoint and level, for this worker."""
+    with _lock:
+        snapshot = {
+            endpoint: {level: dict(counters) for level, counters in levels.items()}
+            for endpoint, levels in _counters.items()
+        }
+    for levels in snapshot.values():
+        for counters in levels.values():
+            lookups = counters['hits'] + counters['misses']
+            counters['hit_ratio'] = round(counters['hits'] / lookups, 3) if lookups else None
+            counters['saved_ms'] = round(counters['saved_ms'])
+    return snapshot
@@ -0,0 +1,145 @@
+"""
+Local pre-classifier for extract_entities: decides from the text alone
+whether the Haiku extraction call is needed.
+
+- 'none': no product-like name, unknown proper noun or statistic, so the LLM
+  would return [] (generic summaries): no call.
+- 'queries': only unambiguous product names (CamelCase, names with version
+  numbers, .ai/.io domains, quoted names): they are the queries, no call.
+- 'llm': unknown proper nouns or figures that need judgment or phrasing: the
+  LLM extracts as before.
+
+A sample of local decisions (ENTITY_PREFILTER_SHADOW_RATE) is still sent to
+the LLM and compared, and precision/recall are logged and kept per worker in
+GET /api/llm/stats/. eval_entity_prefilter measures them on past summaries.
+"""
+import logging
+import re
+import threading
+import unicodedata
+
+logger = logging.getLogger(__name__)
+
+MAX_QUERIES = 3
+
+# Large, well-known companies and products: the extraction prompt skips them
+WELL_KNOWN = frozenset("""
+    google apple microsoft amazon meta facebook instagram linkedin twitter youtube tiktok whatsapp netflix
+    tesla samsung ibm intel nvidia uber airbnb spotify adobe oracle salesforce openai chatgpt gmail excel
+    word powerpoint outlook teams slack zoom notion canva figma shopify wordpress android iphone ios windows
+""".split())
+
+# Capitalized words that are not entities: acronyms of general concepts, calendar words
+GENERIC = frozenset("""
+    ia ai ceo cto cfo coo rh hr b2b b2c saas kpi roi pme tpe seo sem crm erp api ux ui rse esg mba
+    lundi mardi mercredi jeudi vendredi samedi dimanche janvier fevrier mars avril mai juin juillet aout
+    septembre octobre novembre decembre monday tuesday wednesday thursday friday saturday sunday
+    je tu il elle nous vous ils elles le la les un une des mon ma mes ce cette ces et mais ou donc
+    france paris europe
+""".split())
+
+_PRODUCT = re.compile(
+    r"\b(?:"
+    r"[A-Z][a-z]+[A-Z][A-Za-z]*"  # CamelCase: NanoBanana, HubSpot
+    r"|[a-z]+[A-Z][A-Za-z]*"  # iPhone-style
+    r"|[A-Z][A-Za-z]*-?\d+(?:\.\d+)?[a-z]?"  # versioned: GPT-4o, H100, Gemini-2.5
+    r"|[A-Z]{2,}[A-Za-z]*\s\d+(?:\.\d+)?"  # GPT 5, VEO 3
+    r"|[A-Za-z][\w-]*\.(?:ai|io|app|so|dev|co)"  # domain-style names
+    r")\b"
+)
+_QUOTED = re.compile(r"[«\"“]\s*([A-Z][^«»\"“”\n]{1,40}?)\s*[»\"”]")
+_CAPITALIZED = re.compile(r"\b[A-ZÀ-Ý][\w'-]*(?:\s+[A-ZÀ-Ý][\w'-]*)*")
+_STATISTIC = re.compile(
+    r"\d+(?:[.,]\d+)?\s?(?:%|pour ?cent|millions?|milliards?|k€|M€|€|\$|x\b)|\b20\d\d\b",
+    re.IGNORECASE,
+)
+
+_lock = threading.Lock()
+_counters = {
+    'none': 0, 'queries': 0, 'llm': 0,
+    'shadow_samples': 0, 'true_positives': 0, 'false_positives': 0, 'false_negatives': 0,
+}
+
+
+def _plain(text: str) -> str:
+    text = unicodedata.normalize('NFKD', text.lower())
+    return ''.join(c for c in text if not unicodedata.combining(c)).strip()
+
+
+def _starts_sentence(text: str, index: int) -> bool:
+    before = text[:index].rstrip(' \t')[-1:]
+    return not before or before in '.!?…:\n«"“-•*('
+
+
+def _known(name: str) -> bool:
+    words = _plain(name).split()
+    return bool(words) and all(word in WELL_KNOWN or word in GENERIC for word in words)
+
+
+def classify(text: str) -> tuple[str, list[str]]:
+    """Decision ('none', 'queries' or 'llm') and, for 'queries', the search queries."""
+    products = []
+    for match in list(_PRODUCT.finditer(text)) + list(_QUOTED.finditer(text)):
+        name = (match.group(1) if match.re is _QUOTED else match.group(0)).strip()
+        if name.isdigit() or _known(name) or any(_plain(name) == _plain(p) for p in products):
+            continue
+        products.append(name)
+
+    unknown = False
+    for match in _CAPITALIZED.finditer(text):
+        name = match.group(0)
+        if _starts_sentence(text, match.start()):
+            # The first capital after a full stop is just a sentence start
+            name = name.split(None, 1)[1] if ' ' in name else ''
+            if not name:
+                continue
+        if _known(name) or any(_plain(name) in _plain(p) or _plain(p) in _plain(name) for p in products):
+            continue
+        unknown = True
+        break
+
+    if unknown or _STATISTIC.search(text) or len(products) > MAX_QUERIES:
+        decision, queries = 'llm', []
+    elif products:
+        decision, queries = 'queries', products
+    else:
+        decision, queries = 'none', []
+    with _lock:
+        _counters[decision] += 1
+    return decision, queries
+
+
+def _same(a: str, b: str) -> bool:
+    a, b = _plain(a), _plain(b)
+    return a in b or b in a
+
+
+def agreement(local: list[str], llm: list[str]) -> tuple[int, int, int]:
+    """(true positives, false positives, false negatives) of local queries against the LLM's."""
+    true_positives = sum(1 for query in local if any(_same(query, other) for other in llm))
+    false_negatives = sum(1 for other in llm if not any(_same(query, other) for query in local))
+    return true_positives, len(local) - true_positives, false_negatives
+
+
+def record_shadow(text: str, decision: str, local: list[str], llm: list[str]):
+    """Log and count how a local decision compares with the LLM extraction."""
+    tp, fp, fn = agreement(local, llm)
+    with _lock:
+        _counters['shadow_samples'] += 1
+        _counters['true_positives'] += tp
+        _counters['false_positives'] += fp
+        _counters['false_negatives'] += fn
+    log = logger.warning if fp or fn else logger.info
+    log(f"Entity prefilter shadow: decision={decision} local={local} llm={llm} text='{text[:80]}'")
+
+
+def stats() -> dict:
+    """Decisions, Haiku calls avoided and shadow precision/recall for this worker."""
+    with _lock:
+        counters = dict(_counters)
+    tp, fp, fn = counters['true_positives'], counters['false_positives'], counters['false_negatives']
+    # Shadow samples still called the LLM
+    counters['llm_calls_avoided'] = counters['none'] + counters['queries'] - counters['shadow_samples']
+    counters['precision'] = round(tp / (tp + fp), 3) if tp + fp else None
+    counters['recall'] = round(tp / (tp + fn), 3) if tp + fn else None
+    return counters
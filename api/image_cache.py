@@ -0,0 +1,128 @@
+"""
+On-disk cache for the image proxy (websearch.proxy_image).
+
+Images are stored under IMAGE_PROXY_CACHE_DIR at sha256(url), next to a JSON
+file with their content type and validators (ETag, Last-Modified). A hit
+refreshes the file's mtime, and once the worker has written about 5% of
+IMAGE_PROXY_CACHE_BYTES since its last check, the least recently used images
+are deleted until the total is back under 90% of the budget. Files are written
+to a temporary name and renamed, so readers never see a partial image.
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+EVICT_CHECK_RATIO = 0.05
+EVICT_TARGET_RATIO = 0.9
+
+_lock = threading.Lock()
+_bytes_since_check = 0
+
+
+def cache_key(url: str) -> str:
+    return hashlib.sha256(url.encode()).hexdigest()
+
+
+def _path(key):
+    return os.path.join(settings.IMAGE_PROXY_CACHE_DIR, key[:2], key)
+
+
+def etag_for(url: str, origin_headers) -> str:
+    """ETag of the proxied image: the URL plus the origin's own validators."""
+    validators = '|'.join(
+        origin_headers.get(name, '') for name in ('ETag', 'Last-Modified', 'Content-Length')
+    )
+    return '"' + hashlib.sha256(f"{url}|{validators}".encode()).hexdigest()[:32] + '"'
+
+
+def lookup(url: str):
+    """(path, meta) of the cached image, or None. Marks it as recently used."""
+    path = _path(cache_key(url))
+    try:
+        with open(f"{path}.json") as f:
+            meta = json.load(f)
+        os.utime(path)
+    except (FileNotFoundError, ValueError):
+        return None
+    return path, meta
+
+
+class Writer:
+    """Receives a streamed image; commit() publishes it, abort() drops it."""
+
+    def __init__(self, url: str, meta: dict):
+        self.path = _path(cache_key(url))
+        self.meta = meta
+        self.size = 0
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.tmp = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        self.file = open(self.tmp, 'wb')
+
+    def write(self, data: bytes):
+        self.file.write(data)
+        self.size += len(data)
+
+    def commit(self):
+        self.file.close()
+        meta_tmp = f"{self.tmp}.json"
+        with open(meta_tmp, 'w') as f:
+            json.dump({**self.meta, 'size': self.size}, f)
+        os.replace(self.tmp, self.path)
+        os.replace(meta_tmp, f"{self.path}.json")
+        _written(self.size)
+
+    def abort(self):
+        self.file.close()
+        try:
+            os.remove(self.tmp)
+        except FileNotFoundError:
+            pass
+
+
+def _written(size):
+    global _bytes_since_check
+    with _lock:
+        _bytes_since_check += size
+        if _bytes_since_check < settings.IMAGE_PROXY_CACHE_BYTES * EVICT_CHECK_RATIO:
+            return
+        _bytes_since_check = 0
+    try:
+        evict()
+    except OSError as e:
+        logger.warning(f"Image cache eviction failed: {e}")
+
+
+def evict():
+    """Delete least recently used images until the cache is under its byte budget."""
+    entries, total = [], 0
+    for shard in os.scandir(settings.IMAGE_PROXY_CACHE_DIR):
+        if not shard.is_dir():
+            continue
+        for entry in os.scandir(shard.path):
+            if entry.name.endswith(('.json', '.tmp')):
+                continue
+            stat = entry.stat()
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+            total += stat.st_size
+    if total <= settings.IMAGE_PROXY_CACHE_BYTES:
+        return
+
+    target = settings.IMAGE_PROXY_CACHE_BYTES * EVICT_TARGET_RATIO
+    removed = 0
+    for _mtime, size, path in sorted(entries):
+        for name in (f"{path}.json", path):
+            try:
+                os.remove(name)
+            except FileNotFoundError:
+                pass
+        total -= size
+        removed += 1
+        if total <= target:
+            break
+    logger.info(f"Image cache: evicted {removed} images, {total / 1e6:.1f} MB left")
@@ -1,7 +1,6 @@
 import base64
 import requests
 
-import anthropic
 from django.conf import settings
 from rest_framework import status
 from rest_framework.decorators import api_view, parser_classes, permission_classes
@@ -9,6 +8,9 @@ from rest_framework.parsers import JSONParser
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 
+from .llm import get_client, claude_message, claude_model
+from .circuit_breaker import guard, ProviderUnavailable
+
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
@@ -104,10 +106,8 @@ def suggest_image_keywords(request):
         )
 
     try:
-        client = anthropic.Anthropic(api_key=settings.ANTHROPIC_API_KEY)
-
-        message = client.messages.create(
-            model="claude-sonnet-4-20250514",
+        message = claude_message(
+            model=claude_model('micro'),
             max_tokens=128,
             system=(
                 "Tu es un assistant qui suggère des mots-clés de recherche d'images. "
@@ -150,20 +150,20 @@ def generate_image(request):
         )
 
     try:
-        from google import genai
         from google.genai import types
 
-        client = genai.Client(api_key=settings.GOOGLE_API_KEY)
+        client = get_client('gemini')
 
         full_prompt = f"{prompt}. IMPORTANT: Do not include any text, letters, words, watermarks or typography on the image."
 
-        response = client.models.generate_content(
-            model="gemini-2.5-flash-image",
-            contents=[full_prompt],
-            config=types.GenerateContentConfig(
-                response_modalities=["TEXT", "IMAGE"],
+        with guard('gemini-image'):
+            response = client.models.generate_content(
+                model="gemini-2.5-flash-image",
+                contents=[full_prompt],
+                config=types.GenerateContentConfig(
+                    response_modalities=["TEXT", "IMAGE"],
+                )
             )
-        )
 
         # Extraire l'image de la réponse
         image_part = None
@@ -185,6 +185,8 @@ def generate_image(request):
             'mime_type': image_part.inline_data.mime_type,
         })
 
+    except ProviderUnavailable:
+        raise
     except Exception as e:
         error_msg = str(e)
         if 'RESOURCE_EXHAUSTED' in error_msg or 'quota' in error_msg.lower():
@@ -224,12 +226,15 @@ def generate_image_hf(request):
             f"{prompt}"
         )
 
-        resp = requests.post(
-            "https://router.huggingface.co/hf-inference/models/black-forest-labs/FLUX.1-schnell",
-            headers={"Authorization": f"Bearer {settings.HF_TOKEN}"},
-            json={"inputs": full_prompt, "parameters": {"width": 1024, "height": 1024}},
-            timeout=60,
-        )
+        with guard('huggingface-flux') as call:
+            resp = get_client('huggingface').post(
+                "https://router.huggingface.co/hf-inference/models/black-forest-labs/FLUX.1-schnell",
+                headers={"Authorization": f"Bearer {settings.HF_TOKEN}"},
+                json={"inputs": full_prompt, "parameters": {"width": 1024, "height": 1024}},
+                timeout=60,
+            )
+            if resp.status_code == 429 or resp.status_code >= 500:
+                call.mark_failed()
 
         if resp.status_code == 429:
             return Response(
@@ -257,6 +262,8 @@ def generate_image_hf(request):
             'mime_type': content_type,
         })
 
+    except ProviderUnavailable:
+        raise
     except requests.Timeout:
         return Response(
             {'error': 'Délai de génération dépassé (60s)'},
@@ -325,10 +332,8 @@ def _build_image_search_query(post_content: str, topic: str) -> str:
 
     # Use Claude to translate/adapt to a good English image search query
     try:
-        import anthropic as _anth
-        client = _anth.Anthropic(api_key=settings.ANTHROPIC_API_KEY)
-        response = client.messages.create(
-            model="claude-haiku-4-5-20251001",
+        response = claude_message(
+            model=claude_model('micro'),
             max_tokens=30,
             system=(
                 "Convert the topic into a short English image search query (3-5 words) "
@@ -348,15 +353,15 @@ def _build_image_search_query(post_content: str, topic: str) -> str:
 def _try_tavily_image(query: str) -> dict | None:
     """Search for images via Tavily and download the best one as base64."""
     try:
-        from tavily import TavilyClient
-        client = TavilyClient(api_key=settings.TAVILY_API_KEY)
-        response = client.search(
-            query=query,
-            search_depth="basic",
-            max_results=3,
-            include_images=True,
-            include_answer=False,
-        )
+        client = get_client('tavily')
+        with guard('tavily'):
+            response = client.search(
+                query=query,
+                search_depth="basic",
+                max_results=3,
+                include_images=True,
+                include_answer=False,
+            )
 
         images = response.get('images', [])
         if not images:
@@ -450,18 +455,18 @@ def _build_image_prompt(post_content: str, topic: str) -> str:
 def _try_gemini_image(prompt: str) -> dict | None:
     """Try generating image via Gemini."""
     try:
-        from google import genai
         from google.genai import types
 
-        client = genai.Client(api_key=settings.GOOGLE_API_KEY)
+        client = get_client('gemini')
 
-        response = client.models.generate_content(
-            model="gemini-2.5-flash-image",
-            contents=[prompt],
-            config=types.GenerateContentConfig(
-                response_modalities=["TEXT", "IMAGE"],
+        with guard('gemini-image'):
+            response = client.models.generate_content(
+                model="gemini-2.5-flash-image",
+                contents=[prompt],
+                config=types.GenerateContentConfig(
+                    response_modalities=["TEXT", "IMAGE"],
+                )
             )
-        )
 
         for part in response.candidates[0].content.parts:
             if part.inline_data and part.inline_data.mime_type.startswith('image/'):
@@ -485,12 +490,15 @@ def _try_hf_image(prompt: str) -> dict | None:
             f"{prompt}"
         )
 
-        resp = requests.post(
-            "https://router.huggingface.co/hf-inference/models/black-forest-labs/FLUX.1-schnell",
-            headers={"Authorization": f"Bearer {settings.HF_TOKEN}"},
-            json={"inputs": full_prompt, "parameters": {"width": 1024, "height": 1024}},
-            timeout=60,
-        )
+        with guard('huggingface-flux') as call:
+            resp = get_client('huggingface').post(
+                "https://router.huggingface.co/hf-inference/models/black-forest-labs/FLUX.1-schnell",
+                headers={"Authorization": f"Bearer {settings.HF_TOKEN}"},
+                json={"inputs": full_prompt, "parameters": {"width": 1024, "height": 1024}},
+                timeout=60,
+            )
+            if resp.status_code == 429 or resp.status_code >= 500:
+                call.mark_failed()
 
         if resp.status_code != 200:
             _img_logger.warning(f"HF image failed: status {resp.status_code}")
@@ -11,7 +11,10 @@ from django.conf import settings
 import anthropic
 
 from .views import get_user_context
+from .llm import claude_message, claude_model
 from .billing import check_generation_limit, increment_usage, get_plan_limits
+from .prompts import SystemPrompt
+from .tokens import fit_context
 
 logger = logging.getLogger(__name__)
 
@@ -86,6 +89,60 @@ INFOGRAPHIC_TEMPLATE_INSTRUCTIONS = {
 }
 
 
+# Static rules and schema of the infographic system prompt
+_INFOGRAPHIC_RULES = """Tu es un expert en creation de contenu visuel LinkedIn.
+Tu generes le contenu structure d'une infographie au format JSON strict.
+
+REGLES DE CONTENU:
+- Le titre principal doit etre ACCROCHEUR et court (8-12 mots max)
+- Le sous-titre explique la valeur en 1 phrase courte
+- Chaque item a un titre COURT (3-6 mots) et une description CONCISE (15-25 mots)
+- Le contenu doit etre en francais
+- Le footer_cta est une invitation a suivre/partager (ex: "Suivez-moi pour plus de conseils")
+- Adapte le ton indique plus bas
+
+REGLES TECHNIQUES:
+- Retourne UNIQUEMENT du JSON valide, sans markdown, sans backticks, sans commentaire
+- Genere exactement le nombre d'items indique plus bas
+- Chaque item a obligatoirement: number (int), title (str), description (str)
+- Champs optionnels par item: emoji (str, 1 emoji), stat_value (str, chiffre cle), category (str, "left" ou "right")
+- Le champ "template" dans la reponse indique le layout choisi
+
+SCHEMA JSON A RESPECTER:
+{
+  "infographic": {
+    "title": "Titre accrocheur de l'infographie",
+    "subtitle": "Sous-titre explicatif court",
+    "template": "grid-numbered",
+    "items": [
+      { "number": 1, "title": "Concept cle", "description": "Description courte et actionnable.", "emoji": "🎯" },
+      { "number": 2, "title": "Autre concept", "description": "Explication concise.", "stat_value": "78%", "category": "left" }
+    ],
+    "footer_cta": "Suivez-moi pour plus de conseils"
+  }
+}"""
+
+# Static part of the infographic system prompt, shared with autopilot. Every layout is
+# listed here and the tail names the one to apply, so the prefix is the same for all
+# requests and long enough for Anthropic's prompt cache.
+INFOGRAPHIC_SYSTEM_PREFIX = "\n\n".join([
+    _INFOGRAPHIC_RULES,
+    "LAYOUTS D'INFOGRAPHIE (applique le layout indique plus bas; sinon choisis le plus adapte au sujet):",
+    *(instructions.strip() if f'"{name}"' in instructions else f'{instructions.strip()}\n- Le template est "{name}"'
+      for name, instructions in INFOGRAPHIC_TEMPLATE_INSTRUCTIONS.items()),
+])
+
+
+def build_infographic_system_prompt(tone, num_items, template="", user_context="", *extra_context):
+    """Infographic system prompt: static rules, schema and layouts, then tone, item count, layout and context."""
+    tail = [f"TON : {tone}", f"NOMBRE D'ITEMS : exactement {num_items}"]
+    if template in INFOGRAPHIC_TEMPLATE_INSTRUCTIONS:
+        tail.append(f'LAYOUT A APPLIQUER : "{template}"')
+    user_context, *extra_context = fit_context(user_context, *extra_context)
+    tail.append(user_context)
+    return SystemPrompt(INFOGRAPHIC_SYSTEM_PREFIX).with_context(*tail, *extra_context)
+
+
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 @parser_classes([JSONParser])
@@ -117,50 +174,13 @@ def generate_infographic(request):
 
     user_context = get_user_context(request)
 
-    template_block = ""
-    if template and template in INFOGRAPHIC_TEMPLATE_INSTRUCTIONS:
-        template_block = f"\n\n{INFOGRAPHIC_TEMPLATE_INSTRUCTIONS[template]}\n"
-
-    system_prompt = f"""Tu es un expert en creation de contenu visuel LinkedIn.
-Tu generes le contenu structure d'une infographie au format JSON strict.
-
-REGLES DE CONTENU:
-- Le titre principal doit etre ACCROCHEUR et court (8-12 mots max)
-- Le sous-titre explique la valeur en 1 phrase courte
-- Chaque item a un titre COURT (3-6 mots) et une description CONCISE (15-25 mots)
-- Le contenu doit etre en francais
-- Le footer_cta est une invitation a suivre/partager (ex: "Suivez-moi pour plus de conseils")
-- Adapte le ton: {tone}
-{template_block}
-REGLES TECHNIQUES:
-- Retourne UNIQUEMENT du JSON valide, sans markdown, sans backticks, sans commentaire
-- Genere exactement {num_items} items
-- Chaque item a obligatoirement: number (int), title (str), description (str)
-- Champs optionnels par item: emoji (str, 1 emoji), stat_value (str, chiffre cle), category (str, "left" ou "right")
-- Le champ "template" dans la reponse indique le layout choisi
-
-SCHEMA JSON A RESPECTER:
-{{
-  "infographic": {{
-    "title": "Titre accrocheur de l'infographie",
-    "subtitle": "Sous-titre explicatif court",
-    "template": "grid-numbered",
-    "items": [
-      {{ "number": 1, "title": "Concept cle", "description": "Description courte et actionnable.", "emoji": "🎯" }},
-      {{ "number": 2, "title": "Autre concept", "description": "Explication concise.", "stat_value": "78%", "category": "left" }}
-    ],
-    "footer_cta": "Suivez-moi pour plus de conseils"
-  }}
-}}
-
-{user_context}"""
+    system_prompt = build_infographic_system_prompt(tone, num_items, template, user_context)
 
     user_message = f"Cree une infographie LinkedIn de {num_items} elements sur le sujet suivant:\n\n{topic}"
 
     try:
-        client = anthropic.Anthropic(api_key=settings.ANTHROPIC_API_KEY)
-        response = client.messages.create(
-            model="claude-sonnet-4-20250514",
+        response = claude_message(
+            model=claude_model('long_form'),
             max_tokens=2000,
             system=system_prompt,
             messages=[{"role": "user", "content": user_message}],
@@ -271,9 +291,8 @@ Contenu de l'infographie:
 {summary}"""
 
     try:
-        client = anthropic.Anthropic(api_key=settings.ANTHROPIC_API_KEY)
-        response = client.messages.create(
-            model="claude-sonnet-4-20250514",
+        response = claude_message(
+            model=claude_model(),
             max_tokens=1000,
             system=system_prompt,
             messages=[{"role": "user", "content": user_message}],
@@ -0,0 +1,49 @@
+"""
+Page-by-page text extraction for knowledge-base PDF and DOCX uploads.
+
+Pages (PDF) and paragraphs (DOCX) are yielded one at a time and collected
+until the character budget is reached, so the rest of a long document is
+never parsed. Parsing is CPU-bound: knowledge_base runs extract_document in a
+process pool, which is why this module imports nothing from Django.
+"""
+from io import BytesIO
+from typing import Iterator
+
+
+def iter_pdf_pages(raw: bytes) -> Iterator[str]:
+    """Text of each PDF page, parsed lazily."""
+    from PyPDF2 import PdfReader
+    reader = PdfReader(BytesIO(raw))
+    for page in reader.pages:
+        text = page.extract_text()
+        if text:
+            yield text
+
+
+def iter_docx_paragraphs(raw: bytes) -> Iterator[str]:
+    """Non-empty DOCX paragraphs, in order."""
+    from docx import Document
+    doc = Document(BytesIO(raw))
+    for paragraph in doc.paragraphs:
+        if paragraph.text.strip():
+            yield paragraph.text
+
+
+def collect(pieces: Iterator[str], limit: int, separator: str = "\n\n") -> str:
+    """Join pieces until limit characters, then stop pulling from the generator."""
+    kept, length = [], 0
+    for piece in pieces:
+        kept.append(piece)
+        length += len(piece) + len(separator)
+        if length >= limit:
+            break
+    return separator.join(kept)[:limit]
+
+
+def extract_document(source_type: str, raw: bytes, limit: int) -> str:
+    """Text of a PDF or DOCX file, at most limit characters (process pool entry point)."""
+    if source_type == 'pdf':
+        return collect(iter_pdf_pages(raw), limit)
+    if source_type == 'docx':
+        return collect(iter_docx_paragraphs(raw), limit)
+    raise ValueError(f"Type de source non supporté: {source_type}")
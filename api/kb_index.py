@@ -0,0 +1,314 @@
+"""
+Per-user approximate nearest-neighbour index for the knowledge base.
+
+Each user's normalized chunk vectors live in memory-mapped files under
+KB_INDEX_DIR, so retrieval no longer loads every vector from the database.
+Small KBs are scanned exactly from the mapped matrix. From KB_INDEX_IVF_MIN_CHUNKS
+chunks the index is an IVF-flat: rows are grouped around spherical k-means
+centroids (and stored sorted by group), and a query only scores the
+KB_INDEX_NPROBE closest groups.
+
+Within a generation the files are append-only: process_document appends rows,
+delete_document tombstones their ids in place. A rebuild (compaction and
+re-training, after enough growth or deletions) writes a new generation and then
+swaps meta.json, so readers never see a half-written index. Searches hold a
+shared lock on their generation's readers file, and a writer only deletes an
+old generation once it can lock that file exclusively; otherwise a later write
+retires it. Retrieval falls back to the exact database path when the index is
+missing, disagrees with the database row count, or cannot be read.
+"""
+import fcntl
+import json
+import math
+import os
+from contextlib import contextmanager
+
+import numpy as np
+from django.conf import settings
+
+from . import vectors
+
+META = 'meta.json'
+FILES = {
+    'vectors': ('f32', np.float32),
+    'ids': ('i64', np.int64),
+    'lists': ('i32', np.int32),
+    'centroids': ('f32', np.float32),
+}
+# Rebuild when the index doubled since training, or a third of its rows are deleted
+REBUILD_GROWTH = 2.0
+REBUILD_DELETED_RATIO = 0.3
+KMEANS_ITERATIONS = 10
+KMEANS_SAMPLE_PER_LIST = 64
+
+
+def _dir(user_id):
+    return os.path.join(settings.KB_INDEX_DIR, str(user_id))
+
+
+def _path(user_id, name, gen):
+    return os.path.join(_dir(user_id), f"{name}.{gen}.{FILES[name][0]}")
+
+
+@contextmanager
+def _locked(user_id):
+    """Writers of one user's index are serialized across workers with a file lock."""
+    os.makedirs(_dir(user_id), exist_ok=True)
+    with open(os.path.join(_dir(user_id), 'lock'), 'w') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _readers_path(user_id, gen):
+    return os.path.join(_dir(user_id), f"readers.{gen}.lock")
+
+
+@contextmanager
+def _reading(user_id, gen):
+    """Shared lock keeping one generation's files on disk while a search maps them."""
+    with open(_readers_path(user_id, gen), 'a') as f:
+        fcntl.flock(f, fcntl.LOCK_SH)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _retire(user_id, current_gen):
+    """Delete the files of older generations that no search is reading any more."""
+    stale = {}
+    for name in os.listdir(_dir(user_id)):
+        kind, _, rest = name.partition('.')
+        gen = rest.split('.')[0]
+        if (kind in FILES or kind == 'readers') and gen.isdigit() and int(gen) < current_gen:
+            paths = stale.setdefault(int(gen), [])
+            if kind in FILES:
+                paths.append(os.path.join(_dir(user_id), name))
+    for gen, paths in stale.items():
+        readers = _readers_path(user_id, gen)
+        with open(readers, 'a') as f:
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                continue  # still mapped by a search, retired by a later write
+            for path in [*paths, readers]:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+
+
+def _read_meta(user_id):
+    try:
+        with open(os.path.join(_dir(user_id), META)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def _write_meta(user_id, meta):
+    path = os.path.join(_dir(user_id), META)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, 'w') as f:
+        json.dump(meta, f)
+    os.replace(tmp, path)
+
+
+def _row_bytes(name, meta):
+    width = meta['dims'] if name in ('vectors', 'centroids') else 1
+    return width * np.dtype(FILES[name][1]).itemsize
+
+
+def _map(user_id, name, meta, rows, mode='r'):
+    dtype = FILES[name][1]
+    shape = (rows, meta['dims']) if name in ('vectors', 'centroids') else (rows,)
+    if rows == 0:
+        return np.empty(shape, dtype=dtype)
+    return np.memmap(_path(user_id, name, meta['gen']), dtype=dtype, mode=mode, shape=shape)
+
+
+# ---------------------------------------------------------------------------
+# IVF training
+# ---------------------------------------------------------------------------
+
+def _assign(matrix, centroids, batch=8192):
+    lists = np.empty(len(matrix), dtype=np.int32)
+    for start in range(0, len(matrix), batch):
+        lists[start:start + batch] = np.argmax(matrix[start:start + batch] @ centroids.T, axis=1)
+    return lists
+
+
+def _train(matrix):
+    """Spherical k-means on a sample: sqrt(n) unit-length centroids."""
+    rng = np.random.default_rng(0)
+    nlist = int(min(max(math.sqrt(len(matrix)), 16), 1024))
+    sample_size = min(len(matrix), nlist * KMEANS_SAMPLE_PER_LIST)
+    sample = matrix[np.sort(rng.choice(len(matrix), sample_size, replace=False))]
+    centroids = sample[rng.choice(len(sample), nlist, replace=False)].copy()
+    for _ in range(KMEANS_ITERATIONS):
+        assigned = _assign(sample, centroids)
+        order = np.argsort(assigned, kind='stable')
+        grouped = assigned[order]
+        starts = np.flatnonzero(np.r_[True, grouped[1:] != grouped[:-1]])
+        sums = np.add.reduceat(sample[order], starts, axis=0)
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        # Empty lists keep their previous centroid
+        centroids[grouped[starts]] = sums / np.where(norms == 0, 1, norms)
+    return centroids
+
+
+# ---------------------------------------------------------------------------
+# Writes
+# ---------------------------------------------------------------------------
+
+def _write_generation(user_id, chunk_ids, matrix, previous=None):
+    """Write a full, compacted index as a new generation, then retire the previous one."""
+    gen = (previous['gen'] + 1) if previous else 1
+    ids = np.asarray(chunk_ids, dtype=np.int64)
+    matrix = np.ascontiguousarray(matrix, dtype=np.float32)
+    dims = int(matrix.shape[1]) if matrix.ndim == 2 else 0
+    if len(ids) >= settings.KB_INDEX_IVF_MIN_CHUNKS:
+        centroids = _train(matrix)
+        lists = _assign(matrix, centroids)
+        # Rows of one list are contiguous on disk, so a probe reads few pages
+        order = np.argsort(lists, kind='stable')
+        ids, matrix, lists = ids[order], matrix[order], lists[order]
+    else:
+        centroids = np.empty((0, dims), dtype=np.float32)
+        lists = np.zeros(len(ids), dtype=np.int32)
+
+    meta = {
+        'gen': gen,
+        'dims': dims,
+        'count': len(ids),
+        'deleted': 0,
+        'trained': len(ids),
+        'nlist': len(centroids),
+    }
+    for name, array in (('vectors', matrix), ('ids', ids), ('lists', lists), ('centroids', centroids)):
+        array.tofile(_path(user_id, name, gen))
+    _write_meta(user_id, meta)
+    _retire(user_id, gen)
+    return meta
+
+
+def _live_rows(user_id, meta):
+    ids = _map(user_id, 'ids', meta, meta['count'])
+    keep = np.flatnonzero(ids >= 0)
+    return np.asarray(ids[keep]), np.asarray(_map(user_id, 'vectors', meta, meta['count'])[keep])
+
+
+def rebuild(user_id, chunk_ids, matrix):
+    """Replace the user's index with these rows (matrix of normalized vectors)."""
+    with _locked(user_id):
+        _write_generation(user_id, chunk_ids, matrix, _read_meta(user_id))
+
+
+def add(user_id, chunk_ids, matrix):
+    """Append newly embedded chunks to the user's index."""
+    if not len(chunk_ids):
+        return
+    matrix = np.ascontiguousarray(matrix, dtype=np.float32)
+    with _locked(user_id):
+        meta = _read_meta(user_id)
+        if meta is None or not meta['count'] or meta['dims'] != matrix.shape[1]:
+            # A new embedding size makes the old rows useless: search sees the
+            # count mismatch and the next retrieval rebuilds from the database
+            _write_generation(user_id, chunk_ids, matrix, meta)
+            return
+
+        count = meta['count'] + len(chunk_ids)
+        if count >= settings.KB_INDEX_IVF_MIN_CHUNKS and count > meta['trained'] * REBUILD_GROWTH:
+            old_ids, old_matrix = _live_rows(user_id, meta)
+            _write_generation(
+                user_id, np.concatenate([old_ids, chunk_ids]), np.vstack([old_matrix, matrix]), meta,
+            )
+            return
+
+        if meta['nlist']:
+            lists = _assign(matrix, _map(user_id, 'centroids', meta, meta['nlist']))
+        else:
+            lists = np.zeros(len(chunk_ids), dtype=np.int32)
+        for name, array in (
+            ('vectors', matrix),
+            ('ids', np.asarray(chunk_ids, dtype=np.int64)),
+            ('lists', lists),
+        ):
+            path = _path(user_id, name, meta['gen'])
+            # Drop rows an interrupted append left past meta['count'], so the
+            # three files stay aligned row for row
+            os.truncate(path, meta['count'] * _row_bytes(name, meta))
+            with open(path, 'ab') as f:
+                array.tofile(f)
+        meta['count'] = count
+        _write_meta(user_id, meta)
+        _retire(user_id, meta['gen'])
+
+
+def remove(user_id, chunk_ids):
+    """Tombstone deleted chunks; compacts the index once enough rows are dead."""
+    with _locked(user_id):
+        meta = _read_meta(user_id)
+        if meta is None or not meta['count'] or not chunk_ids:
+            return
+        ids = _map(user_id, 'ids', meta, meta['count'], mode='r+')
+        dead = np.isin(ids, np.asarray(chunk_ids, dtype=np.int64))
+        removed = int(dead.sum())
+        if not removed:
+            return
+        ids[dead] = -1
+        ids.flush()
+        del ids
+        meta['deleted'] += removed
+        if meta['deleted'] > meta['count'] * REBUILD_DELETED_RATIO:
+            live_ids, live_matrix = _live_rows(user_id, meta)
+            _write_generation(user_id, live_ids, live_matrix, meta)
+            return
+        _write_meta(user_id, meta)
+        _retire(user_id, meta['gen'])
+
+
+# ---------------------------------------------------------------------------
+# Search
+# ---------------------------------------------------------------------------
+
+def search(user_id, query, k, expected_count):
+    """
+    Chunk ids of the k nearest chunks, best first, or None when the index is
+    missing or stale (its live row count differs from expected_count). Errors
+    reading the files (OSError, ValueError) propagate to the caller.
+    """
+    for _attempt in range(3):
+        meta = _read_meta(user_id)
+        if meta is None or meta['count'] - meta['deleted'] != expected_count:
+            return None
+        if not expected_count:
+            return []
+        if meta['dims'] != len(query):
+            return None
+        with _reading(user_id, meta['gen']):
+            current = _read_meta(user_id)
+            if current is None or current['gen'] != meta['gen']:
+                continue  # a rebuild swapped generations before the lock was taken
+            return _search(user_id, meta, query, k)
+    return None
+
+
+def _search(user_id, meta, query, k):
+    ids = _map(user_id, 'ids', meta, meta['count'])
+    matrix = _map(user_id, 'vectors', meta, meta['count'])
+    if meta['nlist']:
+        centroids = _map(user_id, 'centroids', meta, meta['nlist'])
+        probe, _ = vectors.top_k(centroids, query, settings.KB_INDEX_NPROBE)
+        lists = _map(user_id, 'lists', meta, meta['count'])
+        rows = np.flatnonzero(np.isin(lists, probe) & (ids >= 0))
+        indices, _ = vectors.top_k(matrix[rows], query, k)
+        return ids[rows[indices]].tolist()
+
+    scores = matrix @ query
+    scores[ids < 0] = -np.inf
+    indices, _ = vectors.best(scores, k)
+    return ids[indices].tolist()
@@ -0,0 +1,252 @@
+"""
+Per-user BM25 inverted index over knowledge-base chunk contents.
+
+It has two roles in retrieval. For large KBs it is a lexical prefilter: only
+the KB_LEXICAL_CANDIDATES best BM25 chunks are vector-scored, and both rankings
+are merged by reciprocal-rank fusion. When the embedding provider is down, it
+ranks chunks on its own, with no API call.
+
+Each user's index is an append-only JSON-lines log under KB_INDEX_DIR (one
+line per ingested document or deletion), rewritten without the deleted chunks
+once a third of them are dead. Every rewrite starts the log with a new
+generation number. Workers keep the parsed index in memory and only read the
+lines appended since their last search, starting over when the generation (or
+the inode) of the log changed. The inode alone is not enough, because the
+filesystem may give a replaced log's inode to the next rewrite. As with kb_index,
+search returns None when the index disagrees with the database row count, and
+retrieval rebuilds it.
+"""
+import fcntl
+import json
+import math
+import os
+import re
+import threading
+import unicodedata
+from collections import Counter, OrderedDict
+from contextlib import contextmanager
+
+from django.conf import settings
+
+LOG = 'lexical.jsonl'
+# BM25 parameters (usual defaults)
+K1 = 1.2
+B = 0.75
+# Reciprocal-rank fusion constant
+RRF_K = 60
+COMPACT_DELETED_RATIO = 0.3
+
+STOPWORDS = frozenset("""
+    au aux avec ce ces dans de des du elle en et eux il ils je la le les leur lui ma mais me meme mes moi mon
+    ne nos notre nous on ou par pas pour qu que qui sa se ses son sur ta te tes toi ton tu un une vos votre
+    vous est sont ete etre avoir ont plus cette cet comme tout tous aussi bien fait peut
+    the and for are but not you all any can had her was one our out has have with this that from they
+    will would there their what which when your into than then them these some its also been were
+""".split())
+
+_WORD = re.compile(r'\w+')
+
+_lock = threading.Lock()
+_cache = OrderedDict()  # user_id -> _Index
+
+
+def tokenize(text: str) -> list[str]:
+    """Lowercased, accent-free words of 2+ characters, stopwords removed."""
+    text = unicodedata.normalize('NFKD', text.lower())
+    text = ''.join(c for c in text if not unicodedata.combining(c))
+    return [word for word in _WORD.findall(text) if len(word) > 1 and word not in STOPWORDS]
+
+
+def _dir(user_id):
+    return os.path.join(settings.KB_INDEX_DIR, str(user_id))
+
+
+def _path(user_id):
+    return os.path.join(_dir(user_id), LOG)
+
+
+@contextmanager
+def _locked(user_id):
+    """Writers of one user's log are serialized across workers with a file lock."""
+    os.makedirs(_dir(user_id), exist_ok=True)
+    with open(os.path.join(_dir(user_id), 'lexical.lock'), 'w') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _entry(chunk_id, content):
+    terms = tokenize(content)
+    return [chunk_id, len(terms), dict(Counter(terms))]
+
+
+# ---------------------------------------------------------------------------
+# In-memory index
+# ---------------------------------------------------------------------------
+
+def _generation(f):
+    """Generation number from the first line of an open log (0 for logs written before generations)."""
+    first = f.readline()
+    return json.loads(first).get('gen', 0) if first else 0
+
+
+class _Index:
+    """Postings parsed from one log file, extended as lines are appended to it."""
+
+    def __init__(self, key):
+        self.key = key  # (inode, generation) of the log
+        self.offset = 0
+        self.postings = {}  # term -> {chunk_id: term frequency}
+        self.lengths = {}  # live chunk_id -> number of terms
+        self.total_length = 0
+        self.removed = 0
+
+    def apply(self, record):
+        for chunk_id, length, terms in record.get('add', ()):
+            if chunk_id in self.lengths:
+                continue
+            self.lengths[chunk_id] = length
+            self.total_length += length
+            for term, tf in terms.items():
+                self.postings.setdefault(term, {})[chunk_id] = tf
+        for chunk_id in record.get('remove', ()):
+            length = self.lengths.pop(chunk_id, None)
+            if length is not None:
+                self.total_length -= length
+                self.removed += 1
+
+    def read(self, f):
+        """Apply the complete lines written to the open log since the last read."""
+        f.seek(self.offset)
+        data = f.read()
+        end = data.rfind(b'\n') + 1  # a writer may be mid-line
+        for line in data[:end].splitlines():
+            self.apply(json.loads(line))
+        self.offset += end
+
+    def score(self, terms):
+        """BM25 score of every live chunk containing a query term, as {chunk_id: score}."""
+        n = len(self.lengths)
+        if not n:
+            return {}
+        average = self.total_length / n
+        scores = {}
+        for term in set(terms):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+            for chunk_id, tf in postings.items():
+                length = self.lengths.get(chunk_id)
+                if length is None:
+                    continue  # deleted, dropped at the next compaction
+                norm = tf * (K1 + 1) / (tf + K1 * (1 - B + B * length / average))
+                scores[chunk_id] = scores.get(chunk_id, 0.0) + idf * norm
+        return scores
+
+
+def _load(user_id):
+    """The user's index, refreshed from its log, or None when there is no log."""
+    try:
+        f = open(_path(user_id), 'rb')
+    except FileNotFoundError:
+        return None
+    # One open file for the checks and the read, so a concurrent rewrite cannot
+    # swap the log in between
+    with f, _lock:
+        stat = os.fstat(f.fileno())
+        key = (stat.st_ino, _generation(f))
+        index = _cache.get(user_id)
+        if index is None or index.key != key or stat.st_size < index.offset:
+            # First use in this worker, or the log was rewritten by a rebuild or compaction
+            index = _Index(key)
+        index.read(f)
+        _cache[user_id] = index
+        _cache.move_to_end(user_id)
+        while len(_cache) > settings.KB_LEXICAL_CACHE_USERS:
+            _cache.popitem(last=False)
+        return index
+
+
+# ---------------------------------------------------------------------------
+# Writes
+# ---------------------------------------------------------------------------
+
+def _rewrite(user_id, entries):
+    """Replace the log with a new generation holding these entries (callers hold the lock)."""
+    path = _path(user_id)
+    try:
+        with open(path, 'rb') as f:
+            gen = _generation(f) + 1
+    except FileNotFoundError:
+        gen = 1
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, 'w') as f:
+        f.write(json.dumps({'gen': gen}) + '\n')
+        if entries:
+            f.write(json.dumps({'add': entries}) + '\n')
+    os.replace(tmp, path)
+
+
+def rebuild(user_id, rows):
+    """Replace the user's index with these (chunk_id, content) rows."""
+    with _locked(user_id):
+        _rewrite(user_id, [_entry(chunk_id, content) for chunk_id, content in rows])
+
+
+def add(user_id, rows):
+    """Index newly stored (chunk_id, content) rows."""
+    entries = [_entry(chunk_id, content) for chunk_id, content in rows]
+    if not entries:
+        return
+    with _locked(user_id):
+        with open(_path(user_id), 'a') as f:
+            f.write(json.dumps({'add': entries}) + '\n')
+
+
+def remove(user_id, chunk_ids):
+    """Record deleted chunks; rewrites the log once enough of it is dead."""
+    if not chunk_ids:
+        return
+    with _locked(user_id):
+        if not os.path.exists(_path(user_id)):
+            return
+        with open(_path(user_id), 'a') as f:
+            f.write(json.dumps({'remove': list(chunk_ids)}) + '\n')
+        index = _load(user_id)
+        if index.removed > (len(index.lengths) + index.removed) * COMPACT_DELETED_RATIO:
+            live = []
+            with open(_path(user_id)) as f:
+                for line in f:
+                    live.extend(
+                        entry for entry in json.loads(line).get('add', ()) if entry[0] in index.lengths
+                    )
+            _rewrite(user_id, live)
+
+
+# ---------------------------------------------------------------------------
+# Search
+# ---------------------------------------------------------------------------
+
+def search(user_id, query: str, k: int, expected_count: int):
+    """
+    Chunk ids of the k best BM25 matches for the query, best first (fewer when
+    few chunks share a term with it), or None when the index is missing or
+    stale (its live chunk count differs from expected_count).
+    """
+    index = _load(user_id)
+    if index is None or len(index.lengths) != expected_count:
+        return None
+    scores = index.score(tokenize(query))
+    return sorted(scores, key=scores.get, reverse=True)[:k]
+
+
+def fuse(*rankings, k: int) -> list:
+    """Reciprocal-rank fusion of several best-first id lists, top k ids."""
+    scores = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking):
+            scores[item] = scores.get(item, 0.0) + 1 / (RRF_K + rank + 1)
+    return sorted(scores, key=scores.get, reverse=True)[:k]
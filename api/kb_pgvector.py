@@ -0,0 +1,101 @@
+"""
+pgvector backend for knowledge-base similarity search (PostgreSQL only).
+
+Migration 0027 adds an `embedding_vector vector(1536)` column with an HNSW
+cosine index when the database is PostgreSQL and the `vector` extension can be
+installed. The column is not a Django model field, so SQLite and databases
+without pgvector keep working unchanged with the NumPy path (kb_index.py).
+KB_VECTOR_BACKEND forces a backend ('pgvector' or 'numpy'); 'auto' uses
+pgvector whenever the column exists.
+
+The table holds every user's chunks, and HNSW applies the user/status filter
+to the candidates it scanned, so a plain ORDER BY ... LIMIT k can come back
+short. Searches enable iterative scans (pgvector >= 0.8) and widen ef_search
+for the transaction; retrieval still falls back to the exact NumPy search when
+fewer than k rows come back.
+"""
+import logging
+
+from django.conf import settings
+from django.db import connection, transaction
+
+logger = logging.getLogger(__name__)
+
+DIMENSIONS = 1536
+TABLE = 'api_knowledgebasechunk'
+COLUMN = 'embedding_vector'
+INDEX = 'api_kbchunk_embedding_hnsw'
+
+_available = None
+_version = None
+
+
+def available() -> bool:
+    """True when similarity search should run in PostgreSQL. Checked once per process."""
+    global _available
+    backend = settings.KB_VECTOR_BACKEND
+    if backend == 'numpy' or connection.vendor != 'postgresql':
+        return False
+    if _available is None:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT 1 FROM information_schema.columns WHERE table_name = %s AND column_name = %s",
+                [TABLE, COLUMN],
+            )
+            _available = cursor.fetchone() is not None
+        if not _available and backend == 'pgvector':
+            logger.warning("KB_VECTOR_BACKEND=pgvector but the embedding_vector column is missing, using NumPy")
+    return _available
+
+
+def to_literal(vector) -> str:
+    """pgvector text input format: '[0.1,0.2,...]'."""
+    return '[' + ','.join(f'{float(x):.7g}' for x in vector) + ']'
+
+
+def store(chunk_ids, matrix):
+    """Write normalized vectors to the pgvector column of the given chunks."""
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f"UPDATE {TABLE} SET {COLUMN} = %s::vector WHERE id = %s",
+            [(to_literal(vector), chunk_id) for chunk_id, vector in zip(chunk_ids, matrix)],
+        )
+
+
+def _extension_version():
+    """(major, minor) of the installed vector extension. Checked once per process."""
+    global _version
+    if _version is None:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT extversion FROM pg_extension WHERE extname = 'vector'")
+            row = cursor.fetchone()
+        _version = tuple(int(part) for part in row[0].split('.')[:2]) if row else (0, 0)
+    return _version
+
+
+def search(user_id, query, k) -> list[int]:
+    """
+    Ids of the k chunks of ready documents closest to the query (cosine distance), best first.
+    May return fewer than k ids when the filtered scan runs out of candidates.
+    """
+    with transaction.atomic(), connection.cursor() as cursor:
+        # set_config(..., true) is SET LOCAL: the settings end with the transaction
+        if _extension_version() >= (0, 8):
+            cursor.execute("SELECT set_config('hnsw.iterative_scan', 'relaxed_order', true)")
+        ef_search = min(max(settings.KB_PGVECTOR_EF_SEARCH, k), 1000)
+        cursor.execute("SELECT set_config('hnsw.ef_search', %s, true)", [str(ef_search)])
+        # relaxed_order can return rows slightly out of order: re-sort the k found
+        cursor.execute(
+            f"""
+            WITH nearest AS MATERIALIZED (
+                SELECT c.id, c.{COLUMN} <=> %s::vector AS distance FROM {TABLE} c
+                JOIN api_knowledgebasedocument d ON d.id = c.document_id
+                WHERE c.user_id = %s AND d.status = 'ready' AND c.{COLUMN} IS NOT NULL
+                ORDER BY distance
+                LIMIT %s
+            )
+            SELECT id FROM nearest ORDER BY distance
+            """,
+            [to_literal(query), user_id, k],
+        )
+        return [row[0] for row in cursor.fetchall()]
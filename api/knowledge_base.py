@@ -1,22 +1,41 @@
 """
 Knowledge Base — Upload, chunk, embed, and retrieve documents for autopilot context.
 
-Pipeline: Upload → Parse → Chunk (500 tokens) → Embed (OpenAI) → Store (pgvector)
-Retrieval: Embed topic → Cosine similarity search → Top-K chunks → Inject in prompt
+Pipeline: Upload → queued in the background → Parse (page by page, process pool) → Chunk (500 tokens) → Embed (OpenAI, concurrent batches)
+→ Store (packed vectors, see vectors.py), with progress saved on the document
+Retrieval: Embed topic → pgvector HNSW on PostgreSQL, else per-user ANN index (kb_index.py, exact fallback) → Top-K chunks → Inject in prompt
+Large KBs: BM25 top candidates (kb_lexical.py) → vector-scored → reciprocal-rank fusion; BM25 alone if embedding fails
 """
 import base64
+import contextvars
 import logging
-from io import BytesIO
-
+import multiprocessing
+import os
+import random
+import re
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from datetime import timedelta
+from typing import Iterable, Iterator
+
+import numpy as np
 import requests as http_requests
-import tiktoken
 from django.conf import settings
+from django.db import connection
+from django.utils import timezone
 from rest_framework import status
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 
 from .models import KnowledgeBaseDocument, KnowledgeBaseChunk
+from .llm import get_client
+from .circuit_breaker import guard
+from .ledger import note_usage, scope as ledger_scope, track
+from .tokens import get_encoding, trim_to_tokens
+from . import embedding_cache, kb_extract, kb_index, kb_lexical, kb_pgvector, vectors
 from .repurpose import is_safe_url, extract_article_content
 
 logger = logging.getLogger(__name__)
@@ -29,30 +48,43 @@ MAX_TEXT_LENGTH = 100_000  # ~25K tokens
 # Text extraction
 # ---------------------------------------------------------------------------
 
-def _extract_text_from_pdf(content_b64: str) -> str:
-    """Extract text from a base64-encoded PDF."""
-    from PyPDF2 import PdfReader
+def _decode_file(content_b64: str) -> bytes:
     raw = base64.b64decode(content_b64)
     if len(raw) > MAX_FILE_SIZE:
         raise ValueError("Fichier trop volumineux (max 5 MB)")
-    reader = PdfReader(BytesIO(raw))
-    pages = []
-    for page in reader.pages:
-        text = page.extract_text()
-        if text:
-            pages.append(text)
-    return "\n\n".join(pages)
-
-
-def _extract_text_from_docx(content_b64: str) -> str:
-    """Extract text from a base64-encoded DOCX."""
-    from docx import Document
-    raw = base64.b64decode(content_b64)
-    if len(raw) > MAX_FILE_SIZE:
-        raise ValueError("Fichier trop volumineux (max 5 MB)")
-    doc = Document(BytesIO(raw))
-    paragraphs = [p.text for p in doc.paragraphs if p.text.strip()]
-    return "\n\n".join(paragraphs)
+    return raw
+
+
+_extract_pool = None
+_extract_pool_pid = None
+_extract_pool_lock = threading.Lock()
+
+
+def _extraction_pool() -> ProcessPoolExecutor:
+    """Process pool for PDF/DOCX parsing, one per worker (spawned: workers run threads)."""
+    global _extract_pool, _extract_pool_pid
+    with _extract_pool_lock:
+        if _extract_pool is None or _extract_pool_pid != os.getpid():
+            _extract_pool = ProcessPoolExecutor(
+                max_workers=settings.KB_EXTRACT_PROCESSES,
+                mp_context=multiprocessing.get_context('spawn'),
+            )
+            _extract_pool_pid = os.getpid()
+        return _extract_pool
+
+
+def _extract_text_from_file(source_type: str, content_b64: str) -> str:
+    """Extract text from a base64-encoded PDF or DOCX in the process pool, up to MAX_TEXT_LENGTH."""
+    global _extract_pool
+    raw = _decode_file(content_b64)
+    try:
+        future = _extraction_pool().submit(kb_extract.extract_document, source_type, raw, MAX_TEXT_LENGTH)
+        return future.result(timeout=settings.KB_EXTRACT_TIMEOUT)
+    except BrokenProcessPool:
+        # A parser crashed its process: start a fresh pool for the next document
+        with _extract_pool_lock:
+            _extract_pool = None
+        raise
 
 
 def _extract_text_from_url(url: str) -> str:
@@ -70,10 +102,8 @@ def _extract_text_from_url(url: str) -> str:
 
 def extract_text(source_type: str, content: str = "", url: str = "") -> str:
     """Extract text based on source type. Returns cleaned text."""
-    if source_type == 'pdf':
-        text = _extract_text_from_pdf(content)
-    elif source_type == 'docx':
-        text = _extract_text_from_docx(content)
+    if source_type in ('pdf', 'docx'):
+        text = _extract_text_from_file(source_type, content)
     elif source_type == 'url':
         text = _extract_text_from_url(url)
     elif source_type in ('txt', 'paste'):
@@ -98,35 +128,135 @@ def extract_text(source_type: str, content: str = "", url: str = "") -> str:
 # Chunking
 # ---------------------------------------------------------------------------
 
-def chunk_text(text: str, max_tokens: int = 500, overlap: int = 50) -> list[str]:
-    """Split text into chunks of ~max_tokens with overlap."""
-    enc = tiktoken.get_encoding("cl100k_base")
-    tokens = enc.encode(text)
+# Chunk edges move back to a paragraph, sentence or word break found in the
+# last SNAP_WINDOW of the window; streamed input is split every STREAM_BUFFER_CHARS
+SNAP_WINDOW = 0.4
+STREAM_BUFFER_CHARS = 200_000
+
+_SENTENCE_BREAK = re.compile(r'[.!?…]["»)\]]?\s+')
+
+
+def _token_offsets(text: str, tokens: list[int]) -> np.ndarray:
+    """
+    Character offset where each token starts, plus len(text) at the end. Computed
+    from the token byte lengths and the UTF-8 layout of the text, without decoding.
+    """
+    byte_ends = np.cumsum([len(b) for b in get_encoding().decode_tokens_bytes(tokens)], dtype=np.int64)
+    try:
+        raw = text.encode('utf-8')
+    except UnicodeEncodeError:
+        # Lone surrogates (some PDFs): replaced one for one, as tiktoken does
+        raw = text.encode('utf-16', 'surrogatepass').decode('utf-16', 'replace').encode('utf-8')
+    data = np.frombuffer(raw, dtype=np.uint8)
+    # Characters started before each byte position (continuation bytes are 10xxxxxx)
+    char_at_byte = np.concatenate(([0], np.cumsum((data & 0xC0) != 0x80)))
+    return np.concatenate(([0], char_at_byte[byte_ends]))
+
+
+def _snap_end(text: str, start: int, end: int) -> int:
+    """Move a chunk end back to the last paragraph, sentence or word break near it."""
+    floor = end - int((end - start) * SNAP_WINDOW)
+    paragraph = text.rfind('\n\n', floor, end)
+    if paragraph != -1:
+        return paragraph
+    sentence = None
+    for sentence in _SENTENCE_BREAK.finditer(text, floor, end):
+        pass
+    if sentence:
+        return sentence.end()
+    space = max(text.rfind(' ', floor, end), text.rfind('\n', floor, end))
+    return space if space != -1 else end
+
+
+def _snap_start(text: str, start: int, end: int) -> int:
+    """Move an overlap start forward to the next sentence, or at least word, boundary."""
+    sentence = _SENTENCE_BREAK.search(text, start, end)
+    if sentence:
+        return sentence.end()
+    space = text.find(' ', start, end)
+    return space + 1 if space != -1 else start
+
+
+def _split(text: str, max_tokens: int, overlap: int, final: bool) -> tuple[list[str], int]:
+    """
+    Chunks of at most ~max_tokens cut at natural boundaries. Unless final, the
+    last, possibly incomplete window is left out; returns the chunks and the
+    offset where the text still to be chunked starts.
+    """
+    tokens = get_encoding().encode(text, disallowed_special=())
+    offsets = _token_offsets(text, tokens)
     chunks = []
-    start = 0
-    while start < len(tokens):
-        end = start + max_tokens
-        chunk_tokens = tokens[start:end]
-        chunk_text_str = enc.decode(chunk_tokens)
-        if chunk_text_str.strip():
-            chunks.append(chunk_text_str.strip())
-        start = end - overlap if end < len(tokens) else len(tokens)
-    return chunks
+    start_token, start = 0, 0
+    while start_token < len(tokens):
+        end_token = start_token + max_tokens
+        if end_token >= len(tokens):
+            if not final:
+                return chunks, start
+            end = len(text)
+        else:
+            end = _snap_end(text, start, int(offsets[end_token]))
+        chunk = text[start:end].strip()
+        if chunk:
+            chunks.append(chunk)
+        if end >= len(text):
+            break
+
+        # Next window starts ~overlap tokens before this end, on a boundary
+        next_token = max(int(np.searchsorted(offsets, end, side='right')) - 1 - overlap, start_token + 1)
+        start = _snap_start(text, int(offsets[next_token]), end) if overlap else end
+        start_token = max(int(np.searchsorted(offsets, start)), start_token + 1)
+    return chunks, len(text)
+
+
+def chunk_stream(pieces: Iterable[str], max_tokens: int = 500, overlap: int = 50) -> Iterator[str]:
+    """
+    Chunk text arriving in pieces (pages, paragraphs). Text is tokenized
+    STREAM_BUFFER_CHARS at a time and chunks are yielded as soon as they are cut.
+    """
+    buffer, size = [], 0
+    for piece in pieces:
+        buffer.append(piece)
+        size += len(piece)
+        if size < STREAM_BUFFER_CHARS:
+            continue
+        text = ''.join(buffer)
+        chunks, consumed = _split(text, max_tokens, overlap, final=False)
+        yield from chunks
+        buffer, size = [text[consumed:]], len(text) - consumed
+    yield from _split(''.join(buffer), max_tokens, overlap, final=True)[0]
+
+
+def chunk_text(text: str, max_tokens: int = 500, overlap: int = 50) -> list[str]:
+    """Split text into chunks of ~max_tokens with overlap, cut at paragraph or sentence boundaries."""
+    return list(chunk_stream([text], max_tokens, overlap))
 
 
 # ---------------------------------------------------------------------------
 # Embedding
 # ---------------------------------------------------------------------------
 
-def embed_texts(texts: list[str]) -> list[list[float]]:
-    """Embed texts using OpenAI text-embedding-3-small (1536 dims)."""
-    from openai import OpenAI
-    client = OpenAI(api_key=settings.OPENAI_API_KEY)
-    response = client.embeddings.create(
-        model="text-embedding-3-small",
-        input=texts,
-    )
-    return [item.embedding for item in response.data]
+EMBEDDING_MODEL = "text-embedding-3-small"
+
+
+def embed_texts(texts: list[str]) -> list[np.ndarray]:
+    """
+    Embed texts using OpenAI text-embedding-3-small (1536 dims).
+    Texts already seen (same model, same text) come from the embedding cache.
+    """
+    found = embedding_cache.get_many(EMBEDDING_MODEL, texts)
+    missing = list(dict.fromkeys(text for text in texts if text not in found))
+    if missing:
+        client = get_client('openai')
+        with guard('openai'), track('openai', EMBEDDING_MODEL):
+            response = client.embeddings.create(
+                model=EMBEDDING_MODEL,
+                input=missing,
+            )
+            note_usage(response.usage.prompt_tokens, 0)
+        fresh = {text: np.asarray(item.embedding, dtype=np.float32) for text, item in zip(missing, response.data)}
+        embedding_cache.put_many(EMBEDDING_MODEL, fresh)
+        found.update(fresh)
+    return [found[text] for text in texts]
 
 
 # ---------------------------------------------------------------------------
@@ -134,90 +264,300 @@ def embed_texts(texts: list[str]) -> list[list[float]]:
 # ---------------------------------------------------------------------------
 
 def process_document(document: KnowledgeBaseDocument):
-    """Parse, chunk, embed, and store a document. Updates document status."""
+    """
+    Chunk, embed, and store a document. Updates document status and progress.
+
+    Chunks are embedded in batches of KB_EMBED_BATCH_SIZE, KB_EMBED_CONCURRENCY
+    batches in flight, and each batch is stored as soon as its vectors arrive.
+    """
+    futures = []
     try:
         text = document.raw_text
         if not text.strip():
-            document.status = 'error'
-            document.error_message = 'Aucun texte extrait'
-            document.save(update_fields=['status', 'error_message'])
+            _fail_document(document, 'Aucun texte extrait')
             return
 
         # Chunk
         chunks = chunk_text(text)
         if not chunks:
-            document.status = 'error'
-            document.error_message = 'Impossible de découper le texte en chunks'
-            document.save(update_fields=['status', 'error_message'])
+            _fail_document(document, 'Impossible de découper le texte en chunks')
             return
-
-        # Embed all chunks in one batch
-        embeddings = embed_texts(chunks)
-
-        # Bulk create chunks
-        KnowledgeBaseChunk.objects.bulk_create([
-            KnowledgeBaseChunk(
-                document=document,
-                user=document.user,
-                content=chunk,
-                chunk_index=i,
-                embedding=embedding,
-            )
-            for i, (chunk, embedding) in enumerate(zip(chunks, embeddings))
-        ])
-
-        document.chunk_count = len(chunks)
-        document.status = 'ready'
-        document.save(update_fields=['chunk_count', 'status'])
-        logger.info(f"KB: processed '{document.title}' → {len(chunks)} chunks for {document.user.username}")
+        _set_progress(document, PROGRESS_CHUNKED)
+
+        # Embed bounded batches concurrently, store each one as it completes
+        size = settings.KB_EMBED_BATCH_SIZE
+        batches = [range(start, min(start + size, len(chunks))) for start in range(0, len(chunks), size)]
+        pool = _executor('embed', settings.KB_EMBED_CONCURRENCY)
+        futures = {
+            pool.submit(contextvars.copy_context().run, _embed_batch, [chunks[i] for i in batch]): batch
+            for batch in batches
+        }
+        use_pgvector = kb_pgvector.available()
+        chunk_ids, matrices, contents = [], [], []
+        for done, future in enumerate(as_completed(futures), 1):
+            batch = futures[future]
+            normalized = [vectors.normalize(embedding) for embedding in future.result()]
+            created = KnowledgeBaseChunk.objects.bulk_create([
+                KnowledgeBaseChunk(
+                    document=document,
+                    user=document.user,
+                    content=chunks[i],
+                    chunk_index=i,
+                    embedding=vectors.pack(embedding),
+                )
+                for i, embedding in zip(batch, normalized)
+            ])
+            ids = [c.id for c in created]
+            if use_pgvector:
+                kb_pgvector.store(ids, normalized)
+            chunk_ids.extend(ids)
+            matrices.append(np.vstack(normalized))
+            contents.extend(chunks[i] for i in batch)
+            _set_progress(document, PROGRESS_CHUNKED + (99 - PROGRESS_CHUNKED) * done // len(batches))
+
+        # Conditional: a document _fail_stale_documents marked as failed meanwhile stays failed
+        ready = KnowledgeBaseDocument.objects.filter(pk=document.pk, status='processing').update(
+            chunk_count=len(chunks), status='ready', progress=100, updated_at=timezone.now(),
+        )
+        if not ready:
+            logger.warning(f"KB: doc {document.id} was failed as stalled before it finished, dropping its chunks")
+            document.chunks.all().delete()
+            return
+        document.chunk_count, document.status, document.progress = len(chunks), 'ready', 100
+        if not use_pgvector:
+            _update_index(kb_index.add, document.user_id, chunk_ids, np.vstack(matrices))
+        _update_index(kb_lexical.add, document.user_id, list(zip(chunk_ids, contents)))
+        logger.info(
+            f"KB: processed '{document.title}' → {len(chunks)} chunks in {len(batches)} batches "
+            f"for {document.user.username}"
+        )
 
     except Exception as e:
         logger.error(f"KB processing failed for doc {document.id}: {e}", exc_info=True)
-        document.status = 'error'
-        document.error_message = str(e)[:500]
-        document.save(update_fields=['status', 'error_message'])
+        for future in futures:
+            future.cancel()
+        # Drop the batches stored before the failure
+        document.chunks.all().delete()
+        _fail_document(document, str(e)[:500])
+
+
+def _embed_batch(texts: list[str]) -> list[np.ndarray]:
+    """embed_texts with KB_EMBED_RETRIES retries and exponential backoff (runs on the embed pool)."""
+    try:
+        for attempt in range(settings.KB_EMBED_RETRIES + 1):
+            try:
+                return embed_texts(texts)
+            except Exception as e:
+                if attempt == settings.KB_EMBED_RETRIES:
+                    raise
+                delay = 2 ** attempt + random.random()
+                logger.warning(f"KB embedding batch failed ({e}), retry {attempt + 1} in {delay:.1f}s")
+                time.sleep(delay)
+    finally:
+        connection.close()
+
+
+def _set_progress(document: KnowledgeBaseDocument, progress: int):
+    document.progress = progress
+    KnowledgeBaseDocument.objects.filter(pk=document.pk, status='processing').update(
+        progress=progress, updated_at=timezone.now(),
+    )
+
+
+def _fail_document(document: KnowledgeBaseDocument, message: str):
+    document.status = 'error'
+    document.error_message = message
+    # Keeps the message of a document already failed as stalled
+    KnowledgeBaseDocument.objects.filter(pk=document.pk, status='processing').update(
+        status='error', error_message=message, updated_at=timezone.now(),
+    )
 
 
 # ---------------------------------------------------------------------------
-# Retrieval (used by autopilot)
+# Background ingestion
 # ---------------------------------------------------------------------------
+# upload_document only validates and creates the document (status='processing');
+# extraction, chunking, embedding and storage run on a per-worker thread pool.
+# The uploaded payload is held in memory only, so a document whose worker died
+# mid-ingestion stops making progress and is marked as failed after
+# KB_INGEST_TIMEOUT seconds. The check runs on every upload and whenever a user
+# lists or polls their documents, so a stalled document never stays 'processing'.
+
+# Progress milestones (percent); embedding batches fill the rest up to 99
+PROGRESS_EXTRACTED = 10
+PROGRESS_CHUNKED = 20
+
+_executors = {}
+_executors_pid = None
+_executors_lock = threading.Lock()
+
+
+def _executor(name: str, max_workers: int) -> ThreadPoolExecutor:
+    """Thread pool for this worker process (rebuilt after fork, like llm.get_client)."""
+    global _executors_pid
+    with _executors_lock:
+        pid = os.getpid()
+        if _executors_pid != pid:
+            _executors.clear()
+            _executors_pid = pid
+        if name not in _executors:
+            _executors[name] = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f'kb-{name}')
+        return _executors[name]
+
+
+def enqueue_document(document: KnowledgeBaseDocument, content: str = "", url: str = ""):
+    """Queue extraction and processing of a freshly created document."""
+    _fail_stale_documents()
+    _executor('ingest', settings.KB_INGEST_WORKERS).submit(_ingest, document.pk, content, url)
+
+
+def _ingest(document_id: int, content: str, url: str):
+    try:
+        document = KnowledgeBaseDocument.objects.select_related('user').get(pk=document_id)
+    except KnowledgeBaseDocument.DoesNotExist:
+        return  # deleted while queued
+    try:
+        with ledger_scope('kb_ingest', user=document.user):
+            try:
+                document.raw_text = extract_text(document.source_type, content=content, url=url)
+            except ValueError as e:
+                _fail_document(document, str(e))
+                return
+            except Exception as e:
+                logger.error(f"KB text extraction failed for doc {document_id}: {e}", exc_info=True)
+                _fail_document(document, "Erreur lors de l'extraction du texte")
+                return
+            document.progress = PROGRESS_EXTRACTED
+            document.save(update_fields=['raw_text', 'progress', 'updated_at'])
+            process_document(document)
+    except Exception as e:
+        logger.error(f"KB ingestion failed for doc {document_id}: {e}", exc_info=True)
+    finally:
+        connection.close()
+
+
+def _fail_stale_documents(user=None):
+    """Mark as failed the documents (of one user, or all) whose ingestion stopped reporting progress."""
+    cutoff = timezone.now() - timedelta(seconds=settings.KB_INGEST_TIMEOUT)
+    docs = KnowledgeBaseDocument.objects.filter(status='processing', updated_at__lt=cutoff)
+    if user is not None:
+        docs = docs.filter(user=user)
+    stale = docs.update(
+        status='error',
+        error_message='Traitement interrompu, veuillez réimporter le document',
+        updated_at=timezone.now(),
+    )
+    if stale:
+        logger.warning(f"KB: marked {stale} stalled documents as failed")
+
+
+def exact_top_ids(chunks_qs, user_id, query_embedding, top_k: int, rebuild_index: bool = True) -> list[int]:
+    """
+    Exact NumPy search, loading only (id, embedding) for the user's chunks. Chunks are
+    stored normalized, so one matrix-vector product gives every cosine. Also rebuilds
+    the user's ANN index from the vectors it just loaded, unless rebuild_index is False.
+    """
+    rows = list(chunks_qs.values_list('id', 'embedding'))
+    if not rows:
+        return []
+    chunk_ids = [chunk_id for chunk_id, _blob in rows]
+    matrix = vectors.stack([blob for _chunk_id, blob in rows])
+    indices, _scores = vectors.top_k(matrix, query_embedding, top_k)
+    if rebuild_index:
+        _update_index(kb_index.rebuild, user_id, chunk_ids, matrix)
+    return [chunk_ids[i] for i in indices]
+
+
+def lexical_candidates(chunks_qs, user_id, topic: str, limit: int, chunk_count: int) -> list[int]:
+    """Best BM25 chunk ids for the topic (kb_lexical.py), rebuilding the user's index when stale."""
+    candidates = kb_lexical.search(user_id, topic, limit, chunk_count)
+    if candidates is None:
+        rows = list(chunks_qs.values_list('id', 'content'))
+        _update_index(kb_lexical.rebuild, user_id, rows)
+        candidates = kb_lexical.search(user_id, topic, limit, len(rows))
+    return candidates or []
+
+
+def fused_top_ids(candidates: list[int], query_embedding, top_k: int) -> list[int]:
+    """Vector-score the lexical candidates only, then merge both rankings by reciprocal rank."""
+    rows = list(
+        KnowledgeBaseChunk.objects.filter(id__in=candidates).exclude(embedding=b'').values_list('id', 'embedding')
+    )
+    if not rows:
+        return candidates[:top_k]
+    indices, _scores = vectors.top_k(vectors.stack([blob for _chunk_id, blob in rows]), query_embedding, len(rows))
+    return kb_lexical.fuse(candidates, [rows[i][0] for i in indices], k=top_k)
+
+
+def fetch_chunk_texts(chunk_ids: list[int]) -> list[tuple[str, str]]:
+    """(document title, content) of the given chunks, in the given order. Never loads raw_text."""
+    rows = KnowledgeBaseChunk.objects.filter(id__in=chunk_ids).values_list('id', 'document__title', 'content')
+    by_id = {chunk_id: (title, content) for chunk_id, title, content in rows}
+    return [by_id[chunk_id] for chunk_id in chunk_ids if chunk_id in by_id]
+
 
-def _cosine_similarity(a: list[float], b: list[float]) -> float:
-    """Compute cosine similarity between two vectors."""
-    import math
-    dot = sum(x * y for x, y in zip(a, b))
-    norm_a = math.sqrt(sum(x * x for x in a))
-    norm_b = math.sqrt(sum(x * x for x in b))
-    if norm_a == 0 or norm_b == 0:
-        return 0.0
-    return dot / (norm_a * norm_b)
+def _update_index(operation, user_id, *args):
+    """The ANN index is derived data: on failure retrieval sees it stale and rebuilds it."""
+    try:
+        operation(user_id, *args)
+    except Exception as e:
+        logger.warning(f"KB index update failed for user {user_id}: {e}")
 
 
+# ---------------------------------------------------------------------------
+# Retrieval (used by autopilot)
+# ---------------------------------------------------------------------------
+
 def retrieve_relevant_chunks(user, topic: str, top_k: int = 5) -> str:
-    """Embed the topic, find closest chunks via cosine similarity, return formatted context."""
+    """
+    Embed the topic, find closest chunks via cosine similarity, return formatted context.
+    Two phases: chunks are scored on ids and vectors only, then the text of the top-k is fetched.
+    """
     chunks_qs = KnowledgeBaseChunk.objects.filter(
         user=user, document__status='ready'
-    ).select_related('document')
+    ).exclude(embedding=b'')
 
-    if not chunks_qs.exists():
+    chunk_count = chunks_qs.count()
+    if not chunk_count:
         return ""
 
     try:
         # Embed the query
-        query_embedding = embed_texts([topic])[0]
-
-        # Compute similarity for each chunk in Python
-        scored = []
-        for chunk in chunks_qs:
-            if not chunk.embedding:
-                continue
-            sim = _cosine_similarity(query_embedding, chunk.embedding)
-            scored.append((sim, chunk))
-
-        # Sort by similarity (highest first) and take top_k
-        scored.sort(key=lambda x: x[0], reverse=True)
-        top_chunks = scored[:top_k]
-
+        try:
+            query_embedding = vectors.normalize(embed_texts([topic])[0])
+        except Exception as e:
+            logger.warning(f"KB query embedding failed, BM25 only: {e}")
+            query_embedding = None
+
+        top_ids = None
+        if query_embedding is None or chunk_count >= settings.KB_LEXICAL_PREFILTER_MIN:
+            # Large KB or no embedding: BM25 candidates first (no API call)
+            candidates = lexical_candidates(chunks_qs, user.id, topic, settings.KB_LEXICAL_CANDIDATES, chunk_count)
+            if query_embedding is None:
+                top_ids = candidates[:top_k]
+            elif len(candidates) >= top_k:
+                top_ids = fused_top_ids(candidates, query_embedding, top_k)
+
+        rebuild_index = True
+        if top_ids is None:
+            if kb_pgvector.available():
+                # PostgreSQL: ORDER BY embedding <=> query LIMIT k on the HNSW index
+                top_ids = kb_pgvector.search(user.id, query_embedding, top_k)
+                if len(top_ids) < min(top_k, chunk_count):
+                    # Filtered scan came back short (or some chunks have no pgvector column yet)
+                    logger.info(f"KB pgvector returned {len(top_ids)}/{top_k} chunks for user {user.id}, exact search")
+                    top_ids, rebuild_index = None, False
+            else:
+                try:
+                    top_ids = kb_index.search(user.id, query_embedding, top_k, chunk_count)
+                except (OSError, ValueError) as e:
+                    # The index itself is fine (e.g. a concurrent rebuild), so only this query goes exact
+                    logger.warning(f"KB index read failed for user {user.id}, exact search: {e}")
+                    rebuild_index = False
+
+        if top_ids is None:
+            top_ids = exact_top_ids(chunks_qs, user.id, query_embedding, top_k, rebuild_index)
+        top_chunks = fetch_chunk_texts(top_ids)
         if not top_chunks:
             return ""
 
@@ -225,14 +565,12 @@ def retrieve_relevant_chunks(user, topic: str, top_k: int = 5) -> str:
             "CONNAISSANCES DE L'AUTEUR (extraits de sa base de connaissances personnelle) :",
             "Utilise ces informations pour enrichir le contenu avec l'expertise unique de l'auteur :",
         ]
-        for _sim, chunk in top_chunks:
-            doc_title = chunk.document.title
+        for doc_title, content in top_chunks:
             lines.append(f"\n--- [{doc_title}] ---")
-            lines.append(chunk.content)
+            lines.append(content)
 
-        context = "\n".join(lines)
-        if len(context) > 3000:
-            context = context[:3000] + "\n..."
+        # Chunks are blank-line separated, so trimming drops the least relevant ones first
+        context = trim_to_tokens("\n".join(lines), settings.PROMPT_BUDGET_KB)
 
         logger.info(f"KB: retrieved {len(top_chunks)} chunks for topic '{topic[:50]}' (user: {user.username})")
         return context
@@ -254,6 +592,7 @@ def _serialize_document(doc: KnowledgeBaseDocument) -> dict:
         'source_url': doc.source_url,
         'chunk_count': doc.chunk_count,
         'status': doc.status,
+        'progress': doc.progress,
         'error_message': doc.error_message,
         'created_at': doc.created_at.isoformat(),
     }
@@ -271,10 +610,23 @@ def _get_kb_limit(user) -> int:
 @permission_classes([IsAuthenticated])
 def list_documents(request):
     """List user's knowledge base documents."""
+    _fail_stale_documents(request.user)
     docs = KnowledgeBaseDocument.objects.filter(user=request.user)
     return Response([_serialize_document(d) for d in docs])
 
 
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def get_document(request, pk):
+    """Get one document, polled by the frontend while it is processing."""
+    _fail_stale_documents(request.user)
+    try:
+        doc = KnowledgeBaseDocument.objects.get(pk=pk, user=request.user)
+    except KnowledgeBaseDocument.DoesNotExist:
+        return Response({'error': 'Document introuvable'}, status=status.HTTP_404_NOT_FOUND)
+    return Response(_serialize_document(doc))
+
+
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def upload_document(request):
@@ -306,27 +658,19 @@ def upload_document(request):
             status=status.HTTP_403_FORBIDDEN,
         )
 
-    # Extract text
-    try:
-        raw_text = extract_text(source_type, content=content, url=url)
-    except ValueError as e:
-        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
-    except Exception as e:
-        logger.error(f"KB text extraction failed: {e}", exc_info=True)
-        return Response({'error': 'Erreur lors de l\'extraction du texte'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    # Reject oversized files before queuing (base64 is ~4/3 of the raw size)
+    if source_type in ('pdf', 'docx') and len(content) * 3 // 4 > MAX_FILE_SIZE:
+        return Response({'error': 'Fichier trop volumineux (max 5 MB)'}, status=status.HTTP_400_BAD_REQUEST)
 
-    # Create document
+    # Create document, then extract + chunk + embed in the background
     doc = KnowledgeBaseDocument.objects.create(
         user=request.user,
         title=title[:300],
         source_type=source_type,
         source_url=url[:500] if source_type == 'url' else '',
-        raw_text=raw_text,
         status='processing',
     )
-
-    # Process (chunk + embed) — synchronous, takes 2-5 seconds
-    process_document(doc)
+    enqueue_document(doc, content=content, url=url)
 
     return Response(_serialize_document(doc), status=status.HTTP_201_CREATED)
 
@@ -340,7 +684,11 @@ def delete_document(request, pk):
     except KnowledgeBaseDocument.DoesNotExist:
         return Response({'error': 'Document introuvable'}, status=status.HTTP_404_NOT_FOUND)
 
-    doc.delete()  # CASCADE deletes chunks
+    chunk_ids = list(doc.chunks.values_list('id', flat=True))
+    doc.delete()  # CASCADE deletes chunks (and their pgvector rows)
+    if not kb_pgvector.available():
+        _update_index(kb_index.remove, request.user.id, chunk_ids)
+    _update_index(kb_lexical.remove, request.user.id, chunk_ids)
     return Response({'ok': True})
 
 
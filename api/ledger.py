@@ -0,0 +1,341 @@
+"""
+Token and latency ledger for AI provider calls.
+
+Every call runs inside track(), which times it, takes the token counts the
+provider reports (note_usage) or estimates them with tiktoken, and tags it with
+the endpoint and user of the current request. LedgerMiddleware sets that scope
+for HTTP requests; background jobs use scope(). Records are buffered per worker
+and appended to ModelCallRecord in batches.
+"""
+import atexit
+import contextvars
+import logging
+import math
+import threading
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.signals import request_finished
+from django.db import DatabaseError
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
+
+from .tokens import count_tokens
+
+logger = logging.getLogger(__name__)
+
+
+# ---------------------------------------------------------------------------
+# Scope: which endpoint and user a call belongs to
+# ---------------------------------------------------------------------------
+# Context variables follow the request thread and are copied into tasks
+# submitted to the LLM event loop, so async calls inherit the caller's scope.
+
+class _Scope:
+    def __init__(self, endpoint, request=None, user=None):
+        self.endpoint = endpoint
+        self.request = request
+        self.user = user
+
+    @property
+    def user_id(self):
+        # DRF writes the authenticated user back onto the Django request
+        user = self.user if self.user is not None else getattr(self.request, 'user', None)
+        if user is not None and getattr(user, 'is_authenticated', False):
+            return user.pk
+        return None
+
+
+_scope = contextvars.ContextVar('ledger_scope', default=None)
+_current_call = contextvars.ContextVar('ledger_call', default=None)
+
+
+class LedgerMiddleware:
+    """Tag model calls made while serving a request with its URL name."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        # Not reset on the way out: streaming bodies are generated after the
+        # middleware returns and must still see the request's scope.
+        _scope.set(None)
+        return self.get_response(request)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        match = request.resolver_match
+        endpoint = (match.url_name if match else None) or view_func.__name__
+        _scope.set(_Scope(endpoint, request=request))
+
+
+@contextmanager
+def scope(endpoint, user=None):
+    """Attribute the model calls made inside the block to endpoint/user (jobs, commands)."""
+    token = _scope.set(_Scope(endpoint, user=user))
+    try:
+        yield
+    finally:
+        _scope.reset(token)
+
+
+def current_endpoint():
+    """Endpoint of the current request or scope() block, or None."""
+    current = _scope.get()
+    return current.endpoint if current else None
+
+
+# ---------------------------------------------------------------------------
+# Call tracking
+# ---------------------------------------------------------------------------
+
+class _Call:
+    def __init__(self, provider, model, prompt):
+        self.provider = provider
+        self.model = model
+        self.prompt = prompt
+        self.output = []
+        self.input_tokens = None
+        self.output_tokens = None
+        self.cache_read_tokens = 0
+        self.cache_creation_tokens = 0
+        self.success = True
+
+    def add_output(self, text):
+        """Keep generated text for the tiktoken fallback when the provider reports no usage."""
+        if text:
+            self.output.append(text)
+
+
+def note_usage(input_tokens=None, output_tokens=None, cache_read_tokens=0, cache_creation_tokens=0):
+    """
+    Report the token counts returned by the provider for the call in progress.
+    input_tokens excludes prompt-cache reads and writes, which are counted apart.
+    """
+    call = _current_call.get()
+    if call is None:
+        return
+    if input_tokens is not None:
+        call.input_tokens = input_tokens
+    if output_tokens is not None:
+        call.output_tokens = output_tokens
+    call.cache_read_tokens = cache_read_tokens
+    call.cache_creation_tokens = cache_creation_tokens
+
+
+@contextmanager
+def track(provider, model, prompt=''):
+    """
+    Time one provider call and add it to the ledger.
+    prompt is only used to estimate input tokens if the provider reports none.
+    """
+    call = _Call(provider, model, prompt)
+    token = _current_call.set(call)
+    start = time.monotonic()
+    try:
+        yield call
+    except BaseException:
+        # Includes cancelled hedges and streams abandoned by the client
+        call.success = False
+        raise
+    finally:
+        elapsed = time.monotonic() - start
+        _current_call.reset(token)
+        _record(call, elapsed)
+
+
+def _record(call, elapsed):
+    estimated = False
+    input_tokens, output_tokens = call.input_tokens, call.output_tokens
+    try:
+        if input_tokens is None:
+            input_tokens, estimated = count_tokens(call.prompt), True
+        if output_tokens is None:
+            output_tokens, estimated = count_tokens(''.join(call.output)), True
+    except Exception as e:
+        logger.warning(f"Ledger: token estimate failed for {call.model}: {e}")
+        input_tokens, output_tokens = input_tokens or 0, output_tokens or 0
+
+    current = _scope.get()
+    _append({
+        'created_at': timezone.now(),
+        'user_id': current.user_id if current else None,
+        'endpoint': (current.endpoint if current else None) or 'unknown',
+        'provider': call.provider,
+        'model': call.model,
+        'input_tokens': input_tokens,
+        'output_tokens': output_tokens,
+        'cache_read_tokens': call.cache_read_tokens,
+        'cache_creation_tokens': call.cache_creation_tokens,
+        'tokens_estimated': estimated,
+        'latency_ms': round(elapsed * 1000),
+        'success': call.success,
+    })
+
+
+# ---------------------------------------------------------------------------
+# Batched writes
+# ---------------------------------------------------------------------------
+
+_buffer = []
+_buffer_lock = threading.Lock()
+_last_flush = time.monotonic()
+
+
+def _in_event_loop():
+    import asyncio
+    try:
+        asyncio.get_running_loop()
+        return True
+    except RuntimeError:
+        return False
+
+
+def _flush_due():
+    return bool(_buffer) and (
+        len(_buffer) >= settings.LEDGER_BATCH_SIZE
+        or time.monotonic() - _last_flush >= settings.LEDGER_FLUSH_INTERVAL
+    )
+
+
+def _append(record):
+    with _buffer_lock:
+        _buffer.append(record)
+        due = _flush_due()
+    # Never block the LLM event loop on the database; the next sync call flushes
+    if due and not _in_event_loop():
+        flush()
+
+
+def flush():
+    """Write buffered records in one INSERT."""
+    global _last_flush
+    with _buffer_lock:
+        batch = _buffer[:]
+        _buffer.clear()
+        _last_flush = time.monotonic()
+    if not batch:
+        return
+    from .models import ModelCallRecord
+    try:
+        ModelCallRecord.objects.bulk_create([ModelCallRecord(**record) for record in batch])
+    except DatabaseError as e:
+        logger.warning(f"Ledger: dropped {len(batch)} record(s): {e}")
+
+
+def _flush_after_request(**kwargs):
+    if _flush_due():
+        flush()
+
+
+request_finished.connect(_flush_after_request, dispatch_uid='api.ledger.flush')
+atexit.register(flush)
+
+
+# ---------------------------------------------------------------------------
+# Aggregation
+# ---------------------------------------------------------------------------
+
+GROUP_BY_FIELDS = ('endpoint', 'model', 'provider')
+
+
+def percentile(ordered, q):
+    """Nearest-rank percentile of an already sorted list: the ceil(n * q)-th value."""
+    # Rounded first so float noise (e.g. 19.000000000000004) does not push the rank up
+    return ordered[max(math.ceil(round(len(ordered) * q, 9)) - 1, 0)]
+
+
+# Anthropic bills cache reads at 10% and 5-minute cache writes at 125% of the input price
+CACHE_READ_PRICE_FACTOR = 0.1
+CACHE_WRITE_PRICE_FACTOR = 1.25
+
+
+def call_cost(model, input_tokens, output_tokens, cache_read_tokens=0, cache_creation_tokens=0):
+    """USD cost of a call from LLM_TOKEN_PRICES (per million tokens); unknown models cost 0."""
+    input_price, output_price = settings.LLM_TOKEN_PRICES.get(model, (0, 0))
+    billed_input = (
+        input_tokens
+        + cache_read_tokens * CACHE_READ_PRICE_FACTOR
+        + cache_creation_tokens * CACHE_WRITE_PRICE_FACTOR
+    )
+    return (billed_input * input_price + output_tokens * output_price) / 1_000_000
+
+
+def cache_hit_ratio(input_tokens, cache_read_tokens, cache_creation_tokens):
+    """Share of prompt tokens served from the prompt cache."""
+    prompt_tokens = input_tokens + cache_read_tokens + cache_creation_tokens
+    return round(cache_read_tokens / prompt_tokens, 3) if prompt_tokens else 0.0
+
+
+def summarize(since, group_by='endpoint'):
+    """Calls, failures, tokens, prompt-cache hit ratio, cost and p50/p95 latency per group since the given datetime."""
+    from .models import ModelCallRecord
+
+    groups = {}
+    rows = ModelCallRecord.objects.filter(created_at__gte=since).values_list(
+        group_by, 'model', 'input_tokens', 'output_tokens', 'cache_read_tokens', 'cache_creation_tokens',
+        'latency_ms', 'success',
+    )
+    for key, model, input_tokens, output_tokens, cache_read, cache_creation, latency_ms, success in rows.iterator(chunk_size=2000):
+        group = groups.setdefault(key, {
+            group_by: key,
+            'calls': 0,
+            'failures': 0,
+            'input_tokens': 0,
+            'output_tokens': 0,
+            'cache_read_tokens': 0,
+            'cache_creation_tokens': 0,
+            'cost_usd': 0.0,
+            'latencies': [],
+        })
+        group['calls'] += 1
+        group['failures'] += 0 if success else 1
+        group['input_tokens'] += input_tokens
+        group['output_tokens'] += output_tokens
+        group['cache_read_tokens'] += cache_read
+        group['cache_creation_tokens'] += cache_creation
+        group['cost_usd'] += call_cost(model, input_tokens, output_tokens, cache_read, cache_creation)
+        group['latencies'].append(latency_ms)
+
+    summary = []
+    for group in groups.values():
+        ordered = sorted(group.pop('latencies'))
+        group['p50_ms'] = percentile(ordered, 0.5)
+        group['p95_ms'] = percentile(ordered, 0.95)
+        group['cache_hit_ratio'] = cache_hit_ratio(
+            group['input_tokens'], group['cache_read_tokens'], group['cache_creation_tokens'],
+        )
+        group['cost_usd'] = round(group['cost_usd'], 4)
+        summary.append(group)
+    summary.sort(key=lambda g: g['cost_usd'], reverse=True)
+    return summary
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def usage_summary(request):
+    """
+    Token, cost and latency totals from the ledger.
+    GET /api/llm/usage/?days=7&group_by=endpoint|model|provider
+    """
+    group_by = request.query_params.get('group_by', 'endpoint')
+    if group_by not in GROUP_BY_FIELDS:
+        return Response({'error': f'group_by invalide: {group_by}'}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        days = max(int(request.query_params.get('days', 7)), 1)
+    except ValueError:
+        return Response({'error': 'days doit être un entier'}, status=status.HTTP_400_BAD_REQUEST)
+
+    flush()
+    since = timezone.now() - timedelta(days=days)
+    rows = summarize(since, group_by)
+    return Response({
+        'since': since.isoformat(),
+        'group_by': group_by,
+        'total_cost_usd': round(sum(row['cost_usd'] for row in rows), 4),
+        'rows': rows,
+    })
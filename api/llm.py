@@ -1,10 +1,26 @@
 """
 Multi-model text generation router.
 Routes generation requests to the appropriate AI provider based on model ID.
+Also owns the pooled provider clients shared by every module that talks to an AI API.
 """
+import asyncio
+import logging
+import os
+import threading
+import time
+from collections import deque
+
 import requests
 from django.conf import settings
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
+
+from .circuit_breaker import ProviderError, ProviderUnavailable, aguard, guard, circuit_status
+from .ledger import note_usage, percentile, track
+from .prompts import SystemPrompt
 
+logger = logging.getLogger(__name__)
 
 MODELS = {
     'mistral': {
@@ -25,6 +41,35 @@ MODELS = {
     },
 }
 
+MODEL_PROVIDERS = {
+    'mistral': 'huggingface',
+    'claude': 'anthropic',
+    'gemini': 'gemini',
+    'gpt4o': 'openai',
+}
+
+# Provider-side model name, as sent to the API and recorded in the ledger
+MODEL_NAMES = {
+    'mistral': 'mistralai/Mistral-Nemo-Instruct-2407',
+    'claude': 'claude-sonnet-4-20250514',
+    'gemini': 'gemini-2.5-flash',
+    'gpt4o': 'gpt-4o',
+}
+
+# Settings holding the credential each model needs; unconfigured models are skipped as fallbacks
+MODEL_API_KEYS = {
+    'mistral': 'HF_TOKEN',
+    'claude': 'ANTHROPIC_API_KEY',
+    'gemini': 'GOOGLE_API_KEY',
+    'gpt4o': 'OPENAI_API_KEY',
+}
+
+# Task classes: micro (hooks, hashtags, first comments, short rewrites), standard
+# (posts) and long_form (variants, carousels, infographics). Each maps a model ID
+# to a provider-side model through LLM_TASK_MODELS, overridable per plan, so tiny
+# outputs go to the fast tier of the provider the user picked.
+TASK_CLASSES = ('micro', 'standard', 'long_form')
+
 DEFAULT_MODEL_FREE = 'mistral'
 DEFAULT_MODEL_PAID = 'claude'
 
@@ -59,99 +104,791 @@ def resolve_model(requested_model, user_plan):
     return requested_model
 
 
-def generate_text(model_id, system_prompt, user_message, max_tokens=1024):
-    """Route text generation to the appropriate provider."""
+def task_model(model_id, task='standard', plan=None):
+    """Provider-side model name for a model ID and task class: plan override, then task tier, then default."""
+    if task not in TASK_CLASSES:
+        raise ValueError(f"Classe de tache inconnue: {task}")
+    override = settings.LLM_TASK_MODEL_OVERRIDES.get(plan, {}).get(task, {})
+    if model_id in override:
+        return override[model_id]
+    return settings.LLM_TASK_MODELS.get(task, {}).get(model_id, MODEL_NAMES[model_id])
+
+
+def claude_model(task='standard', plan=None):
+    """Claude model for call sites that build their own requests through claude_message()."""
+    return task_model('claude', task, plan)
+
+
+# ---------------------------------------------------------------------------
+# Provider clients
+# ---------------------------------------------------------------------------
+# One keep-alive client per provider per worker process. Building an SDK client
+# opens a new connection pool, so doing it per call paid a TLS handshake on
+# every request. Clients are rebuilt after a fork so workers never share sockets.
+
+PROVIDERS = ('anthropic', 'openai', 'gemini', 'tavily', 'huggingface')
+
+_clients = {}
+_clients_pid = None
+_clients_lock = threading.Lock()
+
+
+def get_client(provider):
+    """Return the pooled client for a provider, building it on first use in this worker."""
+    global _clients_pid
+    pid = os.getpid()
+    if _clients_pid == pid and provider in _clients:
+        return _clients[provider]
+    with _clients_lock:
+        if _clients_pid != pid:
+            _clients.clear()
+            _clients_pid = pid
+        if provider not in _clients:
+            _clients[provider] = _build_client(provider)
+        return _clients[provider]
+
+
+def _httpx_limits():
+    import httpx
+    return httpx.Limits(
+        max_connections=settings.LLM_HTTP_POOL_SIZE,
+        max_keepalive_connections=settings.LLM_HTTP_POOL_SIZE,
+        keepalive_expiry=settings.LLM_HTTP_KEEPALIVE,
+    )
+
+
+def _httpx_timeout():
+    import httpx
+    return httpx.Timeout(settings.LLM_HTTP_TIMEOUT, connect=settings.LLM_HTTP_CONNECT_TIMEOUT)
+
+
+def _build_client(provider, base_url=None):
+    """Build a new client for a provider. base_url is only overridden by benchmarks."""
+    if provider == 'anthropic':
+        import anthropic
+        return anthropic.Anthropic(
+            api_key=settings.ANTHROPIC_API_KEY,
+            base_url=base_url,
+            timeout=_httpx_timeout(),
+            max_retries=settings.LLM_MAX_RETRIES,
+            http_client=anthropic.DefaultHttpxClient(limits=_httpx_limits(), timeout=_httpx_timeout()),
+        )
+    if provider == 'openai':
+        import openai
+        return openai.OpenAI(
+            api_key=settings.OPENAI_API_KEY,
+            base_url=base_url,
+            timeout=_httpx_timeout(),
+            max_retries=settings.LLM_MAX_RETRIES,
+            http_client=openai.DefaultHttpxClient(limits=_httpx_limits(), timeout=_httpx_timeout()),
+        )
+    if provider == 'gemini':
+        from google import genai
+        from google.genai import types
+        # The genai SDK keeps its own httpx client for the lifetime of the Client;
+        # it only exposes the timeout (in milliseconds) across supported versions.
+        http_options = types.HttpOptions(timeout=int(settings.LLM_HTTP_TIMEOUT * 1000), base_url=base_url)
+        return genai.Client(api_key=settings.GOOGLE_API_KEY, http_options=http_options)
+    if provider == 'tavily':
+        from tavily import TavilyClient
+        return TavilyClient(api_key=settings.TAVILY_API_KEY)
+    if provider == 'huggingface':
+        from requests.adapters import HTTPAdapter
+        session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=settings.LLM_HTTP_POOL_SIZE,
+            pool_maxsize=settings.LLM_HTTP_POOL_SIZE,
+        )
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        return session
+    raise ValueError(f"Fournisseur inconnu: {provider}")
+
+
+# ---------------------------------------------------------------------------
+# Routing policy: failover, hedging and per-model stats
+# ---------------------------------------------------------------------------
+# Callers that pass the user's plan get the requested model first, then the
+# plan's fallback chain (LLM_FALLBACK_CHAINS). With LLM_HEDGING_ENABLED, a
+# second model is fired when the first exceeds its rolling p95 latency and the
+# first answer wins. Stats are kept per worker process, per model and task class
+# (a micro call on Haiku must not drag Sonnet's p95 down).
+
+class _ModelStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = deque(maxlen=settings.LLM_LATENCY_WINDOW)
+        self.successes = 0
+        self.failures = 0
+        self.fallbacks = 0
+        self.hedges = 0
+
+    def p95(self):
+        with self.lock:
+            if len(self.latencies) < settings.LLM_HEDGE_MIN_SAMPLES:
+                return None
+            ordered = sorted(self.latencies)
+        return percentile(ordered, 0.95)
+
+    def snapshot(self):
+        with self.lock:
+            ordered = sorted(self.latencies)
+            return {
+                'successes': self.successes,
+                'failures': self.failures,
+                'fallbacks': self.fallbacks,
+                'hedges': self.hedges,
+                'samples': len(ordered),
+                'p50_ms': round(percentile(ordered, 0.5) * 1000) if ordered else None,
+                'p95_ms': round(percentile(ordered, 0.95) * 1000) if ordered else None,
+            }
+
+
+_model_stats = {}
+_model_stats_lock = threading.Lock()
+
+
+def _stats(model_id, task='standard'):
+    key = (model_id, task)
+    if key not in _model_stats:
+        with _model_stats_lock:
+            _model_stats.setdefault(key, _ModelStats())
+    return _model_stats[key]
+
+
+def _record_call(model_id, task, ok, elapsed=None):
+    stats = _stats(model_id, task)
+    with stats.lock:
+        if ok:
+            stats.successes += 1
+            stats.latencies.append(elapsed)
+        else:
+            stats.failures += 1
+
+
+def _record_event(model_id, task, event):
+    stats = _stats(model_id, task)
+    with stats.lock:
+        setattr(stats, event, getattr(stats, event) + 1)
+
+
+def get_provider_stats():
+    """Per-model, per-task success, failure, fallback, hedge counts and latency percentiles for this worker."""
+    return {
+        model_id: {task: _stats(model_id, task).snapshot() for task in TASK_CLASSES}
+        for model_id in MODELS
+    }
+
+
+def _is_configured(model_id):
+    return bool(getattr(settings, MODEL_API_KEYS[model_id], ''))
+
+
+def fallback_chain(model_id, plan=None):
+    """Ordered models to try: the requested one, then the plan's configured fallbacks."""
+    if model_id not in MODELS:
+        raise ValueError(f"Modele inconnu: {model_id}")
+    chain = [model_id]
+    if plan is None:
+        return chain
+    for candidate in settings.LLM_FALLBACK_CHAINS.get(plan, []):
+        if candidate in MODELS and candidate not in chain and _is_configured(candidate):
+            chain.append(candidate)
+    return chain
+
+
+def _note_fallback(chain, model_id, error):
+    next_model = chain[chain.index(model_id) + 1] if chain.index(model_id) + 1 < len(chain) else None
+    if next_model:
+        logger.warning(f"LLM: {model_id} failed ({error}), falling back to {next_model}")
+
+
+def generate_text(model_id, system_prompt, user_message, max_tokens=1024, plan=None, task='standard'):
+    """
+    Route text generation to the appropriate provider, on the model tier of the task class.
+    When plan is given, failed calls fall back along the plan's chain (and are hedged if enabled).
+    """
+    chain = fallback_chain(model_id, plan)
+    if settings.LLM_HEDGING_ENABLED and len(chain) > 1:
+        return run_async(_aroute(chain, system_prompt, user_message, max_tokens, task, plan))
+
+    last_error = None
+    for candidate in chain:
+        start = time.monotonic()
+        try:
+            with guard(MODEL_PROVIDERS[candidate]):
+                text = _generate_once(
+                    candidate, task_model(candidate, task, plan), system_prompt, user_message, max_tokens,
+                )
+        except Exception as e:
+            if not isinstance(e, ProviderUnavailable):
+                _record_call(candidate, task, ok=False)
+            _note_fallback(chain, candidate, e)
+            last_error = e
+            continue
+        _record_call(candidate, task, ok=True, elapsed=time.monotonic() - start)
+        if candidate != chain[0]:
+            _record_event(candidate, task, 'fallbacks')
+        return text
+    raise last_error
+
+
+def _generate_once(model_id, model, system_prompt, user_message, max_tokens):
     if model_id == 'claude':
-        return _generate_claude(system_prompt, user_message, max_tokens)
+        generate = _generate_claude
     elif model_id == 'gemini':
-        return _generate_gemini(system_prompt, user_message, max_tokens)
+        generate = _generate_gemini
     elif model_id == 'gpt4o':
-        return _generate_openai(system_prompt, user_message, max_tokens)
+        generate = _generate_openai
     elif model_id == 'mistral':
-        return _generate_mistral(system_prompt, user_message, max_tokens)
+        generate = _generate_mistral
     else:
         raise ValueError(f"Modele inconnu: {model_id}")
+    with track(MODEL_PROVIDERS[model_id], model, system_prompt + user_message) as call:
+        text = generate(model, system_prompt, user_message, max_tokens)
+        call.add_output(text)
+    return text
 
 
-def _generate_claude(system_prompt, user_message, max_tokens):
-    import anthropic
-    client = anthropic.Anthropic(api_key=settings.ANTHROPIC_API_KEY)
+def _generate_claude(model, system_prompt, user_message, max_tokens):
+    client = get_client('anthropic')
     response = client.messages.create(
-        model="claude-sonnet-4-20250514",
+        model=model,
         max_tokens=max_tokens,
-        system=system_prompt,
+        system=_claude_system(system_prompt, model),
         messages=[{"role": "user", "content": user_message}],
     )
+    _note_claude_usage(response.usage)
     return response.content[0].text
 
 
+def _claude_system(system_prompt, model=None):
+    """Send SystemPrompt instances as blocks so their static prefix hits Anthropic's prompt cache."""
+    if isinstance(system_prompt, SystemPrompt):
+        return system_prompt.anthropic_blocks(model)
+    return system_prompt
+
+
+def _note_claude_usage(usage):
+    # input_tokens excludes the prefix tokens read from or written to the cache
+    note_usage(
+        usage.input_tokens,
+        usage.output_tokens,
+        cache_read_tokens=getattr(usage, 'cache_read_input_tokens', None) or 0,
+        cache_creation_tokens=getattr(usage, 'cache_creation_input_tokens', None) or 0,
+    )
+
+
+def claude_message(**kwargs):
+    """
+    Messages API call through the pooled Anthropic client, recorded in the ledger.
+    For modules that build their own Claude requests (vision, JSON outputs...).
+    """
+    if 'system' in kwargs:
+        kwargs['system'] = _claude_system(kwargs['system'], kwargs.get('model'))
+    with track('anthropic', kwargs['model']):
+        response = get_client('anthropic').messages.create(**kwargs)
+        _note_claude_usage(response.usage)
+    return response
+
+
 def generate_chat_stream(system_prompt, messages, max_tokens=1024):
     """Stream a multi-turn Claude chat response. Yields text chunks."""
-    import anthropic
-    client = anthropic.Anthropic(api_key=settings.ANTHROPIC_API_KEY)
+    model = MODEL_NAMES['claude']
+    with track('anthropic', model):
+        yield from _claude_stream(model, system_prompt, _cache_history(messages), max_tokens)
+
+
+def _cache_history(messages):
+    """
+    Mark the latest turn as a cache breakpoint: the next turn resends the same
+    history, so everything up to here is read from Anthropic's prompt cache.
+    """
+    if not messages or not isinstance(messages[-1].get('content'), str):
+        return messages
+    last = messages[-1]
+    return messages[:-1] + [{
+        'role': last['role'],
+        'content': [{'type': 'text', 'text': last['content'], 'cache_control': {'type': 'ephemeral'}}],
+    }]
+
+
+def _claude_stream(model, system_prompt, messages, max_tokens):
+    client = get_client('anthropic')
     with client.messages.stream(
-        model="claude-sonnet-4-20250514",
+        model=model,
         max_tokens=max_tokens,
-        system=system_prompt,
+        system=_claude_system(system_prompt, model),
         messages=messages,
     ) as stream:
         for text in stream.text_stream:
             yield text
+        _note_claude_usage(stream.get_final_message().usage)
 
 
-def _generate_gemini(system_prompt, user_message, max_tokens):
-    from google import genai
+def _generate_gemini(model, system_prompt, user_message, max_tokens):
     from google.genai import types
-    client = genai.Client(api_key=settings.GOOGLE_API_KEY)
+    client = get_client('gemini')
     response = client.models.generate_content(
-        model="gemini-2.5-flash",
+        model=model,
         contents=[user_message],
         config=types.GenerateContentConfig(
             system_instruction=system_prompt,
             max_output_tokens=max_tokens,
         ),
     )
+    _note_gemini_usage(response)
     return response.text
 
 
-def _generate_openai(system_prompt, user_message, max_tokens):
-    from openai import OpenAI
-    client = OpenAI(api_key=settings.OPENAI_API_KEY)
+def _note_gemini_usage(response):
+    usage = getattr(response, 'usage_metadata', None)
+    if usage is not None:
+        note_usage(usage.prompt_token_count, usage.candidates_token_count)
+
+
+def _generate_openai(model, system_prompt, user_message, max_tokens):
+    client = get_client('openai')
     response = client.chat.completions.create(
-        model="gpt-4o",
+        model=model,
         max_tokens=max_tokens,
         messages=[
             {"role": "system", "content": system_prompt},
             {"role": "user", "content": user_message},
         ],
     )
+    note_usage(response.usage.prompt_tokens, response.usage.completion_tokens)
     return response.choices[0].message.content
 
 
-def _generate_mistral(system_prompt, user_message, max_tokens):
-    HF_API_URL = "https://router.huggingface.co/hf-inference/models/mistralai/Mistral-Nemo-Instruct-2407"
-    headers = {
+HF_INFERENCE_URL = "https://router.huggingface.co/hf-inference/models/{model}"
+
+
+def _mistral_headers():
+    return {
         "Authorization": f"Bearer {settings.HF_TOKEN}",
         "Content-Type": "application/json",
     }
 
-    payload = {
+
+def _mistral_payload(system_prompt, user_message, max_tokens, stream=False):
+    return {
         "inputs": f"<s>[INST] {system_prompt}\n\n{user_message} [/INST]",
         "parameters": {
             "max_new_tokens": max_tokens,
             "return_full_text": False,
         },
+        "stream": stream,
     }
-    response = requests.post(HF_API_URL, headers=headers, json=payload, timeout=90)
 
+
+def _check_mistral_response(response):
     if response.status_code == 429:
-        raise Exception("Limite de requetes HuggingFace atteinte, reessayez plus tard.")
+        raise ProviderError("Limite de requetes HuggingFace atteinte, reessayez plus tard.", 429)
     if response.status_code == 503:
-        raise Exception("Le modele est en cours de chargement, reessayez dans quelques secondes.")
-
+        raise ProviderError("Le modele est en cours de chargement, reessayez dans quelques secondes.", 503)
     response.raise_for_status()
-    result = response.json()
 
+
+def _mistral_request(model, system_prompt, user_message, max_tokens, stream=False):
+    response = get_client('huggingface').post(
+        HF_INFERENCE_URL.format(model=model),
+        headers=_mistral_headers(),
+        json=_mistral_payload(system_prompt, user_message, max_tokens, stream=stream),
+        timeout=90,
+        stream=stream,
+    )
+    _check_mistral_response(response)
+    return response
+
+
+def _mistral_text(result):
     if isinstance(result, list) and len(result) > 0:
         return result[0].get('generated_text', '')
     raise Exception("Reponse inattendue du modele Mistral")
+
+
+def _generate_mistral(model, system_prompt, user_message, max_tokens):
+    response = _mistral_request(model, system_prompt, user_message, max_tokens)
+    return _mistral_text(response.json())
+
+
+# ---------------------------------------------------------------------------
+# Streaming
+# ---------------------------------------------------------------------------
+
+def stream_text(model_id, system_prompt, user_message, max_tokens=1024, plan=None, task='standard'):
+    """
+    Stream text generation from the appropriate provider. Yields text chunks.
+    With a plan, a model that fails before its first chunk falls back along the plan's chain.
+    """
+    chain = fallback_chain(model_id, plan)
+    return _stream_routed(chain, system_prompt, user_message, max_tokens, task, plan)
+
+
+def _stream_routed(chain, system_prompt, user_message, max_tokens, task='standard', plan=None):
+    last_error = None
+    for candidate in chain:
+        model = task_model(candidate, task, plan)
+        start = time.monotonic()
+        started = False
+        try:
+            with guard(MODEL_PROVIDERS[candidate]), \
+                    track(MODEL_PROVIDERS[candidate], model, system_prompt + user_message) as call:
+                for chunk in _stream_once(candidate, model, system_prompt, user_message, max_tokens):
+                    started = True
+                    call.add_output(chunk)
+                    yield chunk
+        except Exception as e:
+            # An open circuit never reached the model: not a model failure
+            if not isinstance(e, ProviderUnavailable):
+                _record_call(candidate, task, ok=False)
+            if started:
+                raise
+            _note_fallback(chain, candidate, e)
+            last_error = e
+            continue
+        _record_call(candidate, task, ok=True, elapsed=time.monotonic() - start)
+        if candidate != chain[0]:
+            _record_event(candidate, task, 'fallbacks')
+        return
+    raise last_error
+
+
+def _stream_once(model_id, model, system_prompt, user_message, max_tokens):
+    if model_id == 'claude':
+        return _stream_claude(model, system_prompt, user_message, max_tokens)
+    elif model_id == 'gemini':
+        return _stream_gemini(model, system_prompt, user_message, max_tokens)
+    elif model_id == 'gpt4o':
+        return _stream_openai(model, system_prompt, user_message, max_tokens)
+    elif model_id == 'mistral':
+        return _stream_mistral(model, system_prompt, user_message, max_tokens)
+    else:
+        raise ValueError(f"Modele inconnu: {model_id}")
+
+
+def _stream_claude(model, system_prompt, user_message, max_tokens):
+    yield from _claude_stream(
+        model,
+        system_prompt,
+        [{"role": "user", "content": user_message}],
+        max_tokens=max_tokens,
+    )
+
+
+def _stream_gemini(model, system_prompt, user_message, max_tokens):
+    from google.genai import types
+    client = get_client('gemini')
+    for chunk in client.models.generate_content_stream(
+        model=model,
+        contents=[user_message],
+        config=types.GenerateContentConfig(
+            system_instruction=system_prompt,
+            max_output_tokens=max_tokens,
+        ),
+    ):
+        # usage_metadata is cumulative, the last chunk carries the totals
+        _note_gemini_usage(chunk)
+        if chunk.text:
+            yield chunk.text
+
+
+def _stream_openai(model, system_prompt, user_message, max_tokens):
+    client = get_client('openai')
+    stream = client.chat.completions.create(
+        model=model,
+        max_tokens=max_tokens,
+        stream=True,
+        stream_options={"include_usage": True},
+        messages=[
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_message},
+        ],
+    )
+    for chunk in stream:
+        if chunk.usage:
+            note_usage(chunk.usage.prompt_tokens, chunk.usage.completion_tokens)
+        if chunk.choices and chunk.choices[0].delta.content:
+            yield chunk.choices[0].delta.content
+
+
+def _stream_mistral(model, system_prompt, user_message, max_tokens):
+    import json
+    response = _mistral_request(model, system_prompt, user_message, max_tokens, stream=True)
+    with response:
+        # Some HF deployments ignore "stream" and answer with the full JSON body
+        if 'text/event-stream' not in response.headers.get('Content-Type', ''):
+            yield _mistral_text(response.json())
+            return
+        for line in response.iter_lines(decode_unicode=True):
+            if not line or not line.startswith('data:'):
+                continue
+            data = line[5:].strip()
+            if data == '[DONE]':
+                break
+            event = json.loads(data)
+            if event.get('error'):
+                raise Exception(f"Erreur Mistral: {event['error']}")
+            token = event.get('token') or {}
+            if token.get('text') and not token.get('special'):
+                yield token['text']
+            if event.get('details'):
+                note_usage(output_tokens=event['details'].get('generated_tokens'))
+
+
+# ---------------------------------------------------------------------------
+# Async router
+# ---------------------------------------------------------------------------
+# Async SDK clients are bound to the event loop they first ran on, so each worker
+# runs a single background loop thread and every coroutine is submitted to it.
+# Sync views use run_async() / submit_async() / gather_text() and stay on WSGI.
+
+_loop = None
+_loop_pid = None
+_loop_lock = threading.Lock()
+
+# Only touched from the loop thread, so no lock is needed.
+_async_clients = {}
+_semaphores = {}
+
+
+def _get_loop():
+    global _loop, _loop_pid
+    pid = os.getpid()
+    if _loop is not None and _loop_pid == pid:
+        return _loop
+    with _loop_lock:
+        if _loop is None or _loop_pid != pid:
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name='llm-async-loop', daemon=True).start()
+            _async_clients.clear()
+            _semaphores.clear()
+            _loop, _loop_pid = loop, pid
+        return _loop
+
+
+def submit_async(coro):
+    """Schedule a coroutine on the worker's LLM event loop. Returns a concurrent.futures.Future."""
+    return asyncio.run_coroutine_threadsafe(coro, _get_loop())
+
+
+def run_async(coro, timeout=None):
+    """Run a coroutine on the worker's LLM event loop and block until it finishes."""
+    return submit_async(coro).result(timeout=timeout)
+
+
+def gather_text(*calls, return_exceptions=False):
+    """
+    Run independent generations concurrently from sync code.
+    Each call is a dict of agenerate_text keyword arguments; results keep the same order.
+    """
+    async def _gather():
+        return await asyncio.gather(
+            *(agenerate_text(**call) for call in calls),
+            return_exceptions=return_exceptions,
+        )
+    return run_async(_gather())
+
+
+def _get_async_client(provider):
+    if provider not in _async_clients:
+        _async_clients[provider] = _build_async_client(provider)
+    return _async_clients[provider]
+
+
+def _build_async_client(provider):
+    if provider == 'anthropic':
+        import anthropic
+        return anthropic.AsyncAnthropic(
+            api_key=settings.ANTHROPIC_API_KEY,
+            timeout=_httpx_timeout(),
+            max_retries=settings.LLM_MAX_RETRIES,
+            http_client=anthropic.DefaultAsyncHttpxClient(limits=_httpx_limits(), timeout=_httpx_timeout()),
+        )
+    if provider == 'openai':
+        import openai
+        return openai.AsyncOpenAI(
+            api_key=settings.OPENAI_API_KEY,
+            timeout=_httpx_timeout(),
+            max_retries=settings.LLM_MAX_RETRIES,
+            http_client=openai.DefaultAsyncHttpxClient(limits=_httpx_limits(), timeout=_httpx_timeout()),
+        )
+    if provider == 'gemini':
+        return _build_client('gemini').aio
+    if provider == 'huggingface':
+        import httpx
+        return httpx.AsyncClient(limits=_httpx_limits(), timeout=_httpx_timeout())
+    raise ValueError(f"Fournisseur inconnu: {provider}")
+
+
+def _provider_semaphore(provider):
+    if provider not in _semaphores:
+        _semaphores[provider] = asyncio.BoundedSemaphore(settings.LLM_ASYNC_CONCURRENCY)
+    return _semaphores[provider]
+
+
+async def agenerate_text(model_id, system_prompt, user_message, max_tokens=1024, plan=None, task='standard'):
+    """Async twin of generate_text. Runs on the worker LLM loop, bounded per provider."""
+    chain = fallback_chain(model_id, plan)
+    return await _aroute(chain, system_prompt, user_message, max_tokens, task, plan)
+
+
+async def _aroute(chain, system_prompt, user_message, max_tokens, task='standard', plan=None):
+    """
+    Try the chain in order. While only the first model is in flight and hedging is
+    enabled, fire the next one once the first exceeds its rolling p95; first success wins.
+    """
+    loop = asyncio.get_running_loop()
+    queue = list(chain)
+    tasks = {}
+    last_error = None
+
+    def launch():
+        model_id = queue.pop(0)
+        future = asyncio.ensure_future(
+            _atimed(model_id, task_model(model_id, task, plan), task, system_prompt, user_message, max_tokens)
+        )
+        tasks[future] = model_id
+        return model_id
+
+    primary = launch()
+    hedge_deadline = None
+    if settings.LLM_HEDGING_ENABLED and queue:
+        p95 = _stats(primary, task).p95()
+        if p95 is not None:
+            hedge_deadline = loop.time() + p95
+
+    try:
+        while tasks:
+            timeout = None
+            if hedge_deadline is not None:
+                timeout = max(hedge_deadline - loop.time(), 0)
+            done, _ = await asyncio.wait(tasks, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                hedge_deadline = None
+                hedged = launch()
+                _record_event(hedged, task, 'hedges')
+                logger.info(f"LLM: {primary} slower than its p95, hedging with {hedged}")
+                continue
+            for future in done:
+                model_id = tasks.pop(future)
+                if future.exception() is None:
+                    if model_id != chain[0]:
+                        _record_event(model_id, task, 'fallbacks')
+                    return future.result()
+                last_error = future.exception()
+                _note_fallback(chain, model_id, last_error)
+            if not tasks and queue:
+                hedge_deadline = None
+                launch()
+        raise last_error
+    finally:
+        for future in tasks:
+            future.cancel()
+
+
+async def _atimed(model_id, model, task, system_prompt, user_message, max_tokens):
+    start = time.monotonic()
+    try:
+        text = await _agenerate_once(model_id, model, system_prompt, user_message, max_tokens)
+    except (asyncio.CancelledError, ProviderUnavailable):
+        raise
+    except Exception:
+        _record_call(model_id, task, ok=False)
+        raise
+    _record_call(model_id, task, ok=True, elapsed=time.monotonic() - start)
+    return text
+
+
+async def _agenerate_once(model_id, model, system_prompt, user_message, max_tokens):
+    provider = MODEL_PROVIDERS[model_id]
+    if model_id == 'claude':
+        agenerate = _agenerate_claude
+    elif model_id == 'gemini':
+        agenerate = _agenerate_gemini
+    elif model_id == 'gpt4o':
+        agenerate = _agenerate_openai
+    else:
+        agenerate = _agenerate_mistral
+    async with _provider_semaphore(provider), aguard(provider):
+        with track(provider, model, system_prompt + user_message) as call:
+            text = await agenerate(model, system_prompt, user_message, max_tokens)
+            call.add_output(text)
+            return text
+
+
+async def _agenerate_claude(model, system_prompt, user_message, max_tokens):
+    client = _get_async_client('anthropic')
+    response = await client.messages.create(
+        model=model,
+        max_tokens=max_tokens,
+        system=_claude_system(system_prompt, model),
+        messages=[{"role": "user", "content": user_message}],
+    )
+    _note_claude_usage(response.usage)
+    return response.content[0].text
+
+
+async def _agenerate_gemini(model, system_prompt, user_message, max_tokens):
+    from google.genai import types
+    client = _get_async_client('gemini')
+    response = await client.models.generate_content(
+        model=model,
+        contents=[user_message],
+        config=types.GenerateContentConfig(
+            system_instruction=system_prompt,
+            max_output_tokens=max_tokens,
+        ),
+    )
+    _note_gemini_usage(response)
+    return response.text
+
+
+async def _agenerate_openai(model, system_prompt, user_message, max_tokens):
+    client = _get_async_client('openai')
+    response = await client.chat.completions.create(
+        model=model,
+        max_tokens=max_tokens,
+        messages=[
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_message},
+        ],
+    )
+    note_usage(response.usage.prompt_tokens, response.usage.completion_tokens)
+    return response.choices[0].message.content
+
+
+async def _agenerate_mistral(model, system_prompt, user_message, max_tokens):
+    client = _get_async_client('huggingface')
+    response = await client.post(
+        HF_INFERENCE_URL.format(model=model),
+        headers=_mistral_headers(),
+        json=_mistral_payload(system_prompt, user_message, max_tokens),
+        timeout=90,
+    )
+    _check_mistral_response(response)
+    return _mistral_text(response.json())
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def provider_stats(request):
+    """
+    Routing, embedding cache and enrichment cache stats for the worker that served the request.
+    GET /api/llm/stats/
+    """
+    from .embedding_cache import stats as embedding_cache_stats
+    from .enrichment_cache import stats as enrichment_cache_stats
+    from .entity_prefilter import stats as entity_prefilter_stats
+    return Response({
+        'pid': os.getpid(),
+        'fallback_chains': settings.LLM_FALLBACK_CHAINS,
+        'hedging_enabled': settings.LLM_HEDGING_ENABLED,
+        'task_models': {task: settings.LLM_TASK_MODELS.get(task, {}) for task in TASK_CLASSES},
+        'models': get_provider_stats(),
+        'circuits': circuit_status(),
+        'embedding_cache': embedding_cache_stats(),
+        'enrichment_cache': enrichment_cache_stats(),
+        'entity_prefilter': entity_prefilter_stats(),
+    })
@@ -0,0 +1,81 @@
+import random
+import time
+
+import tiktoken
+from django.core.management.base import BaseCommand
+
+from api.knowledge_base import chunk_stream, chunk_text
+
+WORDS = (
+    "la base de connaissances alimente l'autopilot avec des extraits pertinents pour chaque sujet "
+    "les documents importés sont découpés vectorisés puis stockés afin d'enrichir les publications "
+    "une stratégie éditoriale cohérente repose sur des sources fiables et des exemples concrets"
+).split()
+
+
+def _synthetic_text(size: int, seed: int = 0) -> str:
+    """Paragraphs of sentences of French words, about size characters."""
+    rng = random.Random(seed)
+    paragraphs, length = [], 0
+    while length < size:
+        sentences = [
+            ' '.join(rng.choice(WORDS) for _ in range(rng.randint(6, 24))).capitalize() + rng.choice('..!?')
+            for _ in range(rng.randint(2, 7))
+        ]
+        paragraph = ' '.join(sentences)
+        paragraphs.append(paragraph)
+        length += len(paragraph) + 2
+    return '\n\n'.join(paragraphs)[:size]
+
+
+def _fixed_windows(text, max_tokens=500, overlap=50):
+    # Previous chunker: encoder looked up per call, every window decoded separately
+    enc = tiktoken.get_encoding("cl100k_base")
+    tokens = enc.encode(text)
+    chunks = []
+    start = 0
+    while start < len(tokens):
+        end = start + max_tokens
+        chunk = enc.decode(tokens[start:end]).strip()
+        if chunk:
+            chunks.append(chunk)
+        start = end - overlap if end < len(tokens) else len(tokens)
+    return chunks
+
+
+def _clean_edges(chunks):
+    return sum(chunk[-1] in '.!?…' for chunk in chunks) / len(chunks)
+
+
+class Command(BaseCommand):
+    help = "Débit du découpage KB (Mo/s): fenêtres fixes décodées une à une vs découpe aux phrases/paragraphes"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[100_000, 1_000_000], help='Tailles en caractères')
+        parser.add_argument('--runs', type=int, default=5)
+
+    def handle(self, *args, **options):
+        runs = options['runs']
+        for size in options['sizes']:
+            text = _synthetic_text(size)
+            megabytes = len(text.encode()) / 1e6
+
+            results = {}
+            for label, chunker in (
+                ('fenêtres fixes', _fixed_windows),
+                ('aux frontières', chunk_text),
+                ('flux (pages 3 Ko)', lambda t: list(chunk_stream(t[i:i + 3000] for i in range(0, len(t), 3000)))),
+            ):
+                chunker(text)  # warm-up: encoder load
+                start = time.perf_counter()
+                for _ in range(runs):
+                    chunks = chunker(text)
+                elapsed = (time.perf_counter() - start) / runs
+                results[label] = megabytes / elapsed
+                self.stdout.write(
+                    f"{size // 1000:>5} Ko  {label:<18} {megabytes / elapsed:7.2f} Mo/s  "
+                    f"{len(chunks):>5} chunks  fin de phrase {_clean_edges(chunks):.0%}"
+                )
+            self.stdout.write(self.style.SUCCESS(
+                f"{size // 1000:>5} Ko  x{results['aux frontières'] / results['fenêtres fixes']:.2f} de débit"
+            ))
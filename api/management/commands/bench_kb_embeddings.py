@@ -0,0 +1,73 @@
+import json
+import math
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from api import vectors
+
+
+def _json_cosine(a, b):
+    # Retrieval as it was with JSON rows: pure Python over lists
+    dot = sum(x * y for x, y in zip(a, b))
+    norm_a = math.sqrt(sum(x * x for x in a))
+    norm_b = math.sqrt(sum(x * x for x in b))
+    if norm_a == 0 or norm_b == 0:
+        return 0.0
+    return dot / (norm_a * norm_b)
+
+
+def _np_cosine(a, b):
+    return float(np.dot(a, b) / (np.linalg.norm(a) * np.linalg.norm(b)))
+
+
+class Command(BaseCommand):
+    help = "Compare le stockage des embeddings KB: JSON vs float32/float16/int8 packés (taille, chargement, recherche)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunks', type=int, default=10_000, help='Nombre de chunks simulés')
+        parser.add_argument('--dims', type=int, default=1536, help='Dimension des vecteurs')
+        parser.add_argument('--top-k', type=int, default=5)
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(0)
+        matrix = rng.standard_normal((options['chunks'], options['dims']), dtype=np.float32)
+        query = rng.standard_normal(options['dims'], dtype=np.float32)
+        top_k = options['top_k']
+
+        rows = {'json': [json.dumps(v.tolist()) for v in matrix]}
+        for dtype in vectors.TAGS:
+            rows[dtype] = [vectors.pack(v, dtype) for v in matrix]
+
+        exact = None
+        for name, blobs in rows.items():
+            size = sum(len(b) for b in blobs) / len(blobs)
+
+            start = time.perf_counter()
+            if name == 'json':
+                loaded = [json.loads(b) for b in blobs]
+            else:
+                loaded = [vectors.as_float32(b) for b in blobs]
+            load_ms = (time.perf_counter() - start) * 1000
+
+            start = time.perf_counter()
+            if name == 'json':
+                q = query.tolist()
+                scores = [_json_cosine(q, v) for v in loaded]
+            else:
+                scores = [_np_cosine(query, v) for v in loaded]
+            search_ms = (time.perf_counter() - start) * 1000
+
+            top = set(np.argsort(scores)[::-1][:top_k].tolist())
+            if exact is None:
+                exact = top
+            self.stdout.write(
+                f"{name:<8} ligne={size / 1024:6.1f} Ko  chargement={load_ms:8.1f}ms  "
+                f"recherche={search_ms:8.1f}ms  top-{top_k} identique={len(top & exact)}/{top_k}"
+            )
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Terminé ({options['chunks']} chunks x {options['dims']} dims). "
+            "La taille par ligne est aussi le volume lu en base par chunk."
+        ))
@@ -0,0 +1,104 @@
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+
+from django.core.management.base import BaseCommand
+
+from api import kb_extract
+from api.knowledge_base import MAX_TEXT_LENGTH
+
+LINE = "Le contenu de la base de connaissances est découpé puis vectorisé pour l'autopilot."
+
+
+def _synthetic_pdf(pages: int, lines: int) -> bytes:
+    """Minimal text-only PDF (Helvetica, one content stream per page)."""
+    text = LINE.encode('latin-1')
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        None,  # page tree, filled once the page ids are known
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    kids = []
+    for page in range(pages):
+        body = b"BT /F1 10 Tf 12 TL 40 800 Td " + b"".join(
+            b"(" + f"{page + 1}.{line + 1} ".encode() + text + b") Tj T* " for line in range(lines)
+        ) + b"ET"
+        objects.append(b"<< /Length %d >>\nstream\n" % len(body) + body + b"\nendstream")
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+            b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % (len(objects))
+        )
+        kids.append(len(objects))
+    objects[1] = b"<< /Type /Pages /Kids [" + b" ".join(b"%d 0 R" % kid for kid in kids) + b"] /Count %d >>" % pages
+
+    out = BytesIO()
+    out.write(b"%PDF-1.4\n")
+    offsets = []
+    for number, obj in enumerate(objects, 1):
+        offsets.append(out.tell())
+        out.write(b"%d 0 obj\n" % number + obj + b"\nendobj\n")
+    xref = out.tell()
+    out.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1))
+    out.write(b"".join(b"%010d 00000 n \n" % offset for offset in offsets))
+    out.write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref))
+    return out.getvalue()
+
+
+def _extract_all_pages(raw, limit):
+    # Previous extraction: every page parsed and joined, then truncated
+    from PyPDF2 import PdfReader
+    reader = PdfReader(BytesIO(raw))
+    pages = []
+    for page in reader.pages:
+        text = page.extract_text()
+        if text:
+            pages.append(text)
+    return "\n\n".join(pages)[:limit]
+
+
+class Command(BaseCommand):
+    help = "Compare l'extraction PDF KB: toutes les pages puis troncature vs générateur page par page (processus dédié)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pdf', help='PDF à utiliser (par défaut: PDF synthétique)')
+        parser.add_argument('--pages', type=int, default=300)
+        parser.add_argument('--lines', type=int, default=45, help='Lignes par page du PDF synthétique')
+        parser.add_argument('--limit', type=int, default=MAX_TEXT_LENGTH, help='Budget de caractères')
+        parser.add_argument('--runs', type=int, default=3)
+
+    def handle(self, *args, **options):
+        if options['pdf']:
+            with open(options['pdf'], 'rb') as f:
+                raw = f.read()
+        else:
+            raw = _synthetic_pdf(options['pages'], options['lines'])
+        limit, runs = options['limit'], options['runs']
+        self.stdout.write(f"PDF de {len(raw) / 1e6:.2f} Mo, budget {limit} caractères, {runs} exécutions")
+
+        start = time.perf_counter()
+        for _ in range(runs):
+            before = _extract_all_pages(raw, limit)
+        before_ms = (time.perf_counter() - start) * 1000 / runs
+
+        start = time.perf_counter()
+        for _ in range(runs):
+            after = kb_extract.extract_document('pdf', raw, limit)
+        after_ms = (time.perf_counter() - start) * 1000 / runs
+
+        with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as pool:
+            start = time.perf_counter()
+            pool.submit(kb_extract.extract_document, 'pdf', raw, limit).result()
+            cold_ms = (time.perf_counter() - start) * 1000
+            start = time.perf_counter()
+            for _ in range(runs):
+                pooled = pool.submit(kb_extract.extract_document, 'pdf', raw, limit).result()
+            pool_ms = (time.perf_counter() - start) * 1000 / runs
+
+        pages_read = sum(1 for _ in kb_extract.iter_pdf_pages(raw))
+        self.stdout.write(f"avant (toutes les {pages_read} pages)  : {before_ms:8.1f}ms  {len(before)} caractères")
+        self.stdout.write(f"après (générateur, arrêt au budget)  : {after_ms:8.1f}ms  {len(after)} caractères")
+        self.stdout.write(f"après, pool de processus             : {pool_ms:8.1f}ms  (premier appel {cold_ms:.0f}ms)")
+        self.stdout.write(self.style.SUCCESS(
+            f"x{before_ms / after_ms:.1f} plus rapide, même texte: {'oui' if before == after == pooled else 'non'}"
+        ))
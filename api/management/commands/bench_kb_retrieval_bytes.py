@@ -0,0 +1,96 @@
+import time
+
+import numpy as np
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from api import vectors
+from api.knowledge_base import fetch_chunk_texts
+from api.models import KnowledgeBaseChunk, KnowledgeBaseDocument
+
+
+def _size(value):
+    if value is None:
+        return 0
+    if isinstance(value, (bytes, memoryview)):
+        return len(value)
+    if isinstance(value, str):
+        return len(value.encode())
+    return 8
+
+
+def _instance_bytes(instance):
+    return sum(_size(getattr(instance, field.attname)) for field in instance._meta.concrete_fields)
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = "Mesure les octets lus en base par recherche KB: lignes complètes + raw_text vs recherche en deux phases"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--documents', type=int, default=50)
+        parser.add_argument('--doc-chars', type=int, default=100_000, help='Taille de raw_text par document')
+        parser.add_argument('--chunk-chars', type=int, default=2_000, help='~500 tokens')
+        parser.add_argument('--dims', type=int, default=1536)
+        parser.add_argument('--top-k', type=int, default=5)
+
+    def handle(self, *args, **options):
+        # Synthetic user and documents, rolled back at the end
+        try:
+            with transaction.atomic():
+                self._run(options)
+                raise _Rollback
+        except _Rollback:
+            pass
+
+    def _run(self, options):
+        rng = np.random.default_rng(0)
+        user = User.objects.create(username='bench-kb-retrieval-bytes')
+        text = ('Lorem ipsum dolor sit amet, consectetur adipiscing elit. ' * (options['doc_chars'] // 57 + 1))[:options['doc_chars']]
+        step = options['chunk_chars']
+        for d in range(options['documents']):
+            doc = KnowledgeBaseDocument.objects.create(
+                user=user, title=f'Document {d}', source_type='paste', raw_text=text, status='ready',
+            )
+            pieces = [text[i:i + step] for i in range(0, len(text), step)]
+            KnowledgeBaseChunk.objects.bulk_create([
+                KnowledgeBaseChunk(
+                    document=doc, user=user, content=piece, chunk_index=i,
+                    embedding=vectors.pack(vectors.normalize(rng.standard_normal(options['dims']))),
+                )
+                for i, piece in enumerate(pieces)
+            ])
+
+        query = vectors.normalize(rng.standard_normal(options['dims']))
+        k = options['top_k']
+        chunks_qs = KnowledgeBaseChunk.objects.filter(user=user, document__status='ready').exclude(embedding=b'')
+
+        # Before: full chunk rows with their document (raw_text included)
+        start = time.perf_counter()
+        chunks = list(chunks_qs.select_related('document'))
+        matrix = vectors.stack([chunk.embedding for chunk in chunks])
+        indices, _ = vectors.top_k(matrix, query, k)
+        before_ids = [chunks[i].id for i in indices]
+        before_ms = (time.perf_counter() - start) * 1000
+        before_bytes = sum(_instance_bytes(chunk) + _instance_bytes(chunk.document) for chunk in chunks)
+
+        # After: (id, embedding) projection, then text of the top-k only
+        start = time.perf_counter()
+        rows = list(chunks_qs.values_list('id', 'embedding'))
+        indices, _ = vectors.top_k(vectors.stack([blob for _id, blob in rows]), query, k)
+        after_ids = [rows[i][0] for i in indices]
+        texts = fetch_chunk_texts(after_ids)
+        after_ms = (time.perf_counter() - start) * 1000
+        after_bytes = sum(_size(chunk_id) + _size(blob) for chunk_id, blob in rows)
+        after_bytes += sum(_size(chunk_id) + _size(title) + _size(content) for chunk_id, (title, content) in zip(after_ids, texts))
+
+        self.stdout.write(f"{options['documents']} documents, {len(rows)} chunks, top-{k}")
+        self.stdout.write(f"avant  : {before_bytes / 1e6:8.2f} Mo lus  {before_ms:8.1f}ms")
+        self.stdout.write(f"après  : {after_bytes / 1e6:8.2f} Mo lus  {after_ms:8.1f}ms")
+        self.stdout.write(self.style.SUCCESS(
+            f"x{before_bytes / after_bytes:.0f} moins d'octets, même top-{k}: {'oui' if before_ids == after_ids else 'non'}"
+        ))
@@ -0,0 +1,63 @@
+import math
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from api import vectors
+
+
+def _python_topk(query, rows, k):
+    # Previous retrieval: cosine per chunk in pure Python, then a full sort
+    scored = []
+    for index, row in enumerate(rows):
+        dot = sum(x * y for x, y in zip(query, row))
+        norm_q = math.sqrt(sum(x * x for x in query))
+        norm_r = math.sqrt(sum(x * x for x in row))
+        scored.append((dot / (norm_q * norm_r), index))
+    scored.sort(reverse=True)
+    return [index for _sim, index in scored[:k]]
+
+
+class Command(BaseCommand):
+    help = 'Compare la recherche top-k KB: boucle Python vs produit matrice-vecteur + argpartition'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[1_000, 10_000, 100_000])
+        parser.add_argument('--dims', type=int, default=1536)
+        parser.add_argument('--top-k', type=int, default=5)
+        parser.add_argument(
+            '--python-max', type=int, default=100_000,
+            help='Taille au-delà de laquelle la boucle Python est sautée (plusieurs minutes à 100k)',
+        )
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(0)
+        dims, k = options['dims'], options['top_k']
+        query = vectors.normalize(rng.standard_normal(dims, dtype=np.float32))
+
+        for size in options['sizes']:
+            matrix = rng.standard_normal((size, dims), dtype=np.float32)
+            blobs = [vectors.pack(vectors.normalize(v), 'float32') for v in matrix]
+
+            start = time.perf_counter()
+            stacked = vectors.stack(blobs)
+            stack_ms = (time.perf_counter() - start) * 1000
+            start = time.perf_counter()
+            indices, _scores = vectors.top_k(stacked, query, k)
+            numpy_ms = (time.perf_counter() - start) * 1000
+
+            line = f"{size:>7} chunks  numpy: empilement={stack_ms:8.1f}ms top-k={numpy_ms:7.2f}ms"
+            if size <= options['python_max']:
+                rows = stacked.tolist()
+                start = time.perf_counter()
+                expected = _python_topk(query.tolist(), rows, k)
+                python_ms = (time.perf_counter() - start) * 1000
+                same = 'oui' if expected == indices.tolist() else 'non'
+                line += (
+                    f"  python={python_ms:10.1f}ms  "
+                    f"gain=x{python_ms / (stack_ms + numpy_ms):.0f}  même top-{k}={same}"
+                )
+            self.stdout.write(line)
+
+        self.stdout.write(self.style.SUCCESS('Terminé.'))
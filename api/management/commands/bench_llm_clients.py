@@ -0,0 +1,107 @@
+import json
+import statistics
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from django.core.management.base import BaseCommand
+
+from api.llm import _build_client
+
+
+STUB_MESSAGE = {
+    'id': 'msg_bench',
+    'type': 'message',
+    'role': 'assistant',
+    'model': 'claude-sonnet-4-20250514',
+    'content': [{'type': 'text', 'text': 'ok'}],
+    'stop_reason': 'end_turn',
+    'stop_sequence': None,
+    'usage': {'input_tokens': 10, 'output_tokens': 1},
+}
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    """Minimal Anthropic Messages API stub with HTTP/1.1 keep-alive."""
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        self.rfile.read(length)
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        body = json.dumps(STUB_MESSAGE).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class _StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, latency):
+        super().__init__(('127.0.0.1', 0), _StubHandler)
+        self.latency = latency
+        self.connections = 0
+
+    def get_request(self):
+        self.connections += 1
+        return super().get_request()
+
+
+class Command(BaseCommand):
+    help = 'Compare la latence par appel: client Anthropic créé à chaque appel vs client poolé (serveur stub local)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--calls', type=int, default=200, help="Nombre d'appels par scénario")
+        parser.add_argument('--latency', type=float, default=0.0, help='Latence simulée du serveur stub (ms)')
+
+    def handle(self, *args, **options):
+        import anthropic
+
+        server = _StubServer(options['latency'] / 1000)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        base_url = f"http://127.0.0.1:{server.server_address[1]}"
+
+        def call(client):
+            client.messages.create(
+                model='claude-sonnet-4-20250514',
+                max_tokens=16,
+                messages=[{'role': 'user', 'content': 'ping'}],
+            )
+
+        def per_call():
+            call(anthropic.Anthropic(api_key='bench', base_url=base_url, max_retries=0))
+
+        pooled_client = _build_client('anthropic', base_url=base_url).with_options(api_key='bench')
+
+        def pooled():
+            call(pooled_client)
+
+        try:
+            for name, fn in (('per-call client', per_call), ('pooled client', pooled)):
+                fn()  # warm-up (imports, first connection)
+                server.connections = 0
+                timings = []
+                for _ in range(options['calls']):
+                    start = time.perf_counter()
+                    fn()
+                    timings.append((time.perf_counter() - start) * 1000)
+                timings.sort()
+                p95 = timings[int(len(timings) * 0.95) - 1]
+                self.stdout.write(
+                    f"{name:<16} mean={statistics.mean(timings):.2f}ms "
+                    f"p50={statistics.median(timings):.2f}ms p95={p95:.2f}ms "
+                    f"connexions={server.connections}"
+                )
+        finally:
+            server.shutdown()
+
+        self.stdout.write(self.style.SUCCESS(
+            'Terminé. En production le client par appel paie en plus un handshake TLS par requête.'
+        ))
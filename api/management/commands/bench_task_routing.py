@@ -0,0 +1,91 @@
+import statistics
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.test import override_settings
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from api import views
+from api.images import _build_image_search_query
+from api.ledger import scope as ledger_scope
+
+
+SAMPLE_POST = """J'ai refusé une promotion l'an dernier.
+
+Pas par manque d'ambition. Parce que le poste m'aurait éloigné de ce que je fais le mieux : accompagner mon équipe au quotidien.
+
+Trois choses que j'ai apprises depuis :
+1. Dire non ouvre plus de portes qu'on ne le pense
+2. La reconnaissance ne passe pas que par le titre
+3. Mon équipe a doublé sa productivité en 6 mois
+
+Et vous, avez-vous déjà dit non à une opportunité ?"""
+
+# Micro endpoints (views) benchmarked end-to-end through the real view functions
+ENDPOINTS = (
+    ('suggest_hashtags', views.suggest_hashtags, {'content': SAMPLE_POST}),
+    ('regenerate_hook', views.regenerate_hook, {'content': SAMPLE_POST, 'tone': 'storytelling'}),
+    ('generate_first_comment', views.generate_first_comment, {'content': SAMPLE_POST}),
+)
+
+
+class Command(BaseCommand):
+    help = 'Compare la latence de bout en bout des endpoints micro: modèle standard vs modèle rapide (appels réels)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--username', required=True, help="Utilisateur au nom duquel appeler les endpoints")
+        parser.add_argument('--model', default=None, help='Modèle demandé (claude, gemini, gpt4o, mistral)')
+        parser.add_argument('--runs', type=int, default=10, help="Nombre d'appels par endpoint et par scénario")
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['username'])
+        except User.DoesNotExist:
+            raise CommandError(f"Utilisateur introuvable: {options['username']}")
+
+        factory = APIRequestFactory()
+        payload_extra = {'model': options['model']} if options['model'] else {}
+
+        def call_view(view, data):
+            def call():
+                request = factory.post('/', {**data, **payload_extra}, format='json')
+                force_authenticate(request, user=user)
+                response = view(request)
+                if response.status_code != 200:
+                    raise CommandError(f"{view.__name__}: HTTP {response.status_code} {response.data}")
+            return call
+
+        cases = [(name, call_view(view, data)) for name, view, data in ENDPOINTS]
+        cases.append(('image_search_query', lambda: _build_image_search_query(SAMPLE_POST, '')))
+
+        # "Before" routes micro tasks like any standard call
+        before = {**settings.LLM_TASK_MODELS, 'micro': {}}
+        with ledger_scope('bench_task_routing', user=user):
+            for name, call in cases:
+                with override_settings(LLM_TASK_MODELS=before):
+                    standard = self._measure(call, options['runs'])
+                micro = self._measure(call, options['runs'])
+                self.stdout.write(
+                    f"{name:<24} standard p50={statistics.median(standard):.0f}ms p95={_p95(standard):.0f}ms | "
+                    f"micro p50={statistics.median(micro):.0f}ms p95={_p95(micro):.0f}ms | "
+                    f"gain p50=x{statistics.median(standard) / statistics.median(micro):.2f}"
+                )
+
+        self.stdout.write(self.style.SUCCESS(
+            'Terminé. Le coût par appel est visible dans le ledger (endpoint bench_task_routing).'
+        ))
+
+    def _measure(self, call, runs):
+        call()  # warm-up (imports, connection pool)
+        timings = []
+        for _ in range(runs):
+            start = time.perf_counter()
+            call()
+            timings.append((time.perf_counter() - start) * 1000)
+        return sorted(timings)
+
+
+def _p95(timings):
+    return timings[max(int(len(timings) * 0.95) - 1, 0)]
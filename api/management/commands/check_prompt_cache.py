@@ -0,0 +1,79 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from api import ledger
+from api.carousel import build_carousel_system_prompt
+from api.consultants import CONSULTANTS, consultant_system_prompt
+from api.infographic import build_infographic_system_prompt
+from api.llm import claude_message, claude_model
+from api.models import ModelCallRecord
+from api.prompts import (
+    VALID_PLATFORMS, build_single_variant_prompt, build_system_prompt, build_variants_system_prompt,
+    cache_min_tokens, cacheable, prefix_tokens,
+)
+
+ENDPOINT = 'check_prompt_cache'
+
+
+def _prompts():
+    """(name, SystemPrompt) for every static prefix the Claude paths send."""
+    # Post prefixes depend on the platform only (objective and tone are in the tail)
+    for platform in VALID_PLATFORMS:
+        yield f"post {platform}", build_system_prompt('audience_growth', 'professionnel', platform)
+        yield f"variants {platform}", build_variants_system_prompt('audience_growth', 'professionnel', 3, platform)
+        yield f"variant {platform}", build_single_variant_prompt('audience_growth', 'professionnel', platform)
+    yield 'carousel', build_carousel_system_prompt('professionnel', 'audience_growth', 'step-by-step')
+    yield 'infographic', build_infographic_system_prompt('professionnel', 6, 'checklist')
+    for key in CONSULTANTS:
+        yield f"consultant {key}", consultant_system_prompt(key)
+
+
+class Command(BaseCommand):
+    help = (
+        "Liste les préfixes statiques des prompts système, leur taille en tokens et s'ils sont marqués pour le "
+        "cache Anthropic. Avec --live, envoie deux appels par préfixe marqué et lit cache_read_tokens dans le ledger."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--model', default=None, help='Modèle Claude (par défaut: celui des tâches long_form)')
+        parser.add_argument('--live', action='store_true', help='Vérifier par des appels réels (payants, max_tokens=1)')
+
+    def handle(self, *args, **options):
+        model = options['model'] or claude_model('long_form')
+        minimum = cache_min_tokens(model)
+        self.stdout.write(f"Modèle {model}: préfixe minimum {minimum} tokens")
+
+        marked = {}
+        for name, prompt in _prompts():
+            is_cacheable = cacheable(prompt.prefix, model)
+            self.stdout.write(
+                f"  {name:<36} {prefix_tokens(prompt.prefix):>5} tokens  {'cache' if is_cacheable else '-'}"
+            )
+            if is_cacheable:
+                marked.setdefault(prompt.prefix, (name, prompt))
+        if not options['live']:
+            return
+
+        since = timezone.now()
+        with ledger.scope(ENDPOINT):
+            for _name, prompt in marked.values():
+                for _ in range(2):  # the first call writes the cache, the second should read it
+                    claude_message(
+                        model=model,
+                        max_tokens=1,
+                        system=prompt,
+                        messages=[{"role": "user", "content": "OK"}],
+                    )
+        ledger.flush()
+
+        records = list(
+            ModelCallRecord.objects.filter(endpoint=ENDPOINT, created_at__gte=since).order_by('created_at')
+        )
+        misses = 0
+        for (name, _prompt), first, second in zip(marked.values(), records[::2], records[1::2]):
+            self.stdout.write(
+                f"  {name:<36} écrits={first.cache_creation_tokens:>5}  lus au second appel={second.cache_read_tokens:>5}"
+            )
+            misses += second.cache_read_tokens == 0
+        style = self.style.SUCCESS if not misses else self.style.WARNING
+        self.stdout.write(style(f"{len(marked) - misses}/{len(marked)} préfixes lus depuis le cache au second appel"))
@@ -0,0 +1,70 @@
+import json
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from api import entity_prefilter
+from api.models import GeneratedPost
+from api.websearch import _llm_entities
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare le pré-classifieur local d'entités à l'extraction Haiku (précision/rappel) et estime "
+        "les appels Haiku évités par jour. Avec PROVIDER_BACKEND=replay, les réponses LLM viennent des cassettes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--corpus', help='Fichier JSONL {"text": ..., "entities": [...]} (par défaut: résumés des posts générés)')
+        parser.add_argument('--days', type=int, default=30, help='Période des posts générés et du volume quotidien')
+        parser.add_argument('--limit', type=int, default=200)
+        parser.add_argument('--verbose-errors', action='store_true', help='Afficher chaque désaccord')
+
+    def handle(self, *args, **options):
+        since = timezone.now() - timedelta(days=options['days'])
+        corpus = self._corpus(options, since)
+        if not corpus:
+            raise CommandError('Corpus vide')
+
+        decisions = {'none': 0, 'queries': 0, 'llm': 0}
+        tp = fp = fn = 0
+        wrong_skips = 0
+        for text, expected in corpus:
+            decision, queries = entity_prefilter.classify(text)
+            decisions[decision] += 1
+            if decision == 'llm':
+                continue
+            if expected is None:
+                expected = _llm_entities(text)
+            hits, false_pos, false_neg = entity_prefilter.agreement(queries, expected)
+            tp, fp, fn = tp + hits, fp + false_pos, fn + false_neg
+            wrong_skips += decision == 'none' and bool(expected)
+            if options['verbose_errors'] and (false_pos or false_neg):
+                self.stdout.write(f"  {decision:<7} local={queries} llm={expected} « {text[:80]} »")
+
+        total = len(corpus)
+        local = decisions['none'] + decisions['queries']
+        self.stdout.write(f"{total} textes: " + ', '.join(f"{name}={count}" for name, count in decisions.items()))
+        self.stdout.write(
+            f"décidés localement : {local / total:.0%}  "
+            f"(dont {wrong_skips} sans appel alors que le LLM trouvait des entités)"
+        )
+        precision = f"{tp / (tp + fp):.2f}" if tp + fp else 'n/a'
+        recall = f"{tp / (tp + fn):.2f}" if tp + fn else 'n/a'
+        self.stdout.write(f"précision {precision}  rappel {recall}  (sur les décisions locales, vs Haiku)")
+
+        per_day = GeneratedPost.objects.filter(created_at__gte=since).count() / options['days']
+        self.stdout.write(self.style.SUCCESS(
+            f"~{per_day * local / total:.0f} appels Haiku évités par jour "
+            f"({per_day:.0f} générations/jour sur {options['days']} jours)"
+        ))
+
+    def _corpus(self, options, since):
+        if options['corpus']:
+            with open(options['corpus']) as f:
+                records = [json.loads(line) for line in f if line.strip()]
+            return [(r['text'], r.get('entities')) for r in records[:options['limit']]]
+        summaries = GeneratedPost.objects.filter(created_at__gte=since).exclude(summary='').values_list('summary', flat=True)
+        unique = list(dict.fromkeys(summaries.iterator()))[:options['limit']]
+        return [(summary, None) for summary in unique]
@@ -0,0 +1,64 @@
+import numpy as np
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from api import kb_pgvector, vectors
+from api.models import KnowledgeBaseChunk
+
+
+class Command(BaseCommand):
+    help = (
+        "Vérifie que pgvector (HNSW) et la recherche NumPy exacte renvoient le même top-k KB. "
+        "Les requêtes sont des vecteurs de chunks existants, aucun appel d'embedding."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--username', help='Limiter à un utilisateur (par défaut: tous ceux qui ont des chunks)')
+        parser.add_argument('--queries', type=int, default=20, help='Requêtes par utilisateur')
+        parser.add_argument('--top-k', type=int, default=5)
+        parser.add_argument(
+            '--min-overlap', type=float, default=1.0,
+            help='Recouvrement minimal accepté entre les deux top-k (HNSW est approximatif)',
+        )
+
+    def handle(self, *args, **options):
+        if not kb_pgvector.available():
+            raise CommandError("pgvector indisponible (base non PostgreSQL ou migration 0027 sans extension)")
+
+        users = User.objects.filter(kb_chunks__isnull=False).distinct()
+        if options['username']:
+            users = users.filter(username=options['username'])
+
+        k = options['top_k']
+        rng = np.random.default_rng(0)
+        worst = 1.0
+        for user in users:
+            rows = list(
+                KnowledgeBaseChunk.objects.filter(user=user, document__status='ready')
+                .exclude(embedding=b'')
+                .values_list('id', 'embedding')
+            )
+            if not rows:
+                continue
+            ids = np.array([chunk_id for chunk_id, _blob in rows])
+            matrix = vectors.stack([blob for _chunk_id, blob in rows])
+
+            overlaps, same_order = [], 0
+            for row in rng.choice(len(rows), min(options['queries'], len(rows)), replace=False):
+                query = vectors.normalize(matrix[row])
+                indices, _scores = vectors.top_k(matrix, query, k)
+                exact = ids[indices].tolist()
+                approx = kb_pgvector.search(user.id, query, k)
+                overlaps.append(len(set(exact) & set(approx)) / len(exact))
+                same_order += exact == approx
+
+            user_overlap = min(overlaps)
+            worst = min(worst, user_overlap)
+            self.stdout.write(
+                f"{user.username:<30} chunks={len(rows):>6}  recouvrement min={user_overlap:.2f} "
+                f"moyen={sum(overlaps) / len(overlaps):.2f}  ordre identique={same_order}/{len(overlaps)}"
+            )
+
+        if worst < options['min_overlap']:
+            raise CommandError(f"Parité insuffisante: recouvrement minimal {worst:.2f} < {options['min_overlap']}")
+        self.stdout.write(self.style.SUCCESS('Parité pgvector / NumPy OK.'))
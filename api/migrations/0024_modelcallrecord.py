@@ -0,0 +1,35 @@
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('api', '0023_userprofile_is_demo'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ModelCallRecord',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(db_index=True)),
+                ('endpoint', models.CharField(db_index=True, max_length=100)),
+                ('provider', models.CharField(max_length=30)),
+                ('model', models.CharField(max_length=100)),
+                ('input_tokens', models.PositiveIntegerField(default=0)),
+                ('output_tokens', models.PositiveIntegerField(default=0)),
+                ('tokens_estimated', models.BooleanField(default=False, help_text="Comptés avec tiktoken faute d'usage fourni")),
+                ('latency_ms', models.PositiveIntegerField()),
+                ('success', models.BooleanField(default=True)),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='model_calls', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Appel IA',
+                'verbose_name_plural': 'Appels IA',
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
@@ -0,0 +1,21 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0024_modelcallrecord'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='modelcallrecord',
+            name='cache_read_tokens',
+            field=models.PositiveIntegerField(default=0, help_text='Tokens de prompt lus depuis le cache Anthropic'),
+        ),
+        migrations.AddField(
+            model_name='modelcallrecord',
+            name='cache_creation_tokens',
+            field=models.PositiveIntegerField(default=0, help_text='Tokens de prompt écrits dans le cache Anthropic'),
+        ),
+    ]
@@ -0,0 +1,78 @@
+"""
+Store KnowledgeBaseChunk.embedding as packed bytes instead of a JSON list of floats.
+Existing rows are converted to float32 (exact); the format is described in api/vectors.py
+and is inlined here so the migration does not depend on application code.
+"""
+import struct
+
+from django.db import migrations, models
+
+BATCH_SIZE = 500
+
+
+def _pack_float32(values):
+    return b'f32\x00' + struct.pack(f'<{len(values)}f', *values)
+
+
+def _unpack(blob):
+    blob = bytes(blob)
+    tag, body = blob[:4], blob[4:]
+    if tag == b'f32\x00':
+        return list(struct.unpack(f'<{len(body) // 4}f', body))
+    if tag == b'f16\x00':
+        return list(struct.unpack(f'<{len(body) // 2}e', body))
+    scale = struct.unpack('<f', body[:4])[0]
+    return [v * scale for v in struct.unpack(f'{len(body) - 4}b', body[4:])]
+
+
+def _convert(apps, source, target, encode, empty):
+    Chunk = apps.get_model('api', 'KnowledgeBaseChunk')
+    batch = []
+    for chunk in Chunk.objects.only('id', source).iterator(chunk_size=BATCH_SIZE):
+        value = getattr(chunk, source)
+        setattr(chunk, target, encode(value) if value else empty)
+        batch.append(chunk)
+        if len(batch) >= BATCH_SIZE:
+            Chunk.objects.bulk_update(batch, [target])
+            batch = []
+    if batch:
+        Chunk.objects.bulk_update(batch, [target])
+
+
+def json_to_packed(apps, schema_editor):
+    # JSONField values come back already decoded as lists
+    _convert(apps, 'embedding', 'embedding_packed', _pack_float32, b'')
+
+
+def packed_to_json(apps, schema_editor):
+    _convert(apps, 'embedding_packed', 'embedding', _unpack, [])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0025_modelcallrecord_cache_tokens'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='knowledgebasechunk',
+            name='embedding_packed',
+            field=models.BinaryField(null=True),
+        ),
+        migrations.RunPython(json_to_packed, packed_to_json),
+        migrations.RemoveField(
+            model_name='knowledgebasechunk',
+            name='embedding',
+        ),
+        migrations.RenameField(
+            model_name='knowledgebasechunk',
+            old_name='embedding_packed',
+            new_name='embedding',
+        ),
+        migrations.AlterField(
+            model_name='knowledgebasechunk',
+            name='embedding',
+            field=models.BinaryField(default=bytes, help_text='Vector embedding packé (voir api/vectors.py)'),
+        ),
+    ]
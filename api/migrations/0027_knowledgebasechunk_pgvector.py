@@ -0,0 +1,79 @@
+"""
+Optional pgvector column and HNSW index for KnowledgeBaseChunk (see api/kb_pgvector.py).
+Only runs on PostgreSQL, and is skipped when the `vector` extension cannot be
+installed; retrieval then keeps using the NumPy path. Existing packed vectors are
+copied into the new column.
+"""
+import logging
+import struct
+
+from django.db import migrations, transaction
+
+logger = logging.getLogger(__name__)
+
+DIMENSIONS = 1536
+BATCH_SIZE = 500
+
+
+def _floats(blob):
+    blob = bytes(blob)
+    tag, body = blob[:4], blob[4:]
+    if tag == b'f32\x00':
+        return struct.unpack(f'<{len(body) // 4}f', body)
+    if tag == b'f16\x00':
+        return struct.unpack(f'<{len(body) // 2}e', body)
+    scale = struct.unpack('<f', body[:4])[0]
+    return [v * scale for v in struct.unpack(f'{len(body) - 4}b', body[4:])]
+
+
+def add_vector_column(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor != 'postgresql':
+        return
+    try:
+        with transaction.atomic(using=connection.alias):
+            with connection.cursor() as cursor:
+                cursor.execute("CREATE EXTENSION IF NOT EXISTS vector")
+    except Exception as e:
+        logger.warning(f"pgvector unavailable, KB search stays in NumPy: {e}")
+        return
+
+    with connection.cursor() as cursor:
+        cursor.execute(f"ALTER TABLE api_knowledgebasechunk ADD COLUMN IF NOT EXISTS embedding_vector vector({DIMENSIONS})")
+
+        Chunk = apps.get_model('api', 'KnowledgeBaseChunk')
+        batch = []
+        for chunk_id, blob in Chunk.objects.exclude(embedding=b'').values_list('id', 'embedding').iterator(chunk_size=BATCH_SIZE):
+            values = _floats(blob)
+            if len(values) != DIMENSIONS:
+                continue
+            batch.append(('[' + ','.join(f'{v:.7g}' for v in values) + ']', chunk_id))
+            if len(batch) >= BATCH_SIZE:
+                cursor.executemany("UPDATE api_knowledgebasechunk SET embedding_vector = %s::vector WHERE id = %s", batch)
+                batch = []
+        if batch:
+            cursor.executemany("UPDATE api_knowledgebasechunk SET embedding_vector = %s::vector WHERE id = %s", batch)
+
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS api_kbchunk_embedding_hnsw "
+            "ON api_knowledgebasechunk USING hnsw (embedding_vector vector_cosine_ops)"
+        )
+
+
+def drop_vector_column(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("DROP INDEX IF EXISTS api_kbchunk_embedding_hnsw")
+        cursor.execute("ALTER TABLE api_knowledgebasechunk DROP COLUMN IF EXISTS embedding_vector")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0026_knowledgebasechunk_packed_embedding'),
+    ]
+
+    operations = [
+        migrations.RunPython(add_vector_column, drop_vector_column),
+    ]
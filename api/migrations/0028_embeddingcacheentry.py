@@ -0,0 +1,25 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0027_knowledgebasechunk_pgvector'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EmbeddingCacheEntry',
+            fields=[
+                ('key', models.CharField(help_text='sha256 du modèle et du texte', max_length=64, primary_key=True, serialize=False)),
+                ('model', models.CharField(max_length=100)),
+                ('embedding', models.BinaryField(help_text='Vecteur float32 packé (voir api/vectors.py)')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('last_used_at', models.DateTimeField(db_index=True)),
+            ],
+            options={
+                'verbose_name': 'Embedding en cache',
+                'verbose_name_plural': 'Embeddings en cache',
+            },
+        ),
+    ]
@@ -0,0 +1,29 @@
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def mark_ready_complete(apps, schema_editor):
+    Document = apps.get_model('api', 'KnowledgeBaseDocument')
+    Document.objects.filter(status='ready').update(progress=100)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0028_embeddingcacheentry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='knowledgebasedocument',
+            name='progress',
+            field=models.PositiveSmallIntegerField(default=0, help_text="Avancement de l'ingestion (0-100)"),
+        ),
+        migrations.AddField(
+            model_name='knowledgebasedocument',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.RunPython(mark_ready_complete, migrations.RunPython.noop),
+    ]
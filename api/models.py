@@ -292,11 +292,14 @@ class UserProfile(models.Model):
             parts.append(f"- Style d'écriture : {self.writing_style}")
         if self.bio:
             parts.append(f"- Bio : {self.bio}")
-        if self.example_posts:
-            parts.append(f"\nEXEMPLES DE POSTS QUE L'AUTEUR APPRÉCIE :\n{self.example_posts}")
+        # Free-form fields last, so the token budget trims them before the identity lines
         if self.additional_context:
             parts.append(f"\nCONTEXTE ADDITIONNEL :\n{self.additional_context}")
-        return "\n".join(parts)
+        if self.example_posts:
+            parts.append(f"\nEXEMPLES DE POSTS QUE L'AUTEUR APPRÉCIE :\n{self.example_posts}")
+        from django.conf import settings
+        from .tokens import trim_to_tokens
+        return trim_to_tokens("\n".join(parts), settings.PROMPT_BUDGET_PROFILE)
 
 
 class Subscription(models.Model):
@@ -493,8 +496,10 @@ class KnowledgeBaseDocument(models.Model):
     raw_text = models.TextField(blank=True, default='')
     chunk_count = models.IntegerField(default=0)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='processing')
+    progress = models.PositiveSmallIntegerField(default=0, help_text="Avancement de l'ingestion (0-100)")
     error_message = models.TextField(blank=True, default='')
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         ordering = ['-created_at']
@@ -511,7 +516,7 @@ class KnowledgeBaseChunk(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='kb_chunks')
     content = models.TextField()
     chunk_index = models.IntegerField()
-    embedding = models.JSONField(default=list, help_text="Vector embedding (1536 floats)")
+    embedding = models.BinaryField(default=bytes, help_text="Vector embedding packé (voir api/vectors.py)")
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
@@ -521,3 +526,48 @@ class KnowledgeBaseChunk(models.Model):
 
     def __str__(self):
         return f"Chunk {self.chunk_index} of {self.document.title[:30]}"
+
+
+class ModelCallRecord(models.Model):
+    """Appel à un fournisseur IA (journal en ajout seul, écrit par lots — voir api/ledger.py)."""
+    created_at = models.DateTimeField(db_index=True)
+    user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='model_calls')
+    endpoint = models.CharField(max_length=100, db_index=True)
+    provider = models.CharField(max_length=30)
+    model = models.CharField(max_length=100)
+    input_tokens = models.PositiveIntegerField(default=0)
+    output_tokens = models.PositiveIntegerField(default=0)
+    cache_read_tokens = models.PositiveIntegerField(default=0, help_text="Tokens de prompt lus depuis le cache Anthropic")
+    cache_creation_tokens = models.PositiveIntegerField(default=0, help_text="Tokens de prompt écrits dans le cache Anthropic")
+    tokens_estimated = models.BooleanField(default=False, help_text="Comptés avec tiktoken faute d'usage fourni")
+    latency_ms = models.PositiveIntegerField()
+    success = models.BooleanField(default=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        verbose_name = "Appel IA"
+        verbose_name_plural = "Appels IA"
+
+    def __str__(self):
+        return f"{self.endpoint} → {self.model} ({self.input_tokens}+{self.output_tokens} tokens, {self.latency_ms} ms)"
+
+    def save(self, *args, **kwargs):
+        if self.pk is not None:
+            raise ValueError("ModelCallRecord est en ajout seul")
+        super().save(*args, **kwargs)
+
+
+class EmbeddingCacheEntry(models.Model):
+    """Embedding déjà calculé, adressé par le hash (modèle, texte) — voir api/embedding_cache.py."""
+    key = models.CharField(max_length=64, primary_key=True, help_text="sha256 du modèle et du texte")
+    model = models.CharField(max_length=100)
+    embedding = models.BinaryField(help_text="Vecteur float32 packé (voir api/vectors.py)")
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_used_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        verbose_name = "Embedding en cache"
+        verbose_name_plural = "Embeddings en cache"
+
+    def __str__(self):
+        return f"{self.model} {self.key[:12]}"
@@ -5,7 +5,75 @@ Three independent axes:
   - Platform (linkedin, facebook, x) → format, length, style rules
   - Objective (audience_growth, job_search, lead_magnet) → mission, CTA, structure
   - use_profile (bool) → inject author context or keep impersonal
+
+Builders return a SystemPrompt: the static rules (shared by every user, cached by
+Anthropic) come first, the tone, profile, web and KB context come after. The
+prefix depends on the platform only: it lists every objective and tone, and the
+tail names the ones to apply, so the prefix is long enough to be cached
+(CACHE_MIN_TOKENS) and shared by every objective and tone.
 """
+import functools
+import logging
+
+from .tokens import count_tokens, fit_context
+
+logger = logging.getLogger(__name__)
+
+# Anthropic ignores cache_control on a prefix shorter than this many tokens
+CACHE_MIN_TOKENS = 1024
+CACHE_MIN_TOKENS_HAIKU = 2048
+
+
+def cache_min_tokens(model=None):
+    """Smallest prefix Anthropic caches for this model."""
+    return CACHE_MIN_TOKENS_HAIKU if model and 'haiku' in model else CACHE_MIN_TOKENS
+
+
+@functools.lru_cache(maxsize=256)
+def prefix_tokens(prefix):
+    """Token count of a static prefix (cl100k_base; prefixes are few, so it is memoized)."""
+    return count_tokens(prefix)
+
+
+def cacheable(prefix, model=None):
+    """
+    Whether a prefix is long enough for Anthropic's prompt cache. cl100k_base
+    tends to count fewer tokens than Anthropic's tokenizer, so borderline
+    prefixes are left unmarked rather than marked for nothing.
+    """
+    try:
+        return prefix_tokens(prefix) >= cache_min_tokens(model)
+    except Exception as e:
+        logger.warning(f"Prompt cache: token count failed, marking the prefix anyway: {e}")
+        return True
+
+
+class SystemPrompt(str):
+    """
+    System prompt made of a static prefix and a per-request tail.
+    It is the full prompt text for every provider; the Claude path sends the two
+    parts as separate blocks and marks the prefix for prompt caching.
+    """
+
+    def __new__(cls, prefix, tail=""):
+        prompt = super().__new__(cls, f"{prefix}\n\n{tail}" if tail else prefix)
+        prompt.prefix = prefix
+        prompt.tail = tail
+        return prompt
+
+    def with_context(self, *extra):
+        """Return a copy with more per-request context appended to the tail."""
+        parts = [self.tail, *extra] if self.tail else list(extra)
+        return SystemPrompt(self.prefix, "\n\n".join(p for p in parts if p))
+
+    def anthropic_blocks(self, model=None):
+        """System blocks for the Messages API, prefix marked cacheable when it is long enough."""
+        blocks = [{"type": "text", "text": self.prefix}]
+        if cacheable(self.prefix, model):
+            blocks[0]["cache_control"] = {"type": "ephemeral"}
+        if self.tail:
+            blocks.append({"type": "text", "text": self.tail})
+        return blocks
 
 
 # ── Platform-specific rules ──────────────────────────────────────────────
@@ -133,6 +201,59 @@ _OBJECTIVES = {
     },
 }
 
+# ── Tones and writing rules (static, part of every prefix) ───────────────
+
+_TONES = {
+    "professionnel": "expert et posé. Vocabulaire précis du métier, phrases nettes, affirmations étayées par un fait, "
+                     "un chiffre ou une expérience. Pas de familiarités, pas d'emphase gratuite, mais jamais froid ni "
+                     "administratif : on parle à des pairs.",
+    "inspirant": "élan et conviction. Part d'une difficulté réelle, montre le déclic ou la leçon, termine sur une "
+                 "perspective qui donne envie d'agir. Des phrases courtes qui rythment, une émotion sincère, "
+                 "aucune formule de développement personnel toute faite.",
+    "storytelling": "un récit. Situation de départ concrète (lieu, moment, personnage), tension ou obstacle, "
+                    "tournant, puis la leçon en une ou deux lignes. Des détails sensoriels et des dialogues courts "
+                    "plutôt que des généralités. La morale vient à la fin, jamais au début.",
+    "educatif": "pédagogue. Une notion par post, expliquée simplement : définition, exemple concret, erreur "
+                "fréquente, méthode en étapes numérotées. Le lecteur doit repartir avec quelque chose qu'il peut "
+                "appliquer aujourd'hui.",
+    "humoristique": "léger et complice. Autodérision, observation décalée du quotidien professionnel, chute "
+                    "inattendue. L'humour sert le message, il ne le remplace pas. Jamais moqueur envers un groupe, "
+                    "jamais vulgaire.",
+}
+
+_TONES_BLOCK = "TONS (applique uniquement le ton indiqué plus bas) :\n" + "\n".join(
+    f"- {name} : {description}" for name, description in _TONES.items()
+)
+
+_WRITING_RULES = """RÈGLES D'ÉCRITURE (toutes plateformes) :
+- Écris en français naturel, tel qu'on le parle entre professionnels. Tutoiement ou vouvoiement : garde le même du début à la fin
+- Une idée principale par post. Tout ce qui ne la sert pas est supprimé
+- Du concret avant tout : un exemple, un chiffre, un nom d'outil, une situation vécue valent mieux qu'un adjectif
+- Varie la longueur des phrases pour créer du rythme. Évite les paragraphes de plus de trois lignes
+- Bannis les formules creuses : "dans un monde en constante évolution", "plus que jamais", "game changer", "n'hésitez pas à", "en conclusion", "il est important de noter que"
+- Pas de liste de plus de 7 éléments, pas de sous-listes
+- N'invente ni chiffres, ni citations, ni études, ni noms de clients. Si le contexte ne donne pas de chiffre, raconte sans chiffre
+- Les informations fournies plus bas (profil, contexte web, base de connaissances) priment sur tes connaissances générales
+- Pas de markdown (ni **gras**, ni titres #) : les réseaux sociaux ne l'affichent pas
+- Le CTA final est unique et clair : une seule action demandée au lecteur
+- Relis-toi : pas de répétition du même mot dans deux phrases qui se suivent, pas de faute d'accord"""
+
+_POST_STRUCTURE = """STRUCTURE TYPE D'UN POST :
+1. Accroche : une phrase qui arrête le défilement (voir la règle n°1 ci-dessus)
+2. Contexte : pourquoi le sujet compte pour le lecteur, en deux lignes maximum
+3. Développement : l'histoire, l'argument ou la méthode, avec au moins un exemple concret
+4. Leçon ou prise de position : ce que le lecteur doit retenir, formulé simplement
+5. CTA : une seule action demandée, cohérente avec l'objectif
+
+EXEMPLES DE CTA (adapte-les à l'objectif et à la plateforme, ne les recopie pas mot pour mot) :
+- Engagement : "Et toi, tu aurais fait quoi à ma place ?"
+- Débat : "D'accord ou pas d'accord ? J'attends vos arguments en commentaire."
+- Sauvegarde : "Enregistre ce post pour le relire avant ta prochaine réunion."
+- Partage : "Si ça peut aider quelqu'un de ton réseau, partage-le."
+- Abonnement : "Je partage une méthode comme celle-ci chaque semaine. Abonne-toi pour ne pas rater la suivante."
+- Opportunités : "Je cherche mon prochain poste en [domaine] : mes messages privés sont ouverts."
+- Lead magnet : "Commente GUIDE et je t'envoie la checklist gratuite en message privé.\""""
+
 _NO_PROFILE_RULES = """IMPORTANT — POST IMPERSONNEL :
 - PAS de "je", PAS d'anecdote personnelle, PAS de personal branding
 - Parle du SUJET, pas de toi : faits, tendances, données, analyses
@@ -150,6 +271,16 @@ def _build_profile_block(profile, use_profile):
     return ""
 
 
+def _build_tail(tone, profile, use_profile, web_context=None, directives=()):
+    """Per-request part of the prompt: objective and other directives, tone, author profile (or impersonal rules), web context."""
+    profile, web_context = fit_context(profile, web_context)
+    parts = [*directives, f"TON : {tone}", _build_profile_block(profile, use_profile)]
+    if web_context:
+        parts.append("")
+        parts.append(web_context)
+    return "\n".join(parts)
+
+
 def _get_platform(platform):
     return _PLATFORMS.get(platform, _PLATFORMS["linkedin"])
 
@@ -158,6 +289,32 @@ def _get_objective(objective):
     return _OBJECTIVES.get(objective, _OBJECTIVES["audience_growth"])
 
 
+def _heading(instructions):
+    return instructions.strip().splitlines()[0]
+
+
+def _static_prefix(plat, task, *rules):
+    """The cached part of a post prompt: role, writing and platform rules, every objective and tone."""
+    return "\n\n".join([
+        f"Tu es un {plat['role_prefix']}. {task}",
+        _WRITING_RULES,
+        _POST_STRUCTURE,
+        plat["hook"],
+        plat["format"],
+        *rules,
+        "OBJECTIFS (applique uniquement l'objectif indiqué plus bas) :",
+        *(o["instructions"] for o in _OBJECTIVES.values()),
+        _TONES_BLOCK,
+    ])
+
+
+def _objective_directives(obj):
+    return [
+        f"OBJECTIF A APPLIQUER : « {_heading(obj['instructions'])} »",
+        f"TA MISSION : {obj['mission']}.",
+    ]
+
+
 def build_system_prompt(objective, tone, platform="linkedin", profile=None, web_context=None, use_profile=True):
     """
     Build the complete system prompt for post generation.
@@ -173,27 +330,8 @@ def build_system_prompt(objective, tone, platform="linkedin", profile=None, web_
     plat = _get_platform(platform)
     obj = _get_objective(objective)
 
-    role = f"Tu es un {plat['role_prefix']} spécialisé pour {obj['mission']}."
-
-    parts = [
-        role,
-        "",
-        obj["instructions"],
-        "",
-        plat["hook"],
-        "",
-        f"TON : {tone}",
-        "",
-        plat["format"],
-    ]
-
-    parts.append(_build_profile_block(profile, use_profile))
-
-    if web_context:
-        parts.append("")
-        parts.append(web_context)
-
-    return "\n".join(parts)
+    prefix = _static_prefix(plat, "Tu écris un post à partir du contexte fourni.")
+    return SystemPrompt(prefix, _build_tail(tone, profile, use_profile, web_context, _objective_directives(obj)))
 
 
 def build_variants_system_prompt(objective, tone, num_variants, platform="linkedin", profile=None, web_context=None, use_profile=True):
@@ -201,34 +339,19 @@ def build_variants_system_prompt(objective, tone, num_variants, platform="linked
     plat = _get_platform(platform)
     obj = _get_objective(objective)
 
-    role = f"Tu es un {plat['role_prefix']} spécialisé pour {obj['mission']}. Génère {num_variants} variantes RADICALEMENT DIFFÉRENTES."
-
-    parts = [
-        role,
-        "",
-        obj["instructions"],
-        "",
-        plat["hook"],
-        "",
-        f"""CHAQUE VARIANTE doit avoir :
+    prefix = _static_prefix(
+        plat,
+        "Tu génères plusieurs variantes RADICALEMENT DIFFÉRENTES d'un même post, au nombre indiqué plus bas.",
+        """CHAQUE VARIANTE doit avoir :
 - Un angle et une structure narrative différente
 - Une accroche utilisant une technique différente des autres variantes
-- Ton : {tone}""",
-        "",
-        plat["format"],
-        "",
+- Le TON indiqué plus bas""",
         """IMPORTANT : Sépare les variantes par "---VARIANTE---" (exactement ce séparateur).
 Ne numérote pas, commence directement par le contenu.
 Retourne UNIQUEMENT les posts, sans introduction ni commentaire.""",
-    ]
-
-    parts.append(_build_profile_block(profile, use_profile))
-
-    if web_context:
-        parts.append("")
-        parts.append(web_context)
-
-    return "\n".join(parts)
+    )
+    directives = [f"NOMBRE DE VARIANTES : {num_variants}", *_objective_directives(obj)]
+    return SystemPrompt(prefix, _build_tail(tone, profile, use_profile, web_context, directives))
 
 
 def build_single_variant_prompt(objective, tone, platform="linkedin", profile=None, use_profile=True):
@@ -236,31 +359,18 @@ def build_single_variant_prompt(objective, tone, platform="linkedin", profile=No
     plat = _get_platform(platform)
     obj = _get_objective(objective)
 
-    role = f"Tu es un {plat['role_prefix']} spécialisé pour {obj['mission']}. Génère UNE SEULE nouvelle variante."
-
-    parts = [
-        role,
-        "",
-        obj["instructions"],
-        "",
-        plat["hook"],
-        "",
-        f"TON : {tone}",
-        "",
-        plat["format"],
-        "",
+    prefix = _static_prefix(
+        plat,
+        "Génère UNE SEULE nouvelle variante.",
         "L'angle et l'accroche doivent être DIFFÉRENTS des variantes existantes.",
-    ]
-
-    parts.append(_build_profile_block(profile, use_profile))
-
-    return "\n".join(parts)
+    )
+    return SystemPrompt(prefix, _build_tail(tone, profile, use_profile, directives=_objective_directives(obj)))
 
 
 # Valid values for validation
 VALID_OBJECTIVES = list(_OBJECTIVES.keys())
 VALID_PLATFORMS = list(_PLATFORMS.keys())
-VALID_TONES = ['professionnel', 'inspirant', 'storytelling', 'educatif', 'humoristique']
+VALID_TONES = list(_TONES.keys())
 
 # Facebook emotional tones
 FACEBOOK_TONES = {
@@ -0,0 +1,325 @@
+"""
+Record/replay backend for external provider calls (load tests, CI, offline benchmarks).
+
+PROVIDER_BACKEND selects the mode:
+- 'live'   : real calls, nothing is touched (production).
+- 'record' : real calls, every provider response is saved under PROVIDER_CASSETTE_DIR.
+- 'replay' : no network for provider hosts. Saved responses are served with the
+             recorded latency (or PROVIDER_FAKE_LATENCY) and PROVIDER_FAKE_ERROR_RATE
+             injected failures, drawn from a seeded generator so runs are repeatable.
+
+Calls are intercepted at the HTTP transport (httpx for the Anthropic, OpenAI and
+Gemini SDKs, requests for Tavily, Hugging Face, Pexels, LinkedIn and Stripe), so
+SDK parsing, retries, the circuit breaker and the ledger behave as in production.
+Other hosts always go to the network.
+"""
+import asyncio
+import base64
+import hashlib
+import io
+import json
+import logging
+import math
+import os
+import random
+import threading
+import time
+from http.client import responses as HTTP_REASONS
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+PROVIDER_HOSTS = {
+    'api.anthropic.com': 'anthropic',
+    'api.openai.com': 'openai',
+    'generativelanguage.googleapis.com': 'gemini',
+    'api.tavily.com': 'tavily',
+    'router.huggingface.co': 'huggingface',
+    'api.pexels.com': 'pexels',
+    'images.pexels.com': 'pexels',
+    'api.linkedin.com': 'linkedin',
+    'www.linkedin.com': 'linkedin',
+    'api.stripe.com': 'stripe',
+}
+
+# Credentials and one-time values: left out of cassette keys and never written to disk
+# (redacted from recorded JSON responses, e.g. LinkedIn token exchanges and Stripe objects)
+SECRET_FIELDS = {'api_key', 'key', 'client_secret', 'code', 'access_token', 'refresh_token'}
+REDACTED = '[redacted]'
+
+# Response headers worth replaying (SDKs read the content type and request ids)
+KEPT_HEADERS = {'content-type', 'request-id', 'x-request-id', 'retry-after', 'etag', 'last-modified'}
+
+_lock = threading.Lock()
+_cursors = {}
+_rng = None
+_installed = False
+
+
+class ReplayMiss(Exception):
+    pass
+
+
+def install():
+    """Patch the httpx and requests transports when PROVIDER_BACKEND is not 'live'. Idempotent."""
+    global _installed, _rng
+    mode = settings.PROVIDER_BACKEND
+    if mode == 'live' or _installed:
+        return
+    if mode not in ('record', 'replay'):
+        raise ValueError(f"PROVIDER_BACKEND inconnu: {mode}")
+    _rng = random.Random(settings.PROVIDER_FAKE_SEED)
+    _install_requests()
+    _install_httpx()
+    _installed = True
+    logger.warning(f"Provider backend: {mode} ({settings.PROVIDER_CASSETTE_DIR})")
+
+
+def _provider_for(host):
+    return PROVIDER_HOSTS.get((host or '').lower())
+
+
+# ---------------------------------------------------------------------------
+# Cassettes
+# ---------------------------------------------------------------------------
+# One JSON file per distinct request: {provider}/{sha256}.json holding every
+# response recorded for it. Replay cycles through them in order.
+
+def _strip_secrets(pairs):
+    return sorted((k, v) for k, v in pairs if k not in SECRET_FIELDS)
+
+
+def _normalized_body(body):
+    if not body:
+        return ''
+    if not isinstance(body, (bytes, str)):
+        return 'stream'  # file or generator upload, matched on method and URL only
+    if isinstance(body, str):
+        body = body.encode()
+    try:
+        data = json.loads(body)
+    except ValueError:
+        pass
+    else:
+        if isinstance(data, dict):
+            data = {k: v for k, v in data.items() if k not in SECRET_FIELDS}
+        return json.dumps(data, sort_keys=True, ensure_ascii=False)
+    try:
+        text = body.decode()
+    except UnicodeDecodeError:
+        return 'sha256:' + hashlib.sha256(body).hexdigest()
+    if '=' in text and ' ' not in text:
+        return urlencode(_strip_secrets(parse_qsl(text, keep_blank_values=True)))
+    return text
+
+
+def _redact(data):
+    """Copy of decoded JSON with the string value of every SECRET_FIELDS key, at any depth, redacted."""
+    if isinstance(data, dict):
+        return {
+            k: REDACTED if k in SECRET_FIELDS and isinstance(v, str) else _redact(v)
+            for k, v in data.items()
+        }
+    if isinstance(data, list):
+        return [_redact(v) for v in data]
+    return data
+
+
+def _redacted_body(content):
+    """Response body to record: JSON bodies holding secrets are re-serialized without them."""
+    try:
+        data = json.loads(content)
+    except ValueError:
+        return content  # event streams, images, text
+    redacted = _redact(data)
+    if redacted == data:
+        return content  # recorded byte for byte
+    return json.dumps(redacted, ensure_ascii=False).encode()
+
+
+def _request_key(method, url, body):
+    parts = urlsplit(url)
+    query = urlencode(_strip_secrets(parse_qsl(parts.query, keep_blank_values=True)))
+    clean_url = urlunsplit((parts.scheme, parts.netloc, parts.path, query, ''))
+    normalized = _normalized_body(body)
+    key = hashlib.sha256(f"{method}\n{clean_url}\n{normalized}".encode()).hexdigest()
+    return key, {'method': method, 'url': clean_url, 'body': normalized[:2000]}
+
+
+def _cassette_path(provider, key):
+    return os.path.join(settings.PROVIDER_CASSETTE_DIR, provider, f"{key}.json")
+
+
+def _record(provider, key, request, status, headers, content, elapsed):
+    path = _cassette_path(provider, key)
+    content = _redacted_body(content)
+    try:
+        body, encoding = content.decode(), 'utf-8'
+    except UnicodeDecodeError:
+        body, encoding = base64.b64encode(content).decode(), 'base64'
+    entry = {
+        'status': status,
+        'headers': {k.lower(): v for k, v in headers.items() if k.lower() in KEPT_HEADERS},
+        'body': body,
+        'encoding': encoding,
+        'elapsed_ms': round(elapsed * 1000),
+    }
+    with _lock:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        cassette = {'request': request, 'responses': []}
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                cassette = json.load(f)
+        cassette['responses'].append(entry)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(cassette, f, ensure_ascii=False, indent=1)
+        os.replace(tmp, path)
+
+
+def _replay(provider, key, request):
+    """Next recorded response for this request, with the injected latency and fault applied."""
+    path = _cassette_path(provider, key)
+    try:
+        with open(path, encoding='utf-8') as f:
+            responses = json.load(f)['responses']
+    except FileNotFoundError:
+        raise ReplayMiss(f"Aucun enregistrement pour {request['method']} {request['url']} ({provider})")
+    with _lock:
+        cursor = _cursors.get(key, 0)
+        _cursors[key] = cursor + 1
+        entry = responses[cursor % len(responses)]
+        delay = _latency(provider, entry)
+        fault = _rng.random() < _error_rate(provider)
+    if fault:
+        entry = {
+            'status': settings.PROVIDER_FAKE_ERROR_STATUS,
+            'headers': {'content-type': 'application/json'},
+            'body': json.dumps({'error': {'type': 'overloaded_error', 'message': 'Injected fault'}}),
+            'encoding': 'utf-8',
+        }
+    content = entry['body'].encode() if entry['encoding'] == 'utf-8' else base64.b64decode(entry['body'])
+    return entry['status'], entry['headers'], content, delay
+
+
+def _latency(provider, entry):
+    """Seconds to wait: lognormal fitted on the configured p50/p95 (ms), else the recorded latency."""
+    dist = settings.PROVIDER_FAKE_LATENCY.get(provider) or settings.PROVIDER_FAKE_LATENCY.get('*')
+    if dist is None:
+        return entry.get('elapsed_ms', 0) / 1000
+    p50 = dist.get('p50', 0)
+    if p50 <= 0:
+        return 0
+    sigma = math.log(max(dist.get('p95', p50), p50) / p50) / 1.645
+    return _rng.lognormvariate(math.log(p50), sigma) / 1000
+
+
+def _error_rate(provider):
+    rates = settings.PROVIDER_FAKE_ERROR_RATE
+    return rates.get(provider, rates.get('*', 0))
+
+
+# ---------------------------------------------------------------------------
+# Transports
+# ---------------------------------------------------------------------------
+
+def _install_httpx():
+    import httpx
+
+    send = httpx.HTTPTransport.handle_request
+    asend = httpx.AsyncHTTPTransport.handle_async_request
+
+    def build(status, headers, content, request):
+        return httpx.Response(status, headers=headers, content=content, request=request)
+
+    def handle_request(transport, request):
+        provider = _provider_for(request.url.host)
+        if provider is None:
+            return send(transport, request)
+        key, meta = _request_key(request.method, str(request.url), request.read())
+        if settings.PROVIDER_BACKEND == 'replay':
+            try:
+                status, headers, content, delay = _replay(provider, key, meta)
+            except ReplayMiss as e:
+                raise httpx.ConnectError(str(e), request=request)
+            time.sleep(delay)
+            return build(status, headers, content, request)
+        start = time.monotonic()
+        response = send(transport, request)
+        content = response.read()
+        response.close()
+        _record(provider, key, meta, response.status_code, response.headers, content, time.monotonic() - start)
+        return build(response.status_code, _decoded_headers(response.headers), content, request)
+
+    async def handle_async_request(transport, request):
+        provider = _provider_for(request.url.host)
+        if provider is None:
+            return await asend(transport, request)
+        key, meta = _request_key(request.method, str(request.url), await request.aread())
+        if settings.PROVIDER_BACKEND == 'replay':
+            try:
+                status, headers, content, delay = _replay(provider, key, meta)
+            except ReplayMiss as e:
+                raise httpx.ConnectError(str(e), request=request)
+            await asyncio.sleep(delay)
+            return build(status, headers, content, request)
+        start = time.monotonic()
+        response = await asend(transport, request)
+        content = await response.aread()
+        await response.aclose()
+        _record(provider, key, meta, response.status_code, response.headers, content, time.monotonic() - start)
+        return build(response.status_code, _decoded_headers(response.headers), content, request)
+
+    httpx.HTTPTransport.handle_request = handle_request
+    httpx.AsyncHTTPTransport.handle_async_request = handle_async_request
+
+
+def _install_requests():
+    import requests
+    from requests.adapters import HTTPAdapter
+    from requests.structures import CaseInsensitiveDict
+    from requests.utils import get_encoding_from_headers
+
+    send = HTTPAdapter.send
+
+    def build(status, headers, content, request):
+        response = requests.Response()
+        response.status_code = status
+        response.reason = HTTP_REASONS.get(status, '')
+        response.headers = CaseInsensitiveDict(headers)
+        response.encoding = get_encoding_from_headers(response.headers)
+        # Body already in memory: iter_content/iter_lines slice it, close() is a no-op,
+        # and raw stays readable for callers that stream from it
+        response._content = content
+        response._content_consumed = True
+        response.raw = io.BytesIO(content)
+        response.url = request.url
+        response.request = request
+        return response
+
+    def patched_send(adapter, request, **kwargs):
+        provider = _provider_for(urlsplit(request.url).hostname)
+        if provider is None:
+            return send(adapter, request, **kwargs)
+        key, meta = _request_key(request.method, request.url, request.body)
+        if settings.PROVIDER_BACKEND == 'replay':
+            try:
+                status, headers, content, delay = _replay(provider, key, meta)
+            except ReplayMiss as e:
+                raise requests.ConnectionError(str(e), request=request)
+            time.sleep(delay)
+            return build(status, headers, content, request)
+        start = time.monotonic()
+        response = send(adapter, request, **kwargs)
+        content = response.content
+        _record(provider, key, meta, response.status_code, response.headers, content, time.monotonic() - start)
+        return build(response.status_code, _decoded_headers(response.headers), content, request)
+
+    HTTPAdapter.send = patched_send
+
+
+def _decoded_headers(headers):
+    # Bodies are read decoded, so the transfer headers no longer apply
+    return {k: v for k, v in headers.items() if k.lower() not in ('content-encoding', 'content-length', 'transfer-encoding')}
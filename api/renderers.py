@@ -0,0 +1,27 @@
+"""
+Renderer for the Server-Sent Events endpoints.
+
+The streams themselves are StreamingHttpResponse objects built by the views, so
+DRF never renders them. This renderer only makes `Accept: text/event-stream`
+acceptable during content negotiation (JSONRenderer alone answers 406 before the
+view runs), and sends the endpoint's ordinary responses (validation errors,
+quota, open circuit) as a single SSE event the stream client can read.
+"""
+import json
+
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+
+
+class EventStreamRenderer(BaseRenderer):
+    media_type = 'text/event-stream'
+    format = 'event-stream'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return f"data: {json.dumps(data, ensure_ascii=False)}\n\n".encode()
+
+
+# Renderers of the endpoints with an SSE variant: JSON by default
+STREAMING_RENDERERS = [JSONRenderer, EventStreamRenderer]
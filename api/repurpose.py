@@ -14,6 +14,7 @@ from django.conf import settings
 import anthropic
 
 from .views import get_user_context
+from .llm import claude_message, claude_model
 
 logger = logging.getLogger(__name__)
 
@@ -174,11 +175,10 @@ def extract_url_content(request):
         )
 
     try:
-        client = anthropic.Anthropic(api_key=settings.ANTHROPIC_API_KEY)
         user_context = get_user_context(request)
 
-        message = client.messages.create(
-            model="claude-sonnet-4-20250514",
+        message = claude_message(
+            model=claude_model(),
             max_tokens=1500,
             system=f"""Tu es un expert en analyse de contenu. Extrais et résume le contenu principal de cette page web.
 
@@ -276,11 +276,10 @@ def extract_multi_posts(request):
         )
 
     try:
-        client = anthropic.Anthropic(api_key=settings.ANTHROPIC_API_KEY)
         user_context = get_user_context(request)
 
-        message = client.messages.create(
-            model="claude-sonnet-4-20250514",
+        message = claude_message(
+            model=claude_model('long_form'),
             max_tokens=2500,
             system=f"""Tu es un expert en content marketing LinkedIn.
 À partir du contenu fourni, extrais 5 à 6 idées de posts LinkedIn DISTINCTES.
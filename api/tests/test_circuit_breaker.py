@@ -0,0 +1,69 @@
+"""Breaker outcomes of abandoned and refused calls (api/circuit_breaker.py, api/llm.py)."""
+import shutil
+import tempfile
+from unittest import mock
+
+from django.test import SimpleTestCase, override_settings
+
+from api import circuit_breaker, llm
+from api.circuit_breaker import ProviderUnavailable, guard
+
+PROVIDER = 'test-provider'
+
+
+class GuardOutcomeTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        settings = override_settings(
+            CIRCUIT_BREAKER_DB=f"{directory}/breaker.sqlite3",
+            CIRCUIT_BREAKER_FAILURE_THRESHOLD=5,
+            CIRCUIT_BREAKER_COOLDOWN=30,
+            PROVIDER_CONCURRENCY_MAX=16,
+            PROVIDER_CONCURRENCY_MIN=1,
+            PROVIDER_LEASE_TTL=150,
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+        # Connections are cached per thread: open one on this test's file
+        patcher = mock.patch.object(circuit_breaker, '_local', circuit_breaker.threading.local())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        for _ in range(2):
+            with self.assertRaises(TimeoutError), guard(PROVIDER):
+                raise TimeoutError
+
+    def _state(self):
+        with circuit_breaker._transaction() as conn:
+            circuit, failures, _open_until, _limit = circuit_breaker._load_state(conn, PROVIDER)
+            leases = conn.execute('SELECT COUNT(*) FROM provider_lease').fetchone()[0]
+        return circuit, failures, leases
+
+    def _stream(self):
+        with guard(PROVIDER):
+            yield 'Bon'
+            yield 'jour'
+
+    def test_closed_stream_returns_the_lease_without_an_outcome(self):
+        stream = self._stream()
+        next(stream)
+        stream.close()  # client disconnected mid-stream
+
+        self.assertEqual(self._state(), ('closed', 2, 0))
+
+    def test_finished_stream_counts_as_success(self):
+        self.assertEqual(list(self._stream()), ['Bon', 'jour'])
+
+        self.assertEqual(self._state(), ('closed', 0, 0))
+
+    def test_open_circuit_is_not_a_model_failure(self):
+        refused = ProviderUnavailable(PROVIDER, 30)
+        with mock.patch.object(llm, 'guard', side_effect=refused), \
+                mock.patch.object(llm, '_model_stats', {}), \
+                mock.patch.object(llm, '_note_fallback'):
+            with self.assertRaises(ProviderUnavailable):
+                list(llm._stream_routed(['claude'], 'system', 'message', 16))
+            stats = llm._stats('claude')
+
+        self.assertEqual((stats.successes, stats.failures), (0, 0))
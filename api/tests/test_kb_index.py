@@ -0,0 +1,40 @@
+"""Per-user ANN index files (api/kb_index.py)."""
+import shutil
+import tempfile
+
+import numpy as np
+from django.test import SimpleTestCase, override_settings
+
+from api import kb_index
+
+USER_ID = 7
+DIMS = 16
+
+
+def _unit(matrix):
+    return (matrix / np.linalg.norm(matrix, axis=-1, keepdims=True)).astype(np.float32)
+
+
+class IndexAppendTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        settings = override_settings(KB_INDEX_DIR=directory, KB_INDEX_IVF_MIN_CHUNKS=10_000, KB_INDEX_NPROBE=8)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.matrix = _unit(np.random.default_rng(0).standard_normal((12, DIMS)))
+
+    def test_append_after_an_interrupted_append_keeps_rows_aligned(self):
+        kb_index.rebuild(USER_ID, list(range(100, 106)), self.matrix[:6])
+
+        # A worker killed mid-append: two vectors and one id written, no lists row, meta untouched
+        meta = kb_index._read_meta(USER_ID)
+        with open(kb_index._path(USER_ID, 'vectors', meta['gen']), 'ab') as f:
+            self.matrix[10:12].tofile(f)
+        with open(kb_index._path(USER_ID, 'ids', meta['gen']), 'ab') as f:
+            np.asarray([999], dtype=np.int64).tofile(f)
+
+        kb_index.add(USER_ID, list(range(106, 110)), self.matrix[6:10])
+
+        for row, chunk_id in enumerate(range(100, 110)):
+            self.assertEqual(kb_index.search(USER_ID, self.matrix[row], 1, 10), [chunk_id])
@@ -0,0 +1,67 @@
+"""Stalled background ingestion surfaces as an error when documents are read (api/knowledge_base.py)."""
+from datetime import timedelta
+from unittest import mock
+
+import numpy as np
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from api import knowledge_base
+from api.knowledge_base import get_document, list_documents
+from api.models import KnowledgeBaseChunk, KnowledgeBaseDocument
+
+
+@override_settings(KB_INGEST_TIMEOUT=600)
+class StaleDocumentTests(TestCase):
+    def setUp(self):
+        self.factory = APIRequestFactory()
+        self.user = User.objects.create_user('owner')
+        self.other = User.objects.create_user('other')
+        self.stalled = self._document(self.user, minutes_ago=30)
+        self.running = self._document(self.user, minutes_ago=1)
+        self.other_stalled = self._document(self.other, minutes_ago=30)
+
+    def _document(self, user, minutes_ago):
+        document = KnowledgeBaseDocument.objects.create(
+            user=user, title='doc', source_type='paste', status='processing',
+        )
+        # updated_at is auto_now: backdate it with a queryset update
+        KnowledgeBaseDocument.objects.filter(pk=document.pk).update(
+            updated_at=timezone.now() - timedelta(minutes=minutes_ago),
+        )
+        return document
+
+    def _get(self, view, *args):
+        request = self.factory.get('/')
+        force_authenticate(request, user=self.user)
+        return view(request, *args)
+
+    def test_polling_fails_a_stalled_document(self):
+        response = self._get(get_document, self.stalled.pk)
+
+        self.assertEqual(response.data['status'], 'error')
+        self.assertTrue(response.data['error_message'])
+
+    def test_listing_fails_only_the_users_stalled_documents(self):
+        response = self._get(list_documents)
+
+        statuses = {doc['id']: doc['status'] for doc in response.data}
+        self.assertEqual(statuses, {self.stalled.pk: 'error', self.running.pk: 'processing'})
+        self.other_stalled.refresh_from_db()
+        self.assertEqual(self.other_stalled.status, 'processing')
+
+    def test_late_ingestion_does_not_revive_a_stalled_document(self):
+        self.stalled.raw_text = 'Un paragraphe sur la stratégie de contenu. ' * 50
+        self._get(get_document, self.stalled.pk)  # marked as failed
+
+        # The original ingestion thread finishes afterwards
+        with mock.patch.object(knowledge_base, 'embed_texts', side_effect=lambda texts: [np.ones(8)] * len(texts)), \
+                mock.patch.object(knowledge_base.kb_pgvector, 'available', return_value=False):
+            knowledge_base.process_document(self.stalled)
+
+        self.stalled.refresh_from_db()
+        self.assertEqual(self.stalled.status, 'error')
+        self.assertEqual(self.stalled.error_message, 'Traitement interrompu, veuillez réimporter le document')
+        self.assertFalse(KnowledgeBaseChunk.objects.filter(document=self.stalled).exists())
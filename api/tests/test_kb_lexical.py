@@ -0,0 +1,53 @@
+"""Worker-side cache of the BM25 log across rewrites (api/kb_lexical.py)."""
+import os
+import shutil
+import tempfile
+from unittest import mock
+
+from django.test import SimpleTestCase, override_settings
+
+from api import kb_lexical
+
+USER_ID = 7
+
+
+def _same_inode(stat):
+    # What the filesystem may do: give the replaced log's inode to the new one
+    def wrapper(*args, **kwargs):
+        result = stat(*args, **kwargs)
+        return os.stat_result((result.st_mode, 1, *result[2:]))
+    return wrapper
+
+
+class LexicalCacheTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        settings = override_settings(KB_INDEX_DIR=directory, KB_LEXICAL_CACHE_USERS=8)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.addCleanup(kb_lexical._cache.clear)
+        kb_lexical._cache.clear()
+
+    def test_rebuild_reusing_the_inode_is_reread(self):
+        with mock.patch.object(kb_lexical.os, 'stat', _same_inode(os.stat)), \
+                mock.patch.object(kb_lexical.os, 'fstat', _same_inode(os.fstat)):
+            kb_lexical.rebuild(USER_ID, [(1, 'stratégie de contenu'), (2, 'prospection commerciale')])
+            self.assertEqual(kb_lexical.search(USER_ID, 'stratégie', 5, 2), [1])
+
+            # Same inode, longer log: a cache keyed on the inode would read from the old offset
+            kb_lexical.rebuild(USER_ID, [(10 + i, f'recrutement poste {i}') for i in range(5)])
+            self.assertEqual(sorted(kb_lexical.search(USER_ID, 'recrutement', 10, 5)), [10, 11, 12, 13, 14])
+
+            # Same inode, shorter log
+            kb_lexical.rebuild(USER_ID, [(20, 'stratégie')])
+            self.assertEqual(kb_lexical.search(USER_ID, 'stratégie', 5, 1), [20])
+
+    def test_appends_and_compaction(self):
+        kb_lexical.rebuild(USER_ID, [(1, 'marketing digital'), (2, 'marketing local'), (3, 'vente')])
+        kb_lexical.add(USER_ID, [(4, 'marketing produit')])
+        self.assertEqual(sorted(kb_lexical.search(USER_ID, 'marketing', 5, 4)), [1, 2, 4])
+
+        kb_lexical.remove(USER_ID, [1, 2])  # over the dead ratio: the log is rewritten
+        self.assertEqual(kb_lexical.search(USER_ID, 'marketing', 5, 2), [4])
+        self.assertIsNone(kb_lexical.search(USER_ID, 'marketing', 5, 4))
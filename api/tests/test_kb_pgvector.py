@@ -0,0 +1,93 @@
+"""
+Filtered HNSW search across users (api/kb_pgvector.py). Needs PostgreSQL with
+the vector extension (migration 0027); skipped on other databases.
+"""
+from unittest import mock
+
+import numpy as np
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase, override_settings
+
+from api import kb_pgvector, vectors
+from api.knowledge_base import retrieve_relevant_chunks
+from api.models import KnowledgeBaseChunk, KnowledgeBaseDocument
+
+OTHER_USERS = 19
+DECOYS_PER_USER = 10
+TARGET_CHUNKS = 40
+K = 10
+
+
+def _unit(matrix):
+    return (matrix / np.linalg.norm(matrix, axis=-1, keepdims=True)).astype(np.float32)
+
+
+@override_settings(KB_VECTOR_BACKEND='auto')
+class FilteredSearchTests(TestCase):
+    def setUp(self):
+        # Checked against the test database, not whatever a previous run cached
+        for name in ('_available', '_version'):
+            patcher = mock.patch.object(kb_pgvector, name, None)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        if connection.vendor != 'postgresql' or not kb_pgvector.available():
+            self.skipTest('PostgreSQL with pgvector required')
+
+        rng = np.random.default_rng(0)
+        dims = kb_pgvector.DIMENSIONS
+        self.target = User.objects.create_user('target')
+        target_vectors = _unit(rng.standard_normal((TARGET_CHUNKS, dims)))
+        # The query sits between K of the target's chunks: those are its exact top-k
+        self.expected = list(range(K))
+        self.query = vectors.normalize(target_vectors[:K].sum(axis=0))
+        self.target_ids = self._add_document(self.target, 'ready', target_vectors)
+
+        # Other users' chunks and the target's unfinished document are all closer to the
+        # query than any of the target's ready chunks, so a post-filtered scan finds none
+        self._add_document(self.target, 'processing', _unit(self.query + 0.05 * rng.standard_normal((5, dims))))
+        for i in range(OTHER_USERS):
+            user = User.objects.create_user(f'other{i}')
+            self._add_document(user, 'ready', _unit(self.query + 0.05 * rng.standard_normal((DECOYS_PER_USER, dims))))
+
+    def _add_document(self, user, status, matrix, store=True):
+        document = KnowledgeBaseDocument.objects.create(
+            user=user, title=f'{user.username} {status}', source_type='paste', status=status,
+        )
+        chunks = KnowledgeBaseChunk.objects.bulk_create([
+            KnowledgeBaseChunk(
+                document=document, user=user, content=f'{user.username} {status} {i}', chunk_index=i,
+                embedding=vectors.pack(vector),
+            )
+            for i, vector in enumerate(matrix)
+        ])
+        ids = [chunk.id for chunk in chunks]
+        if store:
+            kb_pgvector.store(ids, matrix)
+        return ids
+
+    def test_returns_k_of_the_users_ready_chunks(self):
+        ids = kb_pgvector.search(self.target.id, self.query, K)
+
+        self.assertEqual(len(ids), K)
+        self.assertEqual(set(ids), {self.target_ids[i] for i in self.expected})
+
+    def test_every_user_gets_its_own_top_k(self):
+        for user in User.objects.exclude(pk=self.target.pk):
+            ids = kb_pgvector.search(user.id, self.query, K)
+            own = set(KnowledgeBaseChunk.objects.filter(user=user).values_list('id', flat=True))
+            self.assertEqual(len(ids), DECOYS_PER_USER)
+            self.assertLessEqual(set(ids), own)
+
+    def test_retrieval_falls_back_to_exact_when_short(self):
+        # Chunks without the pgvector column (e.g. stored before migration 0027)
+        user = User.objects.create_user('partial')
+        matrix = _unit(np.random.default_rng(1).standard_normal((8, kb_pgvector.DIMENSIONS)))
+        ids = self._add_document(user, 'ready', matrix, store=False)
+        kb_pgvector.store(ids[:2], matrix[:2])
+
+        with mock.patch('api.knowledge_base.embed_texts', return_value=[matrix[5]]):
+            context = retrieve_relevant_chunks(user, 'sujet', top_k=5)
+
+        self.assertEqual(context.count('--- ['), 5)
+        self.assertIn('partial ready 5', context)
@@ -0,0 +1,23 @@
+"""Latency percentiles shared by the usage summary and the hedge deadline (api/ledger.py)."""
+from django.test import SimpleTestCase
+
+from api.ledger import percentile
+
+
+class PercentileTests(SimpleTestCase):
+    def test_nearest_rank_rounds_up(self):
+        ordered = list(range(1, 11))
+        self.assertEqual(percentile(ordered, 0.95), 10)
+        self.assertEqual(percentile(ordered, 0.5), 5)
+        self.assertEqual(percentile(ordered, 0.99), 10)
+
+    def test_exact_ranks(self):
+        ordered = list(range(1, 101))
+        self.assertEqual(percentile(ordered, 0.95), 95)
+        self.assertEqual(percentile(list(range(1, 21)), 0.95), 19)
+
+    def test_small_samples(self):
+        self.assertEqual(percentile([7], 0.5), 7)
+        self.assertEqual(percentile([7], 0.95), 7)
+        self.assertEqual(percentile([1, 2], 0.5), 1)
+        self.assertEqual(percentile([1, 2], 0.95), 2)
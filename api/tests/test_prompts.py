@@ -0,0 +1,49 @@
+"""Static prompt prefixes long enough for Anthropic's prompt cache (api/prompts.py, api/consultants.py)."""
+from django.test import SimpleTestCase
+
+from api.consultants import CONSULTANTS, consultant_system_prompt
+from api.prompts import (
+    CACHE_MIN_TOKENS, VALID_OBJECTIVES, VALID_PLATFORMS, VALID_TONES, build_single_variant_prompt,
+    build_system_prompt, build_variants_system_prompt, prefix_tokens,
+)
+
+MODEL = 'claude-sonnet-4-5'
+
+
+def _builders(objective, tone, platform):
+    return {
+        'post': build_system_prompt(objective, tone, platform),
+        'variants': build_variants_system_prompt(objective, tone, 3, platform),
+        'variant': build_single_variant_prompt(objective, tone, platform),
+    }
+
+
+class PromptCacheTests(SimpleTestCase):
+    def test_post_prefixes_are_cached(self):
+        for platform in VALID_PLATFORMS:
+            for name, prompt in _builders('audience_growth', 'professionnel', platform).items():
+                with self.subTest(platform=platform, builder=name):
+                    self.assertGreaterEqual(prefix_tokens(prompt.prefix), CACHE_MIN_TOKENS)
+                    self.assertIn('cache_control', prompt.anthropic_blocks(MODEL)[0])
+
+    def test_post_prefix_depends_on_the_platform_only(self):
+        for platform in VALID_PLATFORMS:
+            reference = _builders('audience_growth', 'professionnel', platform)
+            for objective in VALID_OBJECTIVES:
+                for tone in VALID_TONES:
+                    for name, prompt in _builders(objective, tone, platform).items():
+                        self.assertEqual(prompt.prefix, reference[name].prefix)
+                        self.assertIn(f"TON : {tone}", prompt.tail)
+
+    def test_tail_names_the_objective(self):
+        prompt = build_variants_system_prompt('lead_magnet', 'inspirant', 4, 'x')
+
+        self.assertIn("OBJECTIF A APPLIQUER : « OBJECTIF : LEAD MAGNET — GÉNÉRER DES COMMENTAIRES »", prompt.tail)
+        self.assertIn("NOMBRE DE VARIANTES : 4", prompt.tail)
+
+    def test_consultant_prompts_are_cached(self):
+        for key in CONSULTANTS:
+            with self.subTest(consultant=key):
+                prompt = consultant_system_prompt(key)
+                self.assertGreaterEqual(prefix_tokens(prompt.prefix), CACHE_MIN_TOKENS)
+                self.assertIn('cache_control', prompt.anthropic_blocks(MODEL)[0])
@@ -0,0 +1,144 @@
+"""Record/replay round trips through the requests transport (api/provider_replay.py)."""
+import http.server
+import json
+import os
+import random
+import shutil
+import tempfile
+import threading
+from unittest import mock
+
+import requests
+from django.test import SimpleTestCase, override_settings
+from requests.adapters import HTTPAdapter
+
+from api import provider_replay
+
+EVENTS = (
+    b'data: {"token": {"text": "Bon"}}\n\n'
+    b'data: {"token": {"text": "jour"}}\n\n'
+    b'data: [DONE]\n\n'
+)
+IMAGE = bytes(range(256)) * 1024
+ACCESS_TOKEN = 'AQV8-access-token-do-not-record'
+REFRESH_TOKEN = 'AQX2-refresh-token-do-not-record'
+TOKEN_RESPONSE = json.dumps({
+    'access_token': ACCESS_TOKEN,
+    'expires_in': 5184000,
+    'refresh_token': REFRESH_TOKEN,
+    'scope': 'openid profile w_member_social',
+    'nested': [{'client_secret': 'pi_secret_do-not-record', 'id': 'pi_1'}],
+}).encode()
+
+
+class _Origin(http.server.BaseHTTPRequestHandler):
+    """Hugging Face-style event stream on POST, a LinkedIn-style token exchange, a binary image on GET."""
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers['Content-Length']))
+        if self.path.startswith('/oauth/'):
+            self._send('application/json', TOKEN_RESPONSE)
+        else:
+            self._send('text/event-stream', EVENTS)
+
+    def do_GET(self):
+        self._send('image/png', IMAGE)
+
+    def _send(self, content_type, body):
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class RequestsReplayTests(SimpleTestCase):
+    def setUp(self):
+        self.server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), _Origin)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.base_url = f"http://127.0.0.1:{self.server.server_port}"
+
+        self.cassettes = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.cassettes, ignore_errors=True)
+
+        # Treat the local origin as a provider host and restore the real transport afterwards
+        for patcher in (
+            mock.patch.dict(provider_replay.PROVIDER_HOSTS, {'127.0.0.1': 'huggingface'}),
+            mock.patch.object(provider_replay, '_rng', random.Random(0)),
+            mock.patch.object(HTTPAdapter, 'send', HTTPAdapter.send),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        provider_replay._install_requests()
+
+    def _record_then_replay(self, call):
+        with override_settings(PROVIDER_BACKEND='record', PROVIDER_CASSETTE_DIR=self.cassettes):
+            recorded = call()
+        self.server.shutdown()  # replay must not need the origin
+        with override_settings(
+            PROVIDER_BACKEND='replay',
+            PROVIDER_CASSETTE_DIR=self.cassettes,
+            PROVIDER_FAKE_LATENCY={'*': {'p50': 0}},
+            PROVIDER_FAKE_ERROR_RATE={},
+        ):
+            replayed = call()
+        return recorded, replayed
+
+    def test_streamed_event_lines(self):
+        def call():
+            # Same pattern as llm._stream_mistral
+            response = requests.post(
+                f"{self.base_url}/models/test", json={'inputs': 'Bonjour', 'stream': True}, stream=True, timeout=5,
+            )
+            with response:
+                response.raise_for_status()
+                self.assertIn('text/event-stream', response.headers['Content-Type'])
+                return [line for line in response.iter_lines(decode_unicode=True) if line]
+
+        recorded, replayed = self._record_then_replay(call)
+        self.assertEqual(recorded, [line for line in EVENTS.decode().split('\n') if line])
+        self.assertEqual(replayed, recorded)
+
+    def test_streamed_binary_chunks(self):
+        def call():
+            # Same pattern as websearch.proxy_image
+            response = requests.get(f"{self.base_url}/photo.png", stream=True, timeout=5)
+            try:
+                return b''.join(response.iter_content(64 * 1024))
+            finally:
+                response.close()
+
+        recorded, replayed = self._record_then_replay(call)
+        self.assertEqual(recorded, IMAGE)
+        self.assertEqual(replayed, IMAGE)
+
+    def test_token_responses_are_redacted(self):
+        def call():
+            # Same pattern as linkedin.linkedin_callback
+            response = requests.post(
+                f"{self.base_url}/oauth/v2/accessToken",
+                data={'grant_type': 'authorization_code', 'code': 'one-time-code', 'client_secret': 'shh'},
+                timeout=5,
+            )
+            response.raise_for_status()
+            return response.json()
+
+        recorded, replayed = self._record_then_replay(call)
+        self.assertEqual(recorded['access_token'], ACCESS_TOKEN)  # the live caller still gets it
+
+        cassettes = ''
+        for directory, _dirs, files in os.walk(self.cassettes):
+            for name in files:
+                with open(os.path.join(directory, name), encoding='utf-8') as f:
+                    cassettes += f.read()
+        for secret in (ACCESS_TOKEN, REFRESH_TOKEN, 'pi_secret_do-not-record', 'one-time-code', 'shh'):
+            self.assertNotIn(secret, cassettes)
+
+        self.assertEqual(replayed['access_token'], provider_replay.REDACTED)
+        self.assertEqual(replayed['nested'][0], {'client_secret': provider_replay.REDACTED, 'id': 'pi_1'})
+        self.assertEqual(replayed['expires_in'], 5184000)
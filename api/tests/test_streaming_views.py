@@ -0,0 +1,61 @@
+"""SSE variants of the generation endpoints under `Accept: text/event-stream` (api/views.py)."""
+import json
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.test import TestCase
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from api import views
+
+SSE = 'text/event-stream'
+
+
+def _events(body):
+    return [json.loads(line[len('data: '):]) for line in body.split('\n\n') if line and line != 'data: [DONE]']
+
+
+class EventStreamAcceptTests(TestCase):
+    def setUp(self):
+        self.factory = APIRequestFactory()
+        self.user = User.objects.create_user('author')
+        for name, value in (
+            ('get_user_plan', 'pro'),
+            ('resolve_model', 'claude'),
+            ('validate_model_access', (True, None)),
+            ('get_user_context', None),
+        ):
+            patcher = mock.patch.object(views, name, return_value=value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def _post(self, data, url='/api/variants/regenerate/', **headers):
+        request = self.factory.post(url, data, format='json', **headers)
+        force_authenticate(request, user=self.user)
+        return views.regenerate_single_variant(request)
+
+    def test_event_stream_only_client_gets_the_stream(self):
+        with mock.patch.object(views, 'stream_text', return_value=iter(['Bon', 'jour\n#IA'])):
+            response = self._post({'summary': 'Lancement produit'}, HTTP_ACCEPT=SSE)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], SSE)
+        events = _events(b''.join(response.streaming_content).decode())
+        self.assertEqual([e['text'] for e in events[:-1]], ['Bon', 'jour\n#IA'])
+        self.assertEqual(events[-1]['hashtags'], ['#IA'])
+
+    def test_errors_are_sent_as_an_event(self):
+        response = self._post({'summary': ' '}, HTTP_ACCEPT=SSE)
+        response.render()
+
+        self.assertEqual(response.status_code, 400)
+        self.assertTrue(response['Content-Type'].startswith(SSE))
+        self.assertEqual(_events(response.content.decode()), [{'error': 'Le résumé est requis pour régénérer'}])
+
+    def test_json_clients_are_unchanged(self):
+        with mock.patch.object(views, 'generate_text', return_value='Bonjour\n#IA'):
+            response = self._post({'summary': 'Lancement produit'}, HTTP_ACCEPT='application/json')
+        response.render()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content)['variant'], 'Bonjour')
@@ -0,0 +1,56 @@
+"""Coalesced web searches (api/websearch.py)."""
+import threading
+import time
+
+from django.test import SimpleTestCase
+
+from api.circuit_breaker import ProviderUnavailable
+from api.websearch import single_flight
+
+WAITERS = 4
+
+
+class SingleFlightTests(SimpleTestCase):
+    def _run(self, error):
+        release = threading.Event()
+        raised = [None] * (WAITERS + 1)
+
+        def fn():
+            release.wait(5)
+            raise error
+
+        def caller(i):
+            try:
+                single_flight('key', fn, timeout=5)
+            except Exception as e:
+                raised[i] = e
+
+        threads = [threading.Thread(target=caller, args=(i,)) for i in range(WAITERS + 1)]
+        threads[0].start()
+        time.sleep(0.05)  # the first caller leads
+        for thread in threads[1:]:
+            thread.start()
+        time.sleep(0.05)
+        release.set()
+        for thread in threads:
+            thread.join(5)
+        return raised
+
+    def test_each_waiter_raises_its_own_copy(self):
+        leader_error = ValueError('Tavily a répondu 400')
+        leader, *waiters = self._run(leader_error)
+
+        self.assertIs(leader, leader_error)
+        self.assertEqual(len({id(e) for e in waiters}), WAITERS)
+        for error in waiters:
+            self.assertIsInstance(error, ValueError)
+            self.assertIsNot(error, leader_error)
+            self.assertEqual(error.args, leader_error.args)
+            self.assertIs(error.__cause__, leader_error)
+
+    def test_open_circuit_keeps_its_retry_after(self):
+        _leader, *waiters = self._run(ProviderUnavailable('tavily', 12))
+
+        for error in waiters:
+            self.assertIsInstance(error, ProviderUnavailable)
+            self.assertEqual((error.provider, error.wait), ('tavily', 12))
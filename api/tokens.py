@@ -0,0 +1,94 @@
+"""
+Token counting and prompt context budgeting.
+tiktoken encoders are expensive to build, so one is cached per process.
+
+Context sections (profile, KB, web, recent posts) are capped in tokens rather
+than characters and trimmed between paragraphs or sentences, never mid-word.
+"""
+import bisect
+import functools
+import re
+
+import tiktoken
+from django.conf import settings
+
+
+@functools.lru_cache(maxsize=None)
+def get_encoding(name: str = "cl100k_base"):
+    """Process-wide tiktoken encoder (cl100k_base approximates every provider we use)."""
+    return tiktoken.get_encoding(name)
+
+
+def count_tokens(text: str) -> int:
+    """Approximate token count of a text, for providers that don't report usage."""
+    if not text:
+        return 0
+    return len(get_encoding().encode(text, disallowed_special=()))
+
+
+# ---------------------------------------------------------------------------
+# Budgeting
+# ---------------------------------------------------------------------------
+
+_SENTENCE_END = re.compile(r'(?<=[.!?…])\s+')
+
+
+def _trim_sentences(paragraph: str, max_tokens: int) -> str:
+    """Longest run of whole sentences that fits, or whole words if the first sentence doesn't."""
+    max_tokens = max(max_tokens, 0)
+    if not max_tokens:
+        return ""
+    cuts = [m.start() for m in _SENTENCE_END.finditer(paragraph)]
+    # Token counts grow with the cut position, so bisect on them
+    index = bisect.bisect_right(cuts, max_tokens, key=lambda cut: count_tokens(paragraph[:cut]))
+    if index:
+        return paragraph[:cuts[index - 1]]
+    enc = get_encoding()
+    head = enc.decode(enc.encode(paragraph, disallowed_special=())[:max_tokens])
+    return head.rsplit(None, 1)[0] if ' ' in head.strip() else ''
+
+
+def trim_to_tokens(text: str, max_tokens: int) -> str:
+    """
+    Shorten text to at most max_tokens. Cuts between paragraphs first (KB chunks,
+    web results, example posts are separated by blank lines), then between
+    sentences of the paragraph that overflows.
+    """
+    if not text or max_tokens <= 0:
+        return ""
+    if count_tokens(text) <= max_tokens:
+        return text
+
+    kept, used = [], 0
+    for paragraph in text.split("\n\n"):
+        cost = count_tokens(paragraph) + 1  # "\n\n" separator
+        if used + cost <= max_tokens:
+            kept.append(paragraph)
+            used += cost
+            continue
+        remaining = max_tokens - used - 1
+        if remaining <= 0:
+            break
+        partial = _trim_sentences(paragraph, remaining)
+        if partial.strip():
+            kept.append(partial)
+        break
+    return "\n\n".join(kept).rstrip()
+
+
+def fit_context(*sections, budget=None):
+    """
+    Share the per-call context budget (PROMPT_CONTEXT_BUDGET) across sections given
+    in priority order: each keeps what fits in what the previous ones left.
+    Returns the sections trimmed, in the same order; empty sections cost nothing.
+    """
+    remaining = settings.PROMPT_CONTEXT_BUDGET if budget is None else budget
+    fitted = []
+    for section in sections:
+        if not section:
+            fitted.append(section)
+            continue
+        trimmed = trim_to_tokens(section, remaining)
+        remaining -= count_tokens(trimmed)
+        fitted.append(trimmed)
+    return fitted
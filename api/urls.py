@@ -23,6 +23,8 @@ from . import facebook
 from . import instagram
 from . import adapt
 from . import consultants
+from . import llm
+from . import ledger
 
 urlpatterns = [
     # Auth
@@ -134,6 +136,7 @@ urlpatterns = [
     # Knowledge Base
     path('knowledge-base/', knowledge_base.list_documents, name='kb_list'),
     path('knowledge-base/upload/', knowledge_base.upload_document, name='kb_upload'),
+    path('knowledge-base/<int:pk>/', knowledge_base.get_document, name='kb_detail'),
     path('knowledge-base/<int:pk>/delete/', knowledge_base.delete_document, name='kb_delete'),
     path('knowledge-base/stats/', knowledge_base.kb_stats, name='kb_stats'),
 
@@ -150,6 +153,10 @@ urlpatterns = [
     # Adapt (cross-platform)
     path('adapt/', adapt.adapt_post, name='adapt_post'),
 
+    # AI provider routing stats (staff only)
+    path('llm/stats/', llm.provider_stats, name='llm_provider_stats'),
+    path('llm/usage/', ledger.usage_summary, name='llm_usage_summary'),
+
     # AI Consultants
     path('consultants/chat/', consultants.chat_with_consultant, name='consultant_chat'),
     path('consultants/tts/', consultants.text_to_speech, name='consultant_tts'),
@@ -0,0 +1,89 @@
+"""
+Packed embedding storage for the knowledge base.
+
+A vector is stored as bytes: a 4-byte tag naming the dtype, then the raw
+little-endian values. float32 is exact (6 KB for 1536 dims instead of ~30 KB
+of JSON); float16 halves that, int8 quarters it with a per-vector float32
+scale. Readers get a NumPy view over the stored bytes, no parsing.
+"""
+import numpy as np
+from django.conf import settings
+
+# tag -> storage dtype; tags are 4 bytes so float data stays 4-byte aligned
+DTYPES = {
+    b'f32\x00': np.dtype('<f4'),
+    b'f16\x00': np.dtype('<f2'),
+    b'i8\x00\x00': np.dtype('i1'),
+}
+TAGS = {'float32': b'f32\x00', 'float16': b'f16\x00', 'int8': b'i8\x00\x00'}
+_SCALE = np.dtype('<f4')
+
+
+def pack(vector, dtype=None) -> bytes:
+    """Encode a vector (list or array) as KB_EMBEDDING_DTYPE (float32, float16 or int8)."""
+    dtype = dtype or settings.KB_EMBEDDING_DTYPE
+    if dtype not in TAGS:
+        raise ValueError(f"Type d'embedding inconnu: {dtype}")
+    values = np.asarray(vector, dtype=np.float32)
+    tag = TAGS[dtype]
+    if dtype == 'int8':
+        peak = float(np.abs(values).max()) if values.size else 0.0
+        scale = peak / 127 if peak else 1.0
+        quantized = np.rint(values / scale).astype(np.int8)
+        return tag + np.array(scale, dtype=_SCALE).tobytes() + quantized.tobytes()
+    return tag + values.astype(DTYPES[tag]).tobytes()
+
+
+def unpack(blob) -> np.ndarray:
+    """Zero-copy view of the stored values, in their stored dtype (int8 values are not rescaled)."""
+    tag = bytes(blob[:4])
+    offset = 8 if tag == TAGS['int8'] else 4
+    return np.frombuffer(blob, dtype=DTYPES[tag], offset=offset)
+
+
+def as_float32(blob) -> np.ndarray:
+    """float32 vector: a view for float32 rows, a converted copy for float16 and int8."""
+    tag = bytes(blob[:4])
+    values = unpack(blob)
+    if tag == TAGS['int8']:
+        scale = np.frombuffer(blob, dtype=_SCALE, count=1, offset=4)[0]
+        return values.astype(np.float32) * scale
+    if tag == TAGS['float16']:
+        return values.astype(np.float32)
+    return values
+
+
+# ---------------------------------------------------------------------------
+# Similarity search
+# ---------------------------------------------------------------------------
+# Vectors are normalized before being packed, so cosine similarity is a plain
+# dot product and a whole user's KB is scored with one matrix-vector product.
+
+def normalize(vector) -> np.ndarray:
+    """Unit-length float32 copy of a vector (zero vectors are returned as is)."""
+    values = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(values)
+    return values / norm if norm else values
+
+
+def stack(blobs) -> np.ndarray:
+    """(n, dims) float32 matrix from packed vectors."""
+    if not blobs:
+        return np.empty((0, 0), dtype=np.float32)
+    return np.vstack([as_float32(blob) for blob in blobs])
+
+
+def top_k(matrix: np.ndarray, query: np.ndarray, k: int):
+    """Indices and scores of the k rows closest to a normalized query, best first."""
+    return best(matrix @ query, k)
+
+
+def best(scores: np.ndarray, k: int):
+    """Indices and values of the k highest scores, best first."""
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.empty(0, dtype=np.intp), scores[:0]
+    # argpartition is O(n); only the k winners get sorted
+    indices = np.argpartition(scores, -k)[-k:]
+    indices = indices[np.argsort(scores[indices])[::-1]]
+    return indices, scores[indices]
@@ -1,21 +1,25 @@
 import re
+import json
 import base64
+import logging
 from datetime import timedelta
 
-from django.conf import settings
+from django.http import StreamingHttpResponse
 from django.utils import timezone
 from rest_framework import status
-from rest_framework.decorators import api_view, parser_classes, permission_classes
+from rest_framework.decorators import api_view, parser_classes, permission_classes, renderer_classes
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.parsers import MultiPartParser, FormParser, JSONParser
 from rest_framework.response import Response
-import anthropic
 
 from .models import GeneratedPost, PublishedPost, PromptTemplate, UserProfile, SavedDraft
 from .serializers import GeneratePostSerializer, GeneratedPostSerializer
 from .billing import check_generation_limit, increment_usage
-from .llm import get_user_plan, resolve_model, validate_model_access, generate_text
+from .llm import get_user_plan, resolve_model, validate_model_access, generate_text, stream_text, claude_message, claude_model
 from .websearch import enrich_context
+from .circuit_breaker import ProviderUnavailable
+from .renderers import EventStreamRenderer, STREAMING_RENDERERS
+from .tokens import trim_to_tokens
 from .prompts import build_system_prompt, build_variants_system_prompt, build_single_variant_prompt, VALID_OBJECTIVES, VALID_PLATFORMS, VALID_TONES
 
 MAX_IMAGE_SIZE = 10 * 1024 * 1024  # 10 MB
@@ -65,6 +69,47 @@ def get_platform(request):
     return 'linkedin'
 
 
+def wants_stream(request):
+    """
+    True when the client asked for the SSE variant of a generation endpoint:
+    ?stream=1, or an Accept header that only negotiates to text/event-stream.
+    """
+    if request.query_params.get('stream') == '1':
+        return True
+    return getattr(request, 'accepted_media_type', None) == EventStreamRenderer.media_type
+
+
+def stream_generation(chunks, finalize, endpoint):
+    """
+    Relay generated text chunks as Server-Sent Events.
+    Once the stream ends, finalize(full_text) persists the result and returns the
+    same payload as the non-streaming endpoint, sent as the last event.
+    """
+    def events():
+        parts = []
+        try:
+            for chunk in chunks:
+                parts.append(chunk)
+                yield f"data: {json.dumps({'text': chunk})}\n\n"
+            yield f"data: {json.dumps({'done': True, **finalize(''.join(parts))})}\n\n"
+            yield "data: [DONE]\n\n"
+        except ProviderUnavailable as e:
+            yield f"data: {json.dumps({'error': str(e.detail), 'retry_after': e.wait})}\n\n"
+        except Exception as e:
+            error_msg = str(e)
+            if 'rate' in error_msg.lower() or '429' in error_msg:
+                error = 'Trop de requêtes, réessayez dans un moment.'
+            else:
+                logging.getLogger('api').error(f"{endpoint} stream error: {e}")
+                error = 'Erreur interne lors de la génération.'
+            yield f"data: {json.dumps({'error': error})}\n\n"
+
+    response = StreamingHttpResponse(events(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
 def extract_hashtags(content):
     """Extrait les hashtags de la fin du post et retourne (body, hashtags)"""
     hashtags = re.findall(r'#\w+', content)
@@ -110,7 +155,7 @@ def get_image_media_type(image_file):
     return 'image/png'
 
 
-def analyze_images_with_vision(client, images):
+def analyze_images_with_vision(images):
     """Analyse les images avec Claude Vision et extrait le contexte"""
     if not images:
         return None
@@ -143,8 +188,8 @@ Fournis une synthèse concise mais complète qui servira de base pour créer un
 Réponds en français."""
     })
 
-    response = client.messages.create(
-        model="claude-sonnet-4-20250514",
+    response = claude_message(
+        model=claude_model(),
         max_tokens=1024,
         messages=[
             {"role": "user", "content": content}
@@ -213,6 +258,7 @@ def generate_reel_script(request):
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 @parser_classes([MultiPartParser, FormParser, JSONParser])
+@renderer_classes(STREAMING_RENDERERS)
 def generate_post(request):
     """Génère un post LinkedIn à partir d'un résumé et/ou d'images"""
 
@@ -272,8 +318,7 @@ def generate_post(request):
         # Étape 1: Analyser les images si présentes (toujours via Claude)
         image_context = None
         if images:
-            client = anthropic.Anthropic(api_key=settings.ANTHROPIC_API_KEY)
-            image_context = analyze_images_with_vision(client, images)
+            image_context = analyze_images_with_vision(images)
 
         # Construire le contexte final
         if image_context and summary.strip():
@@ -311,34 +356,46 @@ Résumé additionnel fourni par l'utilisateur :
         if web_context:
             user_message += f"\n\n---\n{web_context}"
 
+        def finalize(generated_content):
+            # Extraire les hashtags du post
+            body, hashtags = extract_hashtags(generated_content)
+
+            # Sauvegarder en base de données (contenu complet avec hashtags)
+            post = GeneratedPost.objects.create(
+                user=request.user,
+                summary=summary if summary.strip() else (image_context[:500] if image_context else ''),
+                tone=tone,
+                platform=platform,
+                generated_content=generated_content
+            )
+
+            increment_usage(request.user)
+
+            return {
+                'post': body,
+                'hashtags': hashtags,
+                'id': post.id,
+                'image_analysis': image_context
+            }
+
+        if wants_stream(request):
+            return stream_generation(
+                stream_text(model_id, system_prompt, user_message, max_tokens=1024, plan=user_plan),
+                finalize,
+                'generate_post',
+            )
+
         generated_content = generate_text(
             model_id=model_id,
             system_prompt=system_prompt,
             user_message=user_message,
             max_tokens=1024,
+            plan=user_plan,
         )
+        return Response(finalize(generated_content))
 
-        # Extraire les hashtags du post
-        body, hashtags = extract_hashtags(generated_content)
-
-        # Sauvegarder en base de données (contenu complet avec hashtags)
-        post = GeneratedPost.objects.create(
-            user=request.user,
-            summary=summary if summary.strip() else (image_context[:500] if image_context else ''),
-            tone=tone,
-            platform=platform,
-            generated_content=generated_content
-        )
-
-        increment_usage(request.user)
-
-        return Response({
-            'post': body,
-            'hashtags': hashtags,
-            'id': post.id,
-            'image_analysis': image_context
-        })
-
+    except ProviderUnavailable:
+        raise
     except Exception as e:
         error_msg = str(e)
         if 'rate' in error_msg.lower() or '429' in error_msg:
@@ -352,6 +409,7 @@ Résumé additionnel fourni par l'utilisateur :
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 @parser_classes([MultiPartParser, FormParser, JSONParser])
+@renderer_classes(STREAMING_RENDERERS)
 def generate_variants(request):
     """Génère plusieurs variantes d'un post LinkedIn"""
 
@@ -402,8 +460,7 @@ def generate_variants(request):
         # Analyser les images si présentes (toujours via Claude)
         image_context = None
         if images:
-            client = anthropic.Anthropic(api_key=settings.ANTHROPIC_API_KEY)
-            image_context = analyze_images_with_vision(client, images)
+            image_context = analyze_images_with_vision(images)
 
         # Construire le contexte
         if image_context and summary.strip():
@@ -436,61 +493,79 @@ def generate_variants(request):
         if web_context:
             variants_user_message += f"\n\n---\n{web_context}"
 
+        def finalize(raw_content):
+            raw_variants = [v.strip() for v in raw_content.split("---VARIANTE---") if v.strip()]
+
+            # Extraire les hashtags de chaque variante
+            variants = []
+            variants_hashtags = []
+            for v in raw_variants:
+                body, tags = extract_hashtags(v)
+                variants.append(body)
+                variants_hashtags.append(tags)
+
+            # Sauvegarder la première variante comme post principal
+            post = None
+            if raw_variants:
+                post = GeneratedPost.objects.create(
+                    user=request.user,
+                    summary=summary if summary.strip() else (image_context[:500] if image_context else ''),
+                    tone=tone,
+                    generated_content=raw_variants[0]
+                )
+
+            # AI engagement recommendation
+            recommended_index = 0
+            if len(variants) > 1:
+                try:
+                    rec_text = generate_text(
+                        model_id=model_id,
+                        system_prompt="Tu es un expert LinkedIn. Analyse ces variantes de post et indique le NUMÉRO (1, 2, ou 3) de celle qui aura le meilleur engagement. Réponds UNIQUEMENT avec le numéro.",
+                        user_message="\n\n---\n\n".join([f"Variante {i+1}:\n{v}" for i, v in enumerate(variants)]),
+                        max_tokens=50,
+                        plan=user_plan,
+                        task='micro',
+                    ).strip()
+                    for char in rec_text:
+                        if char.isdigit():
+                            idx = int(char) - 1
+                            if 0 <= idx < len(variants):
+                                recommended_index = idx
+                            break
+                except Exception:
+                    pass
+
+            increment_usage(request.user)
+
+            return {
+                'variants': variants,
+                'variants_hashtags': variants_hashtags,
+                'id': post.id if post else None,
+                'image_analysis': image_context,
+                'recommended_index': recommended_index,
+            }
+
+        if wants_stream(request):
+            return stream_generation(
+                stream_text(
+                    model_id, system_prompt, variants_user_message, max_tokens=4096, plan=user_plan, task='long_form',
+                ),
+                finalize,
+                'generate_variants',
+            )
+
         raw_content = generate_text(
             model_id=model_id,
             system_prompt=system_prompt,
             user_message=variants_user_message,
             max_tokens=4096,
+            plan=user_plan,
+            task='long_form',
         )
-        raw_variants = [v.strip() for v in raw_content.split("---VARIANTE---") if v.strip()]
-
-        # Extraire les hashtags de chaque variante
-        variants = []
-        variants_hashtags = []
-        for v in raw_variants:
-            body, tags = extract_hashtags(v)
-            variants.append(body)
-            variants_hashtags.append(tags)
-
-        # Sauvegarder la première variante comme post principal
-        post = None
-        if raw_variants:
-            post = GeneratedPost.objects.create(
-                user=request.user,
-                summary=summary if summary.strip() else (image_context[:500] if image_context else ''),
-                tone=tone,
-                generated_content=raw_variants[0]
-            )
-
-        # AI engagement recommendation
-        recommended_index = 0
-        if len(variants) > 1:
-            try:
-                rec_text = generate_text(
-                    model_id=model_id,
-                    system_prompt="Tu es un expert LinkedIn. Analyse ces variantes de post et indique le NUMÉRO (1, 2, ou 3) de celle qui aura le meilleur engagement. Réponds UNIQUEMENT avec le numéro.",
-                    user_message="\n\n---\n\n".join([f"Variante {i+1}:\n{v}" for i, v in enumerate(variants)]),
-                    max_tokens=50,
-                ).strip()
-                for char in rec_text:
-                    if char.isdigit():
-                        idx = int(char) - 1
-                        if 0 <= idx < len(variants):
-                            recommended_index = idx
-                        break
-            except Exception:
-                pass
-
-        increment_usage(request.user)
-
-        return Response({
-            'variants': variants,
-            'variants_hashtags': variants_hashtags,
-            'id': post.id if post else None,
-            'image_analysis': image_context,
-            'recommended_index': recommended_index,
-        })
+        return Response(finalize(raw_content))
 
+    except ProviderUnavailable:
+        raise
     except Exception as e:
         error_msg = str(e)
         if 'rate' in error_msg.lower() or '429' in error_msg:
@@ -504,6 +579,7 @@ def generate_variants(request):
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 @parser_classes([JSONParser])
+@renderer_classes(STREAMING_RENDERERS)
 def regenerate_single_variant(request):
     """Régénère une seule variante d'un post LinkedIn"""
     summary = request.data.get('summary', '')
@@ -534,7 +610,7 @@ def regenerate_single_variant(request):
         if other_variants:
             avoid_context = "\n\nVoici les autres variantes déjà générées (génère quelque chose de DIFFÉRENT) :\n"
             for i, v in enumerate(other_variants):
-                avoid_context += f"\n--- Variante existante {i+1} ---\n{v[:200]}...\n"
+                avoid_context += f"\n--- Variante existante {i+1} ---\n{trim_to_tokens(v, 60)}...\n"
 
         objective = get_objective(request)
         platform = get_platform(request)
@@ -542,20 +618,34 @@ def regenerate_single_variant(request):
         user_context = get_user_context(request)
         system_prompt = build_single_variant_prompt(objective, tone, platform=platform, profile=user_context, use_profile=use_profile)
 
+        user_message = f"Contexte :\n{summary}{avoid_context}"
+
+        def finalize(raw_content):
+            body, tags = extract_hashtags(raw_content)
+            return {
+                'variant': body,
+                'hashtags': tags,
+                'variant_index': variant_index,
+            }
+
+        if wants_stream(request):
+            return stream_generation(
+                stream_text(model_id, system_prompt, user_message, max_tokens=1024, plan=user_plan),
+                finalize,
+                'regenerate_single_variant',
+            )
+
         raw_content = generate_text(
             model_id=model_id,
             system_prompt=system_prompt,
-            user_message=f"Contexte :\n{summary}{avoid_context}",
+            user_message=user_message,
             max_tokens=1024,
+            plan=user_plan,
         )
-        body, tags = extract_hashtags(raw_content)
-
-        return Response({
-            'variant': body,
-            'hashtags': tags,
-            'variant_index': variant_index,
-        })
+        return Response(finalize(raw_content))
 
+    except ProviderUnavailable:
+        raise
     except Exception as e:
         error_msg = str(e)
         if 'rate' in error_msg.lower() or '429' in error_msg:
@@ -609,6 +699,8 @@ RÈGLES:
             system_prompt=system_prompt,
             user_message=f"Écris un premier commentaire stratégique pour ce post LinkedIn :\n\n{content}",
             max_tokens=300,
+            plan=user_plan,
+            task='micro',
         ).strip()
         for char in ['"', '\u201c', '\u201d', '\u00ab', '\u00bb']:
             if comment.startswith(char) and comment.endswith(char):
@@ -616,6 +708,8 @@ RÈGLES:
 
         return Response({'comment': comment})
 
+    except ProviderUnavailable:
+        raise
     except Exception as e:
         error_msg = str(e)
         if 'rate' in error_msg.lower() or '429' in error_msg:
@@ -742,11 +836,15 @@ Retourne UNIQUEMENT les hashtags, un par ligne, commençant par #.
 Choisis des hashtags populaires sur LinkedIn, en français et en anglais.""",
             user_message=f"Suggère des hashtags pour ce post LinkedIn :\n\n{content}",
             max_tokens=256,
+            plan=user_plan,
+            task='micro',
         )
         hashtags = [tag.strip() for tag in raw.split('\n') if tag.strip().startswith('#')]
 
         return Response({'hashtags': hashtags})
 
+    except ProviderUnavailable:
+        raise
     except Exception as e:
         error_msg = str(e)
         if 'rate' in error_msg.lower() or '429' in error_msg:
@@ -823,6 +921,8 @@ Retourne UNIQUEMENT la phrase d'accroche, rien d'autre. Pas de guillemets."""
             system_prompt=system_prompt,
             user_message=f"Voici le post LinkedIn (sans le hook) :\n\n{content}{avoid_text}",
             max_tokens=100,
+            plan=user_plan,
+            task='micro',
         ).strip()
         # Nettoyer : enlever les guillemets si l'IA en met
         for char in ['"', "'", '\u201c', '\u201d', '\u00ab', '\u00bb']:
@@ -830,6 +930,8 @@ Retourne UNIQUEMENT la phrase d'accroche, rien d'autre. Pas de guillemets."""
 
         return Response({'hook': hook})
 
+    except ProviderUnavailable:
+        raise
     except Exception as e:
         error_msg = str(e)
         if 'rate' in error_msg.lower() or '429' in error_msg:
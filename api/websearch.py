@@ -3,18 +3,30 @@ Web search module for fact-checking and context enrichment.
 
 Flow:
 1. Extract specific entities/tools/products from user's summary (via Claude Haiku)
-2. Search the web for each entity (via Tavily)
+2. Search the web for each entity (via Tavily, concurrently, within one deadline)
 3. Return verified context to inject into generation prompts
 """
+import contextvars
+import copy
 import json
 import logging
+import os
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
 
 from django.conf import settings
+from django.db import connection
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework.response import Response
 from rest_framework import status as http_status
-import anthropic
+
+from .llm import get_client, claude_message, claude_model
+from .circuit_breaker import guard, ProviderUnavailable
+from .enrichment_cache import cache_key, cached
+from . import entity_prefilter, image_cache
+from .tokens import count_tokens, trim_to_tokens
 
 logger = logging.getLogger(__name__)
 
@@ -23,17 +35,41 @@ def extract_entities(text: str) -> list[str]:
     """
     Use a fast LLM call to extract specific entities that need web verification.
     Returns a list of search queries (empty if nothing needs checking).
+    The LLM call is skipped when the local pre-classifier can decide (see
+    entity_prefilter.py). Results are cached by normalized text (see enrichment_cache.py).
     """
     api_key = getattr(settings, 'ANTHROPIC_API_KEY', '')
     if not api_key or not text.strip():
         return []
 
     try:
-        client = anthropic.Anthropic(api_key=api_key)
-        response = client.messages.create(
-            model="claude-haiku-4-5-20251001",
-            max_tokens=256,
-            system="""Tu es un analyseur de texte. Ton rôle est d'identifier les entités spécifiques
+        return cached('entities', text, lambda: _extract_entities(text))
+    except Exception as e:
+        logger.warning(f"Entity extraction failed: {e}")
+        return []
+
+
+def _extract_entities(text: str) -> list[str]:
+    if not settings.ENTITY_PREFILTER:
+        return _llm_entities(text)
+    decision, queries = entity_prefilter.classify(text)
+    if decision == 'llm':
+        return _llm_entities(text)
+
+    logger.info(f"Entity prefilter: decision={decision}, queries={queries}, LLM call skipped")
+    if random.random() < settings.ENTITY_PREFILTER_SHADOW_RATE:
+        try:
+            entity_prefilter.record_shadow(text, decision, queries, _llm_entities(text))
+        except Exception as e:
+            logger.warning(f"Entity prefilter shadow extraction failed: {e}")
+    return queries
+
+
+def _llm_entities(text: str) -> list[str]:
+    response = claude_message(
+        model=claude_model('micro'),
+        max_tokens=256,
+        system="""Tu es un analyseur de texte. Ton rôle est d'identifier les entités spécifiques
 qui nécessitent une vérification factuelle sur le web.
 
 Extrais UNIQUEMENT les entités suivantes si elles sont présentes :
@@ -50,82 +86,200 @@ NE PAS extraire :
 
 Retourne un JSON strict : {"entities": ["query1", "query2"]}
 Si rien ne nécessite de vérification, retourne : {"entities": []}""",
-            messages=[{"role": "user", "content": text}],
-        )
+        messages=[{"role": "user", "content": text}],
+    )
 
-        raw = response.content[0].text.strip()
-        if raw.startswith('```'):
-            raw = raw.split('\n', 1)[1] if '\n' in raw else raw[3:]
-            if raw.endswith('```'):
-                raw = raw[:-3].strip()
+    raw = response.content[0].text.strip()
+    if raw.startswith('```'):
+        raw = raw.split('\n', 1)[1] if '\n' in raw else raw[3:]
+        if raw.endswith('```'):
+            raw = raw[:-3].strip()
 
-        data = json.loads(raw)
-        entities = data.get('entities', [])
+    data = json.loads(raw)
+    entities = data.get('entities', [])
 
-        # Limit to 3 searches max to control costs
-        return entities[:3]
+    # Limit to 3 searches max to control costs
+    return entities[:3]
 
-    except Exception as e:
-        logger.warning(f"Entity extraction failed: {e}")
-        return []
+
+_search_pool = None
+_search_pool_pid = None
+_search_pool_lock = threading.Lock()
+
+
+def _search_executor() -> ThreadPoolExecutor:
+    """Thread pool for Tavily queries, one per worker process (rebuilt after fork)."""
+    global _search_pool, _search_pool_pid
+    with _search_pool_lock:
+        if _search_pool is None or _search_pool_pid != os.getpid():
+            _search_pool = ThreadPoolExecutor(
+                max_workers=settings.WEB_SEARCH_CONCURRENCY, thread_name_prefix='web-search',
+            )
+            _search_pool_pid = os.getpid()
+        return _search_pool
 
 
 def search_web(queries: list[str]) -> list[dict]:
     """
     Search the web using Tavily for each query.
     Returns a list of search results with title, url, and content.
+
+    Queries run concurrently and share one WEB_SEARCH_DEADLINE: results that
+    arrive later are dropped (they still fill the cache for the next call).
+    Results are cached by normalized query (see enrichment_cache.py).
     """
     api_key = getattr(settings, 'TAVILY_API_KEY', '')
     if not api_key or not queries:
         return []
 
     try:
-        from tavily import TavilyClient
-        client = TavilyClient(api_key=api_key)
+        client = get_client('tavily')
     except Exception as e:
         logger.warning(f"Tavily client init failed: {e}")
         return []
 
-    all_results = []
+    pool = _search_executor()
+    # Each query gets its own copy of the request context (ledger scope)
+    futures = [pool.submit(contextvars.copy_context().run, _cached_search, client, query) for query in queries]
+    done, pending = wait(futures, timeout=settings.WEB_SEARCH_DEADLINE)
+    if pending:
+        logger.warning(
+            f"Web search: {len(pending)}/{len(futures)} queries missed the "
+            f"{settings.WEB_SEARCH_DEADLINE}s deadline, dropped"
+        )
 
-    for query in queries:
+    all_results = []
+    for query, future in zip(queries, futures):
+        if future not in done:
+            continue
         try:
-            response = client.search(
-                query=query,
-                search_depth="basic",
-                max_results=3,
-                include_answer=True,
-            )
-
-            # Collect the AI-generated answer if available
-            if response.get('answer'):
-                all_results.append({
-                    'query': query,
-                    'answer': response['answer'],
-                    'sources': [
-                        {'title': r.get('title', ''), 'url': r.get('url', '')}
-                        for r in response.get('results', [])[:3]
-                    ],
-                })
-            elif response.get('results'):
-                # Fallback: use raw results
-                top = response['results'][0]
-                all_results.append({
-                    'query': query,
-                    'answer': top.get('content', ''),
-                    'sources': [
-                        {'title': r.get('title', ''), 'url': r.get('url', '')}
-                        for r in response.get('results', [])[:3]
-                    ],
-                })
-
+            result = future.result()
+        except ProviderUnavailable as e:
+            logger.warning(f"Tavily search skipped: {e}")
+            continue
         except Exception as e:
             logger.warning(f"Tavily search failed for '{query}': {e}")
             continue
+        if result:
+            all_results.append(result)
 
     return all_results
 
 
+def _cached_search(client, query: str):
+    try:
+        return _enrichment_result(query, fetch_search(client, query))
+    finally:
+        # Pool threads outlive requests: don't keep their cache-table connection open
+        connection.close()
+
+
+# ---------------------------------------------------------------------------
+# Shared Tavily search: one upstream call per query, coalesced and cached
+# ---------------------------------------------------------------------------
+# Enrichment and the web_search endpoint both project the same rich response
+# (8 results, answer, images). Concurrent identical queries in a worker wait
+# for the first one's call (single flight); other workers share it through
+# the enrichment cache.
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+_flights = {}
+_flights_lock = threading.Lock()
+
+
+def _copy_error(error):
+    """
+    Same-type copy of the leader's exception for one waiter, so concurrent raises
+    do not all append to one __traceback__.
+    """
+    try:
+        return copy.copy(error)
+    except TypeError:
+        # __init__ cannot be re-run from args (e.g. ProviderUnavailable): copy the state only
+        clone = type(error).__new__(type(error), *error.args)
+        clone.__dict__.update(error.__dict__)
+        return clone
+
+
+def single_flight(key: str, fn, timeout: float):
+    """fn() once for concurrent callers with the same key; the others wait at most timeout seconds."""
+    with _flights_lock:
+        flight = _flights.get(key)
+        leader = flight is None
+        if leader:
+            flight = _flights[key] = _Flight()
+
+    if not leader:
+        logger.debug(f"Web search: joined in-flight request {key[:20]}")
+        if not flight.done.wait(timeout):
+            raise TimeoutError(f"Identical search still running after {timeout}s")
+        if flight.error is not None:
+            raise _copy_error(flight.error) from flight.error
+        return flight.result
+
+    try:
+        flight.result = fn()
+        return flight.result
+    except Exception as e:
+        flight.error = e
+        raise
+    finally:
+        with _flights_lock:
+            del _flights[key]
+        flight.done.set()
+
+
+def fetch_search(client, query: str) -> dict:
+    """Rich Tavily response for a query, as {answer, results, images}; cached and coalesced."""
+    return single_flight(
+        cache_key('search', query),
+        lambda: cached('search', query, lambda: _search_query(client, query)),
+        settings.WEB_SEARCH_SINGLEFLIGHT_TIMEOUT,
+    )
+
+
+def _search_query(client, query: str) -> dict:
+    with guard('tavily'):
+        response = client.search(
+            query=query,
+            search_depth="basic",
+            max_results=8,
+            include_answer=True,
+            include_images=True,
+        )
+    return {
+        'answer': response.get('answer') or '',
+        'results': [
+            {
+                'title': r.get('title', ''),
+                'url': r.get('url', ''),
+                'content': r.get('content', ''),
+                'score': r.get('score', 0),
+            }
+            for r in response.get('results', [])
+        ],
+        'images': response.get('images', []),
+    }
+
+
+def _enrichment_result(query: str, search: dict):
+    """Enrichment shape {query, answer, sources}, or None when the search found nothing."""
+    sources = [{'title': r['title'], 'url': r['url']} for r in search['results'][:3]]
+    # Collect the AI-generated answer if available
+    if search['answer']:
+        return {'query': query, 'answer': search['answer'], 'sources': sources}
+    if search['results']:
+        # Fallback: use raw results
+        return {'query': query, 'answer': search['results'][0]['content'], 'sources': sources}
+    return None
+
+
 def enrich_context(text: str) -> str:
     """
     Main entry point. Takes user's summary/topic, extracts entities,
@@ -168,15 +322,11 @@ def enrich_context(text: str) -> str:
             if source_names:
                 lines.append(f"  Sources : {', '.join(source_names[:2])}")
 
-    lines.append("\nSi tu ne trouves pas l'information dans ce contexte, dis-le plutôt que d'inventer.")
+    footer = "Si tu ne trouves pas l'information dans ce contexte, dis-le plutôt que d'inventer."
 
-    context = '\n'.join(lines)
-
-    # Cap at ~2000 chars to limit token usage
-    if len(context) > 2000:
-        context = context[:2000] + "\n..."
-
-    return context
+    # Results are blank-line separated: trimming keeps whole results, in ranking order
+    context = trim_to_tokens('\n'.join(lines), settings.PROMPT_BUDGET_WEB - count_tokens(footer))
+    return f"{context}\n\n{footer}"
 
 
 @api_view(['POST'])
@@ -200,15 +350,6 @@ def web_search(request):
             status=http_status.HTTP_400_BAD_REQUEST,
         )
 
-    results = search_web([query])
-
-    if not results:
-        return Response(
-            {'error': 'Aucun résultat trouvé. Vérifiez votre requête.'},
-            status=http_status.HTTP_404_NOT_FOUND,
-        )
-
-    # Return richer results for the frontend
     api_key = getattr(settings, 'TAVILY_API_KEY', '')
     if not api_key:
         return Response(
@@ -216,33 +357,11 @@ def web_search(request):
             status=http_status.HTTP_503_SERVICE_UNAVAILABLE,
         )
 
+    # Same cached, coalesced upstream call as enrichment
     try:
-        from tavily import TavilyClient
-        client = TavilyClient(api_key=api_key)
-        response = client.search(
-            query=query,
-            search_depth="basic",
-            max_results=8,
-            include_answer=True,
-            include_images=True,
-        )
-
-        formatted_results = []
-        for r in response.get('results', []):
-            formatted_results.append({
-                'title': r.get('title', ''),
-                'url': r.get('url', ''),
-                'content': r.get('content', ''),
-                'score': r.get('score', 0),
-            })
-
-        return Response({
-            'query': query,
-            'answer': response.get('answer', ''),
-            'results': formatted_results,
-            'images': response.get('images', []),
-        })
-
+        search = fetch_search(get_client('tavily'), query)
+    except ProviderUnavailable:
+        raise
     except Exception as e:
         logger.error(f"Web search endpoint error: {e}")
         return Response(
@@ -250,6 +369,19 @@ def web_search(request):
             status=http_status.HTTP_500_INTERNAL_SERVER_ERROR,
         )
 
+    if not search['answer'] and not search['results']:
+        return Response(
+            {'error': 'Aucun résultat trouvé. Vérifiez votre requête.'},
+            status=http_status.HTTP_404_NOT_FOUND,
+        )
+
+    return Response({
+        'query': query,
+        'answer': search['answer'],
+        'results': search['results'],
+        'images': search['images'],
+    })
+
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
@@ -274,15 +406,15 @@ def web_image_search(request):
         )
 
     try:
-        from tavily import TavilyClient
-        client = TavilyClient(api_key=api_key)
-        response = client.search(
-            query=query,
-            search_depth="basic",
-            max_results=5,
-            include_images=True,
-            include_answer=False,
-        )
+        client = get_client('tavily')
+        with guard('tavily'):
+            response = client.search(
+                query=query,
+                search_depth="basic",
+                max_results=5,
+                include_images=True,
+                include_answer=False,
+            )
 
         images = response.get('images', [])
 
@@ -291,6 +423,8 @@ def web_image_search(request):
             'images': images,
         })
 
+    except ProviderUnavailable:
+        raise
     except Exception as e:
         logger.error(f"Web image search error: {e}")
         return Response(
@@ -305,10 +439,13 @@ def proxy_image(request):
     """
     Proxy an external image to avoid CORS issues.
     GET /api/web/proxy-image/?url=https://...
-    Returns the image bytes with correct content type.
+    Returns the image bytes with correct content type. Images are streamed
+    from the origin into a disk cache (see image_cache.py), and ETag /
+    Last-Modified let the browser revalidate with a 304.
     """
     import requests
-    from django.http import HttpResponse
+    from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+    from django.utils.http import http_date
 
     url = request.query_params.get('url', '').strip()
     if not url:
@@ -318,20 +455,100 @@ def proxy_image(request):
     if not url.startswith('https://'):
         return Response({'error': 'Seules les URLs HTTPS sont acceptées'}, status=http_status.HTTP_400_BAD_REQUEST)
 
+    hit = image_cache.lookup(url)
+    if hit:
+        path, meta = hit
+        if _not_modified(request, meta):
+            return _image_headers(HttpResponse(status=304), meta)
+        try:
+            return _image_headers(FileResponse(open(path, 'rb'), content_type=meta['content_type']), meta)
+        except FileNotFoundError:
+            pass  # evicted since the lookup
+
     try:
-        resp = requests.get(url, timeout=10, headers={
+        resp = requests.get(url, timeout=10, stream=True, headers={
             'User-Agent': 'Mozilla/5.0 (compatible; PostFlow/1.0)',
         })
         resp.raise_for_status()
-
-        content_type = resp.headers.get('Content-Type', 'image/jpeg')
-        if not content_type.startswith('image/'):
-            return Response({'error': 'URL ne pointe pas vers une image'}, status=http_status.HTTP_400_BAD_REQUEST)
-
-        response = HttpResponse(resp.content, content_type=content_type)
-        response['Cache-Control'] = 'public, max-age=86400'
-        return response
-
     except requests.RequestException as e:
         logger.warning(f"Image proxy failed for {url}: {e}")
         return Response({'error': 'Impossible de charger l\'image'}, status=http_status.HTTP_502_BAD_GATEWAY)
+
+    content_type = resp.headers.get('Content-Type', 'image/jpeg')
+    if not content_type.startswith('image/'):
+        resp.close()
+        return Response({'error': 'URL ne pointe pas vers une image'}, status=http_status.HTTP_400_BAD_REQUEST)
+
+    length = resp.headers.get('Content-Length', '')
+    if length.isdigit() and int(length) > settings.IMAGE_PROXY_MAX_BYTES:
+        resp.close()
+        return Response({'error': 'Image trop volumineuse'}, status=http_status.HTTP_502_BAD_GATEWAY)
+
+    meta = {
+        'content_type': content_type,
+        'etag': image_cache.etag_for(url, resp.headers),
+        'last_modified': resp.headers.get('Last-Modified') or http_date(),
+    }
+    if _not_modified(request, meta):
+        resp.close()
+        return _image_headers(HttpResponse(status=304), meta)
+
+    return _image_headers(StreamingHttpResponse(_stream_image(url, resp, meta), content_type=content_type), meta)
+
+
+def _stream_image(url, upstream, meta):
+    """Pass the origin's bytes through while writing them to the cache; stops at IMAGE_PROXY_MAX_BYTES."""
+    try:
+        writer = image_cache.Writer(url, meta)
+    except OSError as e:
+        logger.warning(f"Image cache unavailable: {e}")
+        writer = None
+
+    size, complete = 0, False
+    try:
+        for chunk in upstream.iter_content(64 * 1024):
+            size += len(chunk)
+            if size > settings.IMAGE_PROXY_MAX_BYTES:
+                # Headers are already sent: the client gets a truncated body, nothing is cached
+                logger.warning(f"Image proxy: {url} exceeds {settings.IMAGE_PROXY_MAX_BYTES} bytes, cut off")
+                return
+            if writer:
+                try:
+                    writer.write(chunk)
+                except OSError as e:
+                    logger.warning(f"Image cache write failed: {e}")
+                    writer.abort()
+                    writer = None
+            yield chunk
+        complete = True
+    finally:
+        upstream.close()
+        if writer:
+            try:
+                if complete:
+                    writer.commit()
+                else:
+                    writer.abort()
+            except OSError as e:
+                logger.warning(f"Image cache write failed: {e}")
+
+
+def _not_modified(request, meta) -> bool:
+    """Whether the browser's copy (If-None-Match, else If-Modified-Since) is still current."""
+    from django.utils.http import parse_http_date_safe
+
+    if_none_match = request.headers.get('If-None-Match')
+    if if_none_match:
+        # Compression middlewares weaken ETags (W/"...")
+        tags = [tag.strip().removeprefix('W/') for tag in if_none_match.split(',')]
+        return '*' in tags or meta['etag'] in tags
+    since = parse_http_date_safe(request.headers.get('If-Modified-Since', ''))
+    modified = parse_http_date_safe(meta['last_modified'])
+    return bool(since and modified and modified <= since)
+
+
+def _image_headers(response, meta):
+    response['ETag'] = meta['etag']
+    response['Last-Modified'] = meta['last_modified']
+    response['Cache-Control'] = 'public, max-age=86400'
+    return response
@@ -1,3 +1,4 @@
+import json
 import os
 from pathlib import Path
 from dotenv import load_dotenv
@@ -45,6 +46,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'api.ledger.LedgerMiddleware',
 ]
 
 ROOT_URLCONF = 'config.urls'
@@ -111,11 +113,20 @@ STATICFILES_STORAGE = 'whitenoise.storage.CompressedStaticFilesStorage'
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 # Cache (utilisé pour les OAuth state tokens)
+# 'enrichment': entités et recherches Tavily de enrich_context, partagées entre workers (api/enrichment_cache.py)
 CACHES = {
     'default': {
         'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
         'LOCATION': 'django_cache_table',
-    }
+    },
+    'enrichment': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'enrichment_cache_table',
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.getenv('ENRICH_CACHE_MAX_ENTRIES', '20000')),
+            'CULL_FREQUENCY': 4,
+        },
+    },
 }
 
 # Logging
@@ -245,10 +256,137 @@ OPENAI_API_KEY = os.getenv('OPENAI_API_KEY', '')
 
 # Tavily (web search)
 TAVILY_API_KEY = os.getenv('TAVILY_API_KEY', '')
+# enrich_context cache TTLs in seconds: entity extraction per text, Tavily results per query
+ENRICH_ENTITY_CACHE_TTL = int(os.getenv('ENRICH_ENTITY_CACHE_TTL', '86400'))
+ENRICH_SEARCH_CACHE_TTL = int(os.getenv('ENRICH_SEARCH_CACHE_TTL', '21600'))
+# Local entity pre-classifier in front of the Haiku extraction (api/entity_prefilter.py);
+# a share of its decisions is still checked against the LLM and logged
+ENTITY_PREFILTER = os.getenv('ENTITY_PREFILTER', 'True').lower() == 'true'
+ENTITY_PREFILTER_SHADOW_RATE = float(os.getenv('ENTITY_PREFILTER_SHADOW_RATE', '0.05'))
+# search_web runs its queries on a per-worker pool; results after the deadline (seconds) are dropped
+WEB_SEARCH_CONCURRENCY = int(os.getenv('WEB_SEARCH_CONCURRENCY', '6'))
+WEB_SEARCH_DEADLINE = float(os.getenv('WEB_SEARCH_DEADLINE', '6'))
+# Max seconds a request waits for an identical Tavily search already in flight in its worker
+WEB_SEARCH_SINGLEFLIGHT_TIMEOUT = float(os.getenv('WEB_SEARCH_SINGLEFLIGHT_TIMEOUT', '15'))
+# Image proxy: disk cache (LRU by total bytes, see api/image_cache.py) and per-image size cutoff
+IMAGE_PROXY_CACHE_DIR = os.getenv('IMAGE_PROXY_CACHE_DIR', str(BASE_DIR / 'image_cache'))
+IMAGE_PROXY_CACHE_BYTES = int(os.getenv('IMAGE_PROXY_CACHE_BYTES', str(500 * 1024 * 1024)))
+IMAGE_PROXY_MAX_BYTES = int(os.getenv('IMAGE_PROXY_MAX_BYTES', str(10 * 1024 * 1024)))
 
 # Hugging Face
 HF_TOKEN = os.getenv('HF_TOKEN', '')
 
+# AI provider clients (one pooled keep-alive client per provider per worker, see api/llm.py)
+LLM_HTTP_POOL_SIZE = int(os.getenv('LLM_HTTP_POOL_SIZE', '10'))
+LLM_HTTP_TIMEOUT = float(os.getenv('LLM_HTTP_TIMEOUT', '90'))
+LLM_HTTP_CONNECT_TIMEOUT = float(os.getenv('LLM_HTTP_CONNECT_TIMEOUT', '10'))
+LLM_HTTP_KEEPALIVE = float(os.getenv('LLM_HTTP_KEEPALIVE', '60'))
+LLM_MAX_RETRIES = int(os.getenv('LLM_MAX_RETRIES', '2'))
+# Max in-flight async calls per provider and worker (api.llm.agenerate_text)
+LLM_ASYNC_CONCURRENCY = int(os.getenv('LLM_ASYNC_CONCURRENCY', '8'))
+# Max seconds autopilot waits for a carousel/infographic caption once rendering is done
+AUTOPILOT_CAPTION_TIMEOUT = float(os.getenv('AUTOPILOT_CAPTION_TIMEOUT', '60'))
+
+# Model failover: the requested model is tried first, then the plan's chain in order
+LLM_FALLBACK_CHAINS = {
+    'free': ['mistral', 'gemini'],
+    'pro': ['claude', 'gemini', 'gpt4o'],
+    'business': ['claude', 'gpt4o', 'gemini'],
+}
+# Hedging fires the next model in the chain when the first exceeds its rolling p95
+LLM_HEDGING_ENABLED = os.getenv('LLM_HEDGING_ENABLED', 'False').lower() == 'true'
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv('LLM_HEDGE_MIN_SAMPLES', '20'))
+LLM_LATENCY_WINDOW = int(os.getenv('LLM_LATENCY_WINDOW', '200'))
+
+# Task classes (api.llm.TASK_CLASSES): provider-side model used for each model ID.
+# Models missing from a class use the default MODEL_NAMES entry.
+LLM_TASK_MODELS = {
+    'micro': {
+        'claude': 'claude-haiku-4-5-20251001',
+        'gemini': 'gemini-2.5-flash-lite',
+        'gpt4o': 'gpt-4o-mini',
+    },
+    'standard': {},
+    'long_form': {},
+}
+# Per-plan overrides, same shape keyed by plan: {'business': {'micro': {'claude': '...'}}}
+LLM_TASK_MODEL_OVERRIDES = {}
+
+# Circuit breaker + AIMD concurrency limit per AI provider, shared by all workers
+# through a SQLite file (see api/circuit_breaker.py). Every gunicorn worker must
+# see the same file: keep it on a persistent local volume, not a per-container /tmp
+# (and not on NFS, where SQLite locking is unreliable)
+CIRCUIT_BREAKER_DB = os.getenv('CIRCUIT_BREAKER_DB', str(BASE_DIR / 'circuit_breaker.sqlite3'))
+CIRCUIT_BREAKER_FAILURE_THRESHOLD = int(os.getenv('CIRCUIT_BREAKER_FAILURE_THRESHOLD', '5'))
+CIRCUIT_BREAKER_COOLDOWN = float(os.getenv('CIRCUIT_BREAKER_COOLDOWN', '30'))
+PROVIDER_CONCURRENCY_MAX = int(os.getenv('PROVIDER_CONCURRENCY_MAX', '16'))
+PROVIDER_CONCURRENCY_MIN = int(os.getenv('PROVIDER_CONCURRENCY_MIN', '1'))
+# Leases outlive the gunicorn timeout so a killed worker's slot is reclaimed
+PROVIDER_LEASE_TTL = float(os.getenv('PROVIDER_LEASE_TTL', '150'))
+
+# Prompt context budget in tokens (see api/tokens.py). Each section is capped on its
+# own, then the per-call total is shared by priority: profile, KB, web, recent posts.
+PROMPT_CONTEXT_BUDGET = int(os.getenv('PROMPT_CONTEXT_BUDGET', '2200'))
+PROMPT_BUDGET_PROFILE = int(os.getenv('PROMPT_BUDGET_PROFILE', '800'))
+PROMPT_BUDGET_KB = int(os.getenv('PROMPT_BUDGET_KB', '900'))
+PROMPT_BUDGET_WEB = int(os.getenv('PROMPT_BUDGET_WEB', '600'))
+PROMPT_BUDGET_RECENT = int(os.getenv('PROMPT_BUDGET_RECENT', '250'))
+
+# Provider backend (see api/provider_replay.py): 'live', 'record' (real calls saved to
+# PROVIDER_CASSETTE_DIR) or 'replay' (saved responses only, for load tests and CI)
+PROVIDER_BACKEND = os.getenv('PROVIDER_BACKEND', 'live')
+PROVIDER_CASSETTE_DIR = os.getenv('PROVIDER_CASSETTE_DIR', str(BASE_DIR / 'cassettes'))
+# Replay only. Latency in ms per provider ('*' for all), e.g. {"anthropic": {"p50": 1800, "p95": 4500}};
+# providers without an entry wait their recorded latency. Error rates e.g. {"openai": 0.05}.
+PROVIDER_FAKE_LATENCY = json.loads(os.getenv('PROVIDER_FAKE_LATENCY', '{}'))
+PROVIDER_FAKE_ERROR_RATE = json.loads(os.getenv('PROVIDER_FAKE_ERROR_RATE', '{}'))
+PROVIDER_FAKE_ERROR_STATUS = int(os.getenv('PROVIDER_FAKE_ERROR_STATUS', '503'))
+PROVIDER_FAKE_SEED = int(os.getenv('PROVIDER_FAKE_SEED', '0'))
+
+# Knowledge base vectors are stored packed (see api/vectors.py): float32, float16 or int8
+KB_EMBEDDING_DTYPE = os.getenv('KB_EMBEDDING_DTYPE', 'float32')
+# Embedding cache keyed by (model, text hash): per-worker LRU, then a table trimmed by last use
+EMBEDDING_CACHE_LRU_SIZE = int(os.getenv('EMBEDDING_CACHE_LRU_SIZE', '2048'))
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv('EMBEDDING_CACHE_MAX_ENTRIES', '100000'))
+# KB similarity backend: 'auto' (pgvector when migration 0027 created the column), 'pgvector' or 'numpy'
+KB_VECTOR_BACKEND = os.getenv('KB_VECTOR_BACKEND', 'auto')
+# HNSW candidate list for filtered pgvector searches (pgvector < 0.8 has no iterative scan; max 1000)
+KB_PGVECTOR_EF_SEARCH = int(os.getenv('KB_PGVECTOR_EF_SEARCH', '400'))
+# Per-user memory-mapped vector index (see api/kb_index.py); IVF above the chunk threshold
+KB_INDEX_DIR = os.getenv('KB_INDEX_DIR', str(BASE_DIR / 'kb_index'))
+KB_INDEX_IVF_MIN_CHUNKS = int(os.getenv('KB_INDEX_IVF_MIN_CHUNKS', '5000'))
+KB_INDEX_NPROBE = int(os.getenv('KB_INDEX_NPROBE', '16'))
+# Per-user BM25 index (see api/kb_lexical.py): from KB_LEXICAL_PREFILTER_MIN chunks only the
+# KB_LEXICAL_CANDIDATES best lexical matches are vector-scored; also used alone when embedding fails
+KB_LEXICAL_PREFILTER_MIN = int(os.getenv('KB_LEXICAL_PREFILTER_MIN', '2000'))
+KB_LEXICAL_CANDIDATES = int(os.getenv('KB_LEXICAL_CANDIDATES', '200'))
+KB_LEXICAL_CACHE_USERS = int(os.getenv('KB_LEXICAL_CACHE_USERS', '16'))
+# Background KB ingestion (per worker): documents processed at once, chunks per embedding request,
+# embedding requests in flight, retries per batch, and seconds without progress before a document fails
+KB_INGEST_WORKERS = int(os.getenv('KB_INGEST_WORKERS', '2'))
+KB_EMBED_BATCH_SIZE = int(os.getenv('KB_EMBED_BATCH_SIZE', '64'))
+KB_EMBED_CONCURRENCY = int(os.getenv('KB_EMBED_CONCURRENCY', '4'))
+KB_EMBED_RETRIES = int(os.getenv('KB_EMBED_RETRIES', '3'))
+KB_INGEST_TIMEOUT = int(os.getenv('KB_INGEST_TIMEOUT', '600'))
+# PDF/DOCX parsing runs in a per-worker process pool (see api/kb_extract.py)
+KB_EXTRACT_PROCESSES = int(os.getenv('KB_EXTRACT_PROCESSES', '2'))
+KB_EXTRACT_TIMEOUT = int(os.getenv('KB_EXTRACT_TIMEOUT', '120'))
+
+# Token/latency ledger (see api/ledger.py): records are written per worker in batches
+LEDGER_BATCH_SIZE = int(os.getenv('LEDGER_BATCH_SIZE', '50'))
+LEDGER_FLUSH_INTERVAL = float(os.getenv('LEDGER_FLUSH_INTERVAL', '10'))
+# USD per million tokens (input, output), used for cost per feature
+LLM_TOKEN_PRICES = {
+    'claude-sonnet-4-20250514': (3.0, 15.0),
+    'claude-haiku-4-5-20251001': (1.0, 5.0),
+    'gpt-4o': (2.5, 10.0),
+    'gemini-2.5-flash': (0.30, 2.50),
+    'gemini-2.5-flash-lite': (0.10, 0.40),
+    'gpt-4o-mini': (0.15, 0.60),
+    'text-embedding-3-small': (0.02, 0.0),
+    'mistralai/Mistral-Nemo-Instruct-2407': (0.0, 0.0),
+}
+
 # Stripe
 STRIPE_SECRET_KEY = os.getenv('STRIPE_SECRET_KEY', '')
 STRIPE_PUBLISHABLE_KEY = os.getenv('STRIPE_PUBLISHABLE_KEY', '')
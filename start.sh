@@ -1,6 +1,7 @@
 #!/bin/bash
 set -e
 python manage.py migrate --noinput
+python manage.py createcachetable
 python manage.py seed_templates
 python manage.py seed_demo_data
 python manage.py ensure_superuser